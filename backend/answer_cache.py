@@ -0,0 +1,173 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+REPLAY_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.lower()).strip(" ?!.,;:")
+
+
+def replay_tokens(answer: str) -> List[str]:
+    # Word-sized pieces for answers that were not streamed the first time.
+    return REPLAY_TOKEN_PATTERN.findall(answer)
+
+
+class CachedAnswer:
+    def __init__(
+        self,
+        scope: Tuple[Any, ...],
+        tokens: List[str],
+        payload: Dict[str, Any],
+        question_vector: Optional[np.ndarray],
+        created_at: float,
+    ):
+        self.scope = scope
+        self.tokens = tokens
+        self.payload = payload
+        self.question_vector = question_vector
+        self.created_at = created_at
+
+
+class AnswerCache:
+    # Full answers keyed by (model, courses and their generations, context
+    # chunk ids, normalized question). The generations are part of the key,
+    # so re-storing a course makes its old answers unreachable; they are
+    # also dropped eagerly the first time a newer generation is seen.
+    # With a similarity threshold, a question whose embedding has at least
+    # that cosine to an earlier question in the same scope (model, courses
+    # and generations) reuses its answer even if the context differs.
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        similarity_threshold: float = 0.0,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[Any, ...], CachedAnswer]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(model: str, generations: Dict[str, int]) -> Tuple[Any, ...]:
+        return (model, tuple(sorted(generations.items())))
+
+    @staticmethod
+    def key(scope: Tuple[Any, ...], context_ids: Iterable[Any], question: str) -> Tuple[Any, ...]:
+        return (scope, tuple(str(context_id) for context_id in context_ids), normalize_question(question))
+
+    def get(
+        self,
+        key: Tuple[Any, ...],
+        question_embedding: Optional[Sequence[float]] = None,
+    ) -> Optional[CachedAnswer]:
+        if self.max_entries <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._observe_generations(key[0])
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created_at <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+
+            entry = self._semantic_match(key[0], question_embedding, now)
+            if entry is not None:
+                self.semantic_hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        key: Tuple[Any, ...],
+        tokens: List[str],
+        payload: Dict[str, Any],
+        question_embedding: Optional[Sequence[float]] = None,
+    ) -> None:
+        if self.max_entries <= 0:
+            return
+        question_vector = None
+        if question_embedding is not None:
+            question_vector = np.asarray(question_embedding, dtype="float32")
+            question_vector = question_vector / max(float(np.linalg.norm(question_vector)), 1e-12)
+        with self._lock:
+            self._observe_generations(key[0])
+            self._entries[key] = CachedAnswer(key[0], list(tokens), dict(payload), question_vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
+
+    def _observe_generations(self, scope: Tuple[Any, ...]) -> None:
+        # Called with the lock held.
+        advanced = set()
+        for course_collection, generation in scope[1]:
+            if generation > self._generations.get(course_collection, -1):
+                if course_collection in self._generations:
+                    advanced.add(course_collection)
+                self._generations[course_collection] = generation
+        if not advanced:
+            return
+        for key in [
+            key
+            for key, entry in self._entries.items()
+            if any(
+                course_collection in advanced and generation < self._generations[course_collection]
+                for course_collection, generation in entry.scope[1]
+            )
+        ]:
+            del self._entries[key]
+
+    def _semantic_match(
+        self,
+        scope: Tuple[Any, ...],
+        question_embedding: Optional[Sequence[float]],
+        now: float,
+    ) -> Optional[CachedAnswer]:
+        # Called with the lock held.
+        if self.similarity_threshold <= 0 or question_embedding is None:
+            return None
+        candidates = [
+            (key, entry)
+            for key, entry in self._entries.items()
+            if entry.scope == scope
+            and entry.question_vector is not None
+            and now - entry.created_at <= self.ttl_seconds
+        ]
+        if not candidates:
+            return None
+
+        query = np.asarray(question_embedding, dtype="float32")
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        similarities = np.vstack([entry.question_vector for _, entry in candidates]) @ query
+        best = int(np.argmax(similarities))
+        if float(similarities[best]) < self.similarity_threshold:
+            return None
+        key, entry = candidates[best]
+        self._entries.move_to_end(key)
+        return entry
@@ -1,28 +1,77 @@
 import argparse
+import asyncio
+import functools
 import json
 import os
-import re
-from typing import List, Dict, Any, Generator
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import List, Dict, Any, Callable, Generator, Optional, Sequence, Union
 
 import numpy as np
 import requests
 from pymongo import MongoClient
 
-
-COURSE_PREFIX = "course_embeddings_"
-
-
-def normalize_course_name(value: str) -> str:
-    cleaned = re.sub(r"[^a-z0-9_-]", "_", value.lower())
-    cleaned = re.sub(r"_+", "_", cleaned).strip("_")
-    return cleaned or "rag_basic"
-
-
-def create_embedding(text_list: List[str]) -> List[List[float]]:
-    response = requests.post(
-        "http://localhost:11434/api/embed",
-        json={"model": "bge-m3", "input": text_list},
-        timeout=30,
+import search_engine
+from answer_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS, AnswerCache, replay_tokens
+from course_cache import (
+    CourseGenerations,
+    CourseMatrix,
+    CourseMatrixCache,
+    load_course_matrix,
+)
+from course_index import DEFAULT_INDEX_DIR, RERANK_PROJECTION, ROW_PROJECTION, CourseIndex, CourseIndexCache
+from course_registry import (
+    ALL_COURSES,
+    COURSE_PREFIX,
+    resolve_course_collections,
+    to_display_name,
+)
+from embedding_cache import DEFAULT_CACHE_PATH, EmbeddingCache
+from embedding_scheduler import OLLAMA_EMBED_URL
+from keyword_index import KeywordIndex, KeywordIndexCache, keyword_coverage, reciprocal_rank_fusion
+from tracing import METRICS, Trace, Tracer, serve_metrics
+from vector_codec import decode_vector
+from video_index import DEFAULT_MIN_CONFIDENCE, DEFAULT_TOP_VIDEOS, distance_confidence
+
+
+EMBEDDING_MODEL = "bge-m3"
+EMBEDDING_TIMEOUT = 30.0
+RETRIEVAL_MODES = ("vector", "hybrid", "keyword")
+HYBRID_CANDIDATES = 20
+OPENROUTER_CHAT_URL = os.getenv("OPENROUTER_CHAT_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Blocking steps of the query path (Mongo reads, index loads, the embedding
+# request, search) run here so the independent ones overlap. It is not the
+# event loop's default executor because asyncio.run waits for that one, and
+# an embedding request abandoned after --embedding-timeout must not hold up
+# the answer. Its threads are still joined at interpreter exit, so the
+# one-shot CLI bounds the embedding request itself by --embedding-timeout.
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="answer-io")
+HTTP_SESSIONS = threading.local()
+TRACER = Tracer()
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+def http_session() -> requests.Session:
+    # One keep-alive session per thread, so a worker reuses its connections
+    # to Ollama and OpenRouter instead of opening a new one per question.
+    session = getattr(HTTP_SESSIONS, "session", None)
+    if session is None:
+        session = HTTP_SESSIONS.session = requests.Session()
+    return session
+
+
+def request_embeddings(text_list: List[str], timeout: float = EMBEDDING_TIMEOUT) -> List[List[float]]:
+    response = http_session().post(
+        OLLAMA_EMBED_URL,
+        json={"model": EMBEDDING_MODEL, "input": text_list},
+        timeout=timeout,
     )
     response.raise_for_status()
     payload = response.json()
@@ -31,23 +80,181 @@ def create_embedding(text_list: List[str]) -> List[List[float]]:
     return payload["embeddings"]
 
 
-def search_similar_chunks(records: List[Dict[str, Any]], question_embedding: List[float], k: int = 6):
-    if not records:
-        return [], []
+def create_embedding(
+    text_list: List[str],
+    embedding_cache: Optional[EmbeddingCache] = None,
+    timeout: float = EMBEDDING_TIMEOUT,
+):
+    embed_fn = functools.partial(request_embeddings, timeout=timeout)
+    if embedding_cache is None:
+        return embed_fn(text_list)
+    return embedding_cache.embed(text_list, EMBEDDING_MODEL, embed_fn)
 
-    embedding_matrix = np.array([record.get("embedding", []) for record in records], dtype="float32")
+
+def search_embedding_matrix(
+    embedding_matrix: np.ndarray,
+    question_embedding: List[float],
+    k: int = 6,
+    matrix_norms: Optional[np.ndarray] = None,
+):
     if embedding_matrix.ndim != 2 or embedding_matrix.shape[1] == 0:
         return [], []
 
-    query_vector = np.array(question_embedding, dtype="float32")
-    distances = np.linalg.norm(embedding_matrix - query_vector, axis=1)
-    top_indices = np.argsort(distances)[:k]
-    top_records = [records[int(index)] for index in top_indices]
-    top_distances = [float(distances[int(index)]) for index in top_indices]
+    top_indices, top_distances = search_engine.search(embedding_matrix, question_embedding, k, matrix_norms)
+    return [int(index) for index in top_indices], [float(distance) for distance in top_distances]
+
+
+def search_similar_chunks(records: List[Dict[str, Any]], question_embedding: List[float], k: int = 6):
+    if not records:
+        return [], []
+
+    embedding_matrix = np.vstack([decode_vector(record.get("embedding")) for record in records])
+    top_indices, top_distances = search_embedding_matrix(embedding_matrix, question_embedding, k)
+    top_records = [records[index] for index in top_indices]
     return top_records, top_distances
 
 
-def build_prompt(question: str, context_rows: List[Dict[str, Any]], course_name: str) -> str:
+def search_course_matrix(
+    course_matrix: CourseMatrix,
+    question_embedding: List[float],
+    k: int = 6,
+    top_videos: int = 0,
+    min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+):
+    if top_videos > 0:
+        # Only the chunks of the videos whose centroids are closest to the
+        # question are scanned; a weak best hit falls through to the full scan.
+        candidate_rows = course_matrix.videos.candidate_rows(question_embedding, top_videos)
+        if candidate_rows is not None:
+            top_indices, top_distances = search_embedding_matrix(
+                course_matrix.matrix[candidate_rows], question_embedding, k, course_matrix.norms[candidate_rows]
+            )
+            if top_distances and distance_confidence(top_distances[0]) >= min_confidence:
+                return [course_matrix.record(int(candidate_rows[index])) for index in top_indices], top_distances
+
+    top_indices, top_distances = search_embedding_matrix(
+        course_matrix.matrix, question_embedding, k, course_matrix.norms
+    )
+    return [course_matrix.record(index) for index in top_indices], top_distances
+
+
+def load_course_shard(
+    db,
+    course_collection: str,
+    matrix_cache: Optional[CourseMatrixCache] = None,
+    index_cache: Optional[CourseIndexCache] = None,
+) -> Optional[Union[CourseIndex, CourseMatrix]]:
+    # A course is searched through its FAISS index when one matches the
+    # current generation, otherwise through its (cached) exact matrix.
+    if index_cache is not None:
+        course_index = index_cache.get(db, course_collection)
+        if course_index is not None:
+            return course_index
+    if matrix_cache is not None:
+        return matrix_cache.get(db, course_collection)
+    return load_course_matrix(db, course_collection)
+
+
+def search_courses(
+    db,
+    shards: Dict[str, Union[CourseIndex, CourseMatrix]],
+    question_embedding: List[float],
+    k: int = 6,
+    top_videos: int = 0,
+    min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+):
+    # Every course is its own shard; each returns its top k and the lists
+    # are merged by distance. Hits are exact L2 distances in every shard
+    # (quantized indexes re-rank), so they compare across courses. Records
+    # are tagged with the slug of the course they came from.
+    merged = []
+    for course_collection, shard in shards.items():
+        if isinstance(shard, CourseIndex):
+            records, distances = shard.search_records(
+                db[course_collection], question_embedding, k, top_videos, min_confidence
+            )
+        else:
+            records, distances = search_course_matrix(shard, question_embedding, k, top_videos, min_confidence)
+        slug = course_collection[len(COURSE_PREFIX):]
+        merged.extend((distance, {**record, "course": slug}) for record, distance in zip(records, distances))
+
+    merged.sort(key=lambda item: item[0])
+    return [record for _, record in merged[:k]], [distance for distance, _ in merged[:k]]
+
+
+def search_keywords(keyword_indexes: Dict[str, KeywordIndex], question: str, k: int = HYBRID_CANDIDATES):
+    # BM25 scores depend on each course's corpus statistics, so every course
+    # is ranked on its own and the lists are fused by rank, as (course slug,
+    # _id) keys.
+    rankings = []
+    for course_collection, keyword_index in keyword_indexes.items():
+        slug = course_collection[len(COURSE_PREFIX):]
+        object_ids, _ = keyword_index.search(question, k)
+        rankings.append([(slug, object_id) for object_id in object_ids])
+    return [key for key, _ in reciprocal_rank_fusion(rankings)[:k]]
+
+
+def fetch_records(db, keys, question_embedding: Optional[List[float]] = None):
+    # Loads keyword-only hits from Mongo. With a question embedding their
+    # exact distance is computed too, so fused results stay comparable.
+    by_course: Dict[str, List[Any]] = {}
+    for slug, object_id in keys:
+        by_course.setdefault(slug, []).append(object_id)
+
+    query = None if question_embedding is None else np.asarray(question_embedding, dtype="float32")
+    projection = ROW_PROJECTION if query is None else RERANK_PROJECTION
+    records = {}
+    distances = {}
+    for slug, object_ids in by_course.items():
+        for document in db[f"{COURSE_PREFIX}{slug}"].find({"_id": {"$in": object_ids}}, projection):
+            key = (slug, document["_id"])
+            vector = decode_vector(document.pop("embedding", None))
+            if query is not None and vector is not None:
+                distances[key] = float(np.linalg.norm(vector - query))
+            records[key] = {**document, "course": slug}
+    return records, distances
+
+
+def hybrid_search(
+    db,
+    shards: Dict[str, Union[CourseIndex, CourseMatrix]],
+    keyword_indexes: Dict[str, KeywordIndex],
+    question: str,
+    question_embedding: Optional[List[float]],
+    k: int = 6,
+    top_videos: int = 0,
+    min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+):
+    # Vector and BM25 candidate lists are fused with reciprocal rank fusion.
+    # Without a question embedding only the keyword list is ranked and the
+    # returned distances are None.
+    rankings = []
+    records: Dict[Any, Dict[str, Any]] = {}
+    distances: Dict[Any, float] = {}
+    if question_embedding is not None and shards:
+        vector_records, vector_distances = search_courses(
+            db, shards, question_embedding, HYBRID_CANDIDATES, top_videos, min_confidence
+        )
+        ranking = []
+        for record, distance in zip(vector_records, vector_distances):
+            key = (record["course"], record["_id"])
+            records[key] = record
+            distances[key] = distance
+            ranking.append(key)
+        rankings.append(ranking)
+    rankings.append(search_keywords(keyword_indexes, question))
+
+    fused = [key for key, _ in reciprocal_rank_fusion(rankings)[:k]]
+    fetched, fetched_distances = fetch_records(
+        db, [key for key in fused if key not in records], question_embedding
+    )
+    records.update(fetched)
+    distances.update(fetched_distances)
+    top_keys = [key for key in fused if key in records]
+    return [records[key] for key in top_keys], [distances.get(key) for key in top_keys]
+
+
+def build_prompt(question: str, context_rows: List[Dict[str, Any]], course_name: str, multi_course: bool = False) -> str:
     compact_rows = []
     for row in context_rows:
         compact_rows.append(
@@ -59,6 +266,8 @@ def build_prompt(question: str, context_rows: List[Dict[str, Any]], course_name:
                 "text": row.get("text", ""),
             }
         )
+        if multi_course:
+            compact_rows[-1]["course"] = row.get("course", "")
 
     return f"""
 I am teaching web development in {course_name}. Here are subtitle chunks containing video title, video number, start time in seconds, end time in seconds, and text:
@@ -79,8 +288,8 @@ Avoid markdown tables and avoid special characters like *.
 
 
 def stream_answer(prompt: str, openrouter_api_key: str, model: str) -> Generator[str, None, None]:
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
+    response = http_session().post(
+        OPENROUTER_CHAT_URL,
         headers={
             "Authorization": f"Bearer {openrouter_api_key}",
             "Content-Type": "application/json",
@@ -99,26 +308,28 @@ def stream_answer(prompt: str, openrouter_api_key: str, model: str) -> Generator
         timeout=120,
         stream=True,
     )
-    response.raise_for_status()
-
-    for raw_line in response.iter_lines(decode_unicode=True):
-        if not raw_line:
-            continue
-        if not raw_line.startswith("data:"):
-            continue
-
-        payload_line = raw_line[5:].strip()
-        if payload_line == "[DONE]":
-            break
-
-        data = json.loads(payload_line)
-        choices = data.get("choices", [])
-        if not choices:
-            continue
-        delta = choices[0].get("delta", {})
-        token = delta.get("content", "")
-        if token:
-            yield token
+    # Closed explicitly so the connection is released even when the stream
+    # ends at [DONE] before the body is exhausted.
+    with response:
+        response.raise_for_status()
+        for raw_line in response.iter_lines(decode_unicode=True):
+            if not raw_line:
+                continue
+            if not raw_line.startswith("data:"):
+                continue
+
+            payload_line = raw_line[5:].strip()
+            if payload_line == "[DONE]":
+                break
+
+            data = json.loads(payload_line)
+            choices = data.get("choices", [])
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {})
+            token = delta.get("content", "")
+            if token:
+                yield token
 
 
 def infer_answer(prompt: str, openrouter_api_key: str, model: str) -> str:
@@ -135,109 +346,568 @@ def emit(event: Dict[str, Any]):
     print(json.dumps(event, ensure_ascii=False), flush=True)
 
 
+def load_course_sources(
+    db,
+    course_collections: List[str],
+    retrieval: str,
+    matrix_cache: Optional[CourseMatrixCache] = None,
+    index_cache: Optional[CourseIndexCache] = None,
+    keyword_cache: Optional[KeywordIndexCache] = None,
+):
+    shards = {}
+    if retrieval != "keyword":
+        for course_collection in course_collections:
+            shard = load_course_shard(db, course_collection, matrix_cache, index_cache)
+            if shard is not None:
+                shards[course_collection] = shard
+    keyword_indexes = {}
+    if retrieval != "vector" and keyword_cache is not None:
+        for course_collection in course_collections:
+            keyword_index = keyword_cache.get(db, course_collection)
+            if keyword_index is not None:
+                keyword_indexes[course_collection] = keyword_index
+    if retrieval == "keyword" and not keyword_indexes:
+        # No keyword index yet for these courses; answer from vectors.
+        for course_collection in course_collections:
+            shard = load_course_shard(db, course_collection, matrix_cache, index_cache)
+            if shard is not None:
+                shards[course_collection] = shard
+    return shards, keyword_indexes
+
+
+def discard_result(task: "asyncio.Future"):
+    # Keeps asyncio from logging the error of a request nobody waits for.
+    task.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+
+def answer_question(*args, **kwargs):
+    # Blocking entry point for the CLI and the --serve worker threads; each
+    # call runs answer_question_async on its own event loop.
+    asyncio.run(answer_question_async(*args, **kwargs))
+
+
+async def answer_question_async(
+    db,
+    course: Union[str, Sequence[str]],
+    question: str,
+    stream: bool,
+    openrouter_api_key: str,
+    model: str,
+    emit_event: Callable[[Dict[str, Any]], None] = emit,
+    matrix_cache: Optional[CourseMatrixCache] = None,
+    index_cache: Optional[CourseIndexCache] = None,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    top_videos: int = 0,
+    min_video_confidence: float = DEFAULT_MIN_CONFIDENCE,
+    keyword_cache: Optional[KeywordIndexCache] = None,
+    retrieval: str = "hybrid",
+    embedding_timeout: float = EMBEDDING_TIMEOUT,
+    answer_cache: Optional[AnswerCache] = None,
+    tracer: Optional[Tracer] = None,
+    embedding_request_timeout: float = EMBEDDING_TIMEOUT,
+):
+    # The question embedding does not depend on anything read from Mongo or
+    # the index directory, so it is requested while the course shards and
+    # keyword indexes load. Every stage is a span of the request's trace;
+    # their durations in milliseconds are reported in the "timings" field of
+    # the final event.
+    tracer = tracer or TRACER
+    trace = tracer.start("answer", retrieval=retrieval, stream=stream)
+    status = "error"
+    try:
+        status = await run_answer_stages(
+            trace,
+            db,
+            course,
+            question,
+            stream,
+            openrouter_api_key,
+            model,
+            emit_event=emit_event,
+            matrix_cache=matrix_cache,
+            index_cache=index_cache,
+            embedding_cache=embedding_cache,
+            top_videos=top_videos,
+            min_video_confidence=min_video_confidence,
+            keyword_cache=keyword_cache,
+            retrieval=retrieval,
+            embedding_timeout=embedding_timeout,
+            answer_cache=answer_cache,
+            embedding_request_timeout=embedding_request_timeout,
+        )
+    except RequestCancelled:
+        status = "cancelled"
+        raise
+    finally:
+        tracer.finish(trace, status)
+
+
+async def run_answer_stages(
+    trace: Trace,
+    db,
+    course: Union[str, Sequence[str]],
+    question: str,
+    stream: bool,
+    openrouter_api_key: str,
+    model: str,
+    emit_event: Callable[[Dict[str, Any]], None],
+    matrix_cache: Optional[CourseMatrixCache],
+    index_cache: Optional[CourseIndexCache],
+    embedding_cache: Optional[EmbeddingCache],
+    top_videos: int,
+    min_video_confidence: float,
+    keyword_cache: Optional[KeywordIndexCache],
+    retrieval: str,
+    embedding_timeout: float,
+    answer_cache: Optional[AnswerCache],
+    embedding_request_timeout: float,
+) -> str:
+    # Returns the trace status: ok, not_found or error.
+    loop = asyncio.get_running_loop()
+
+    def run_io(fn: Callable[..., Any], *args):
+        return loop.run_in_executor(IO_EXECUTOR, functools.partial(fn, *args))
+
+    def error(error_message: str, status: str = "not_found") -> str:
+        if stream:
+            emit_event({"type": "error", "error": error_message})
+        else:
+            emit_event({"error": error_message})
+        return status
+
+    def start_embedding():
+        return time.perf_counter(), asyncio.ensure_future(run_io(create_embedding, [question], embedding_cache, embedding_request_timeout))
+
+    embedding_task = None
+    if retrieval != "keyword":
+        embed_started, embedding_task = start_embedding()
+
+    def load_sources():
+        courses = [course] if isinstance(course, str) else list(course)
+        course_collections = resolve_course_collections(db, courses)
+        return courses, *load_course_sources(
+            db, course_collections, retrieval, matrix_cache, index_cache, keyword_cache
+        )
+
+    with trace.span("load"):
+        courses, shards, keyword_indexes = await run_io(load_sources)
+    trace.attributes["courses"] = len(courses)
+
+    if not shards and not keyword_indexes:
+        if embedding_task is not None:
+            discard_result(embedding_task)
+        return error("No embeddings found for selected course.")
+
+    question_embedding = None
+    if shards:
+        if embedding_task is None:
+            # Keyword retrieval that fell back to vectors.
+            embed_started, embedding_task = start_embedding()
+        try:
+            if keyword_indexes:
+                # A slow or unavailable embedding service still leaves the
+                # keyword index to answer from. The request keeps running and
+                # fills the embedding cache for the next time this is asked.
+                embeddings = await asyncio.wait_for(asyncio.shield(embedding_task), embedding_timeout)
+            else:
+                embeddings = await embedding_task
+            question_embedding = embeddings[0]
+            trace.add("embed", embed_started)
+        except (asyncio.TimeoutError, requests.RequestException) as exc:
+            trace.add("embed", embed_started, error=exc.__class__.__name__)
+            if not keyword_indexes:
+                raise
+            discard_result(embedding_task)
+            METRICS.increment("answer_embedding_fallbacks_total", reason=exc.__class__.__name__)
+    elif embedding_task is not None:
+        discard_result(embedding_task)
+
+    with trace.span("search"):
+        if keyword_indexes:
+            top_rows, distances = await run_io(
+                functools.partial(
+                    hybrid_search,
+                    db,
+                    shards,
+                    keyword_indexes,
+                    question,
+                    question_embedding,
+                    top_videos=top_videos,
+                    min_confidence=min_video_confidence,
+                )
+            )
+            retrieval_used = "hybrid" if question_embedding is not None and shards else "keyword"
+        else:
+            top_rows, distances = await run_io(
+                functools.partial(
+                    search_courses,
+                    db,
+                    shards,
+                    question_embedding,
+                    top_videos=top_videos,
+                    min_confidence=min_video_confidence,
+                )
+            )
+            retrieval_used = "vector"
+    trace.attributes["retrieval_used"] = retrieval_used
+
+    if not top_rows:
+        return error("Unable to search in the selected course embeddings.")
+
+    searched = list(dict.fromkeys([*shards, *keyword_indexes]))
+    multi_course = len(searched) > 1
+    if multi_course:
+        course_name = ", ".join(to_display_name(course_collection[len(COURSE_PREFIX):]) for course_collection in searched)
+    else:
+        course_name = courses[0] if courses[0] != ALL_COURSES else to_display_name(top_rows[0]["course"])
+    prompt = build_prompt(question, top_rows, course_name, multi_course)
+
+    primary = top_rows[0]
+    if distances and distances[0] is not None:
+        confidence = distance_confidence(distances[0])
+    else:
+        # Keyword-only answers report the share of question terms found in
+        # the best chunk instead of a vector distance.
+        confidence = keyword_coverage(question, primary.get("text", ""))
+
+    payload = {
+        "course": primary.get("course", ""),
+        "video": primary.get("title", ""),
+        "timestamp": {
+            "start": primary.get("start", 0),
+            "end": primary.get("end", 0),
+        },
+        "summary": primary.get("text", ""),
+        "confidence": confidence,
+        "retrieval": retrieval_used,
+    }
+
+    cache_key = None
+    if answer_cache is not None:
+        generations = {course_collection: shard.generation for course_collection, shard in shards.items()}
+        generations.update(
+            (course_collection, keyword_index.generation) for course_collection, keyword_index in keyword_indexes.items()
+        )
+        cache_key = AnswerCache.key(
+            AnswerCache.scope(model, generations),
+            [(row.get("course", ""), row.get("_id", "")) for row in top_rows],
+            question,
+        )
+        cached = answer_cache.get(cache_key, question_embedding)
+        METRICS.increment("answer_cache_lookups_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            trace.attributes["cached"] = True
+            # Replayed through the same events as a fresh answer.
+            if stream:
+                for token in cached.tokens:
+                    emit_event({"type": "token", "content": token})
+                emit_event({"type": "final", **cached.payload, "timings": trace.timings()})
+                return "ok"
+            emit_event({**cached.payload, "timings": trace.timings()})
+            return "ok"
+
+    # The completion request goes out as soon as the context rows are known;
+    # tokens are relayed from this thread as they arrive.
+    if stream:
+        final_answer_parts = []
+        # emit_event raises RequestCancelled once the caller has gone away;
+        # closing the generator then closes the OpenRouter response.
+        with trace.span("generate"), closing(stream_answer(prompt, openrouter_api_key, model)) as tokens:
+            generate_started = time.perf_counter()
+            for token in tokens:
+                if not final_answer_parts:
+                    trace.add("first_token", generate_started)
+                final_answer_parts.append(token)
+                emit_event({"type": "token", "content": token})
+
+        final_answer = "".join(final_answer_parts).strip()
+        if not final_answer:
+            return error("OpenRouter did not return any answer", status="error")
+
+        payload = {"answer": final_answer, **payload}
+        if cache_key is not None:
+            answer_cache.put(cache_key, final_answer_parts, payload, question_embedding)
+        emit_event({"type": "final", **payload, "timings": trace.timings()})
+        return "ok"
+
+    with trace.span("generate"):
+        answer = infer_answer(prompt, openrouter_api_key, model)
+    payload = {"answer": answer, **payload}
+    if cache_key is not None and answer:
+        answer_cache.put(cache_key, replay_tokens(answer), payload, question_embedding)
+    emit_event({**payload, "timings": trace.timings()})
+    return "ok"
+
+
+def serve(
+    db,
+    openrouter_api_key: str,
+    model: str,
+    workers: int,
+    matrix_cache: CourseMatrixCache,
+    index_cache: CourseIndexCache,
+    embedding_cache: EmbeddingCache,
+    top_videos: int = 0,
+    min_video_confidence: float = DEFAULT_MIN_CONFIDENCE,
+    keyword_cache: Optional[KeywordIndexCache] = None,
+    retrieval: str = "hybrid",
+    embedding_timeout: float = EMBEDDING_TIMEOUT,
+    answer_cache: Optional[AnswerCache] = None,
+    tracer: Optional[Tracer] = None,
+):
+    # Line-delimited JSON over stdin/stdout. Each request is
+    # {"id": ..., "course": ..., "question": ..., "stream": bool} and every
+    # event written back carries the request id. "courses": [...] searches
+    # several courses at once ("*" means every registered course) and
+    # "retrieval" overrides the worker's vector/hybrid/keyword mode. A {"type": "done"} event
+    # closes each request so callers know when to stop reading. A request of
+    # {"id": ..., "op": "stats"} reports the embedding and answer cache
+    # counters, and {"id": ..., "op": "metrics"} the stage metrics in the
+    # Prometheus text format. {"id": ..., "op": "cancel"} stops the request
+    # with that id at its next event, closing any OpenRouter stream it has
+    # open; the request still ends with a done event, and the cancel op
+    # writes nothing of its own.
+    output_lock = threading.Lock()
+    cancel_lock = threading.Lock()
+    pending: Dict[Any, threading.Event] = {}
+
+    def write_event(event: Dict[str, Any]):
+        with output_lock:
+            emit(event)
+
+    def handle(request: Dict[str, Any], cancelled: threading.Event):
+        request_id = request.get("id")
+
+        def emit_event(event: Dict[str, Any]):
+            if cancelled.is_set():
+                raise RequestCancelled("Request cancelled.")
+            write_event({"id": request_id, **event})
+
+        def done(ok: bool, error: str = ""):
+            # Written even for a cancelled request so the caller can stop reading.
+            write_event({"id": request_id, "type": "done", "ok": ok, **({"error": error} if error else {})})
+
+        try:
+            if request.get("op") == "stats":
+                emit_event(
+                    {
+                        "type": "stats",
+                        "embedding_cache": embedding_cache.stats(),
+                        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+                    }
+                )
+                done(True)
+                return
+            if request.get("op") == "metrics":
+                emit_event({"type": "metrics", "text": METRICS.render()})
+                done(True)
+                return
+
+            try:
+                if cancelled.is_set():
+                    raise RequestCancelled("Request cancelled.")
+                courses = request.get("courses") or [request.get("course")]
+                courses = [str(course or "").strip() for course in courses]
+                courses = [course for course in courses if course]
+                question = str(request.get("question") or "").strip()
+                if not courses or not question:
+                    raise ValueError("Question and course are required.")
+                answer_question(
+                    db,
+                    courses,
+                    question,
+                    bool(request.get("stream")),
+                    openrouter_api_key,
+                    model,
+                    emit_event=emit_event,
+                    matrix_cache=matrix_cache,
+                    index_cache=index_cache,
+                    embedding_cache=embedding_cache,
+                    top_videos=top_videos,
+                    min_video_confidence=min_video_confidence,
+                    keyword_cache=keyword_cache,
+                    retrieval=request.get("retrieval") if request.get("retrieval") in RETRIEVAL_MODES else retrieval,
+                    embedding_timeout=embedding_timeout,
+                    answer_cache=answer_cache,
+                    tracer=tracer,
+                )
+            except RequestCancelled as exc:
+                done(False, str(exc))
+                return
+            except Exception as exc:
+                if request.get("stream"):
+                    write_event({"id": request_id, "type": "error", "error": str(exc)})
+                done(False, str(exc))
+                return
+            done(True)
+        finally:
+            with cancel_lock:
+                if pending.get(request_id) is cancelled:
+                    del pending[request_id]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        write_event({"type": "ready"})
+        for raw_line in sys.stdin:
+            raw_line = raw_line.strip()
+            if not raw_line:
+                continue
+            try:
+                request = json.loads(raw_line)
+            except json.JSONDecodeError as exc:
+                write_event({"type": "done", "ok": False, "error": f"Invalid request: {exc}"})
+                continue
+            if request.get("op") == "cancel":
+                with cancel_lock:
+                    cancelled = pending.get(request.get("id"))
+                if cancelled is not None:
+                    cancelled.set()
+                continue
+            cancelled = threading.Event()
+            with cancel_lock:
+                pending[request.get("id")] = cancelled
+            executor.submit(handle, request, cancelled)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Answer a student question using course embeddings.")
     parser.add_argument("--mongo-uri", required=True)
     parser.add_argument("--mongo-db", default="rag_basic")
-    parser.add_argument("--course", required=True)
-    parser.add_argument("--question", required=True)
+    parser.add_argument(
+        "--course",
+        action="append",
+        help=f"Course name or slug; repeat to search several, or {ALL_COURSES} for every registered course.",
+    )
+    parser.add_argument("--question")
     parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--serve", action="store_true", help="Answer line-delimited JSON requests from stdin.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent requests handled in --serve mode.")
+    parser.add_argument("--cache-max-mb", type=int, default=512, help="Memory budget for cached course matrices.")
+    parser.add_argument(
+        "--cache-check-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between course generation checks for cached matrices.",
+    )
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR, help="Directory with per-course FAISS indexes.")
+    parser.add_argument(
+        "--embedding-cache",
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite file for cached question embeddings (empty for memory only).",
+    )
+    parser.add_argument(
+        "--top-videos",
+        type=int,
+        default=0,
+        help=f"Search only the chunks of the M videos closest to the question (0 scans every chunk; try {DEFAULT_TOP_VIDEOS}).",
+    )
+    parser.add_argument(
+        "--min-video-confidence",
+        type=float,
+        default=DEFAULT_MIN_CONFIDENCE,
+        help="Fall back to a full scan when the best chunk from the top videos scores below this.",
+    )
+    parser.add_argument(
+        "--retrieval",
+        choices=RETRIEVAL_MODES,
+        default="hybrid",
+        help="hybrid fuses vector and BM25 keyword hits; keyword skips the embedding service.",
+    )
+    parser.add_argument(
+        "--embedding-timeout",
+        type=float,
+        default=5.0,
+        help="Seconds to wait for the question embedding before answering from keywords alone.",
+    )
+    parser.add_argument(
+        "--answer-cache-size",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help="Answers kept in memory in --serve mode (0 disables the answer cache).",
+    )
+    parser.add_argument("--answer-cache-ttl", type=float, default=DEFAULT_TTL_SECONDS, help="Seconds a cached answer is reused.")
+    parser.add_argument(
+        "--answer-cache-similarity",
+        type=float,
+        default=0.0,
+        help="Reuse an answer for a question whose embedding has at least this cosine to a cached one (0 disables; try 0.95).",
+    )
+    parser.add_argument("--trace-file", default="", help="Append one JSON line of stage spans per question here.")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="In --serve mode, expose Prometheus metrics on http://127.0.0.1:PORT/metrics (0 disables).",
+    )
     args = parser.parse_args()
 
+    if not args.serve and (not args.course or not args.question):
+        parser.error("--course and --question are required unless --serve is used")
+
     openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
     if not openrouter_api_key:
         raise RuntimeError("OPENROUTER_API_KEY not found")
 
     model = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini")
-    course_collection = f"{COURSE_PREFIX}{normalize_course_name(args.course)}"
 
     client = MongoClient(args.mongo_uri)
-    db = client[args.mongo_db]
-    collection = db[course_collection]
-    records = list(
-        collection.find(
-            {},
-            {
-                "_id": 0,
-                "title": 1,
-                "Number": 1,
-                "start": 1,
-                "end": 1,
-                "text": 1,
-                "embedding": 1,
-            },
-        )
-    )
-    client.close()
-
-    if not records:
-        error_payload = {"error": "No embeddings found for selected course."}
-        if args.stream:
-            emit({"type": "error", "error": error_payload["error"]})
+    try:
+        db = client[args.mongo_db]
+        generations = CourseGenerations(check_interval=args.cache_check_interval)
+        index_cache = CourseIndexCache(index_dir=args.index_dir, generations=generations)
+        keyword_cache = KeywordIndexCache(index_dir=args.index_dir, generations=generations)
+        embedding_cache = EmbeddingCache(args.embedding_cache)
+        tracer = Tracer(args.trace_file)
+        if args.serve:
+            if args.metrics_port:
+                serve_metrics(args.metrics_port)
+            matrix_cache = CourseMatrixCache(
+                max_bytes=args.cache_max_mb * 1024 * 1024,
+                generations=generations,
+            )
+            serve(
+                db,
+                openrouter_api_key,
+                model,
+                args.workers,
+                matrix_cache,
+                index_cache,
+                embedding_cache,
+                top_videos=args.top_videos,
+                min_video_confidence=args.min_video_confidence,
+                keyword_cache=keyword_cache,
+                retrieval=args.retrieval,
+                embedding_timeout=args.embedding_timeout,
+                answer_cache=AnswerCache(
+                    max_entries=args.answer_cache_size,
+                    ttl_seconds=args.answer_cache_ttl,
+                    similarity_threshold=args.answer_cache_similarity,
+                ),
+                tracer=tracer,
+            )
             return
-        print(json.dumps(error_payload))
-        return
-
-    question_embedding = create_embedding([args.question])[0]
-    top_rows, distances = search_similar_chunks(records, question_embedding)
-
-    if not top_rows:
-        error_payload = {"error": "Unable to search in the selected course embeddings."}
-        if args.stream:
-            emit({"type": "error", "error": error_payload["error"]})
-            return
-        print(json.dumps(error_payload))
-        return
-
-    prompt = build_prompt(args.question, top_rows, args.course)
-
-    primary = top_rows[0]
-    best_distance = distances[0] if distances else 0.0
-    confidence = float(1 / (1 + best_distance))
-
-    if args.stream:
-        final_answer_parts = []
-        for token in stream_answer(prompt, openrouter_api_key, model):
-            final_answer_parts.append(token)
-            emit({"type": "token", "content": token})
-
-        final_answer = "".join(final_answer_parts).strip()
-        if not final_answer:
-            emit({"type": "error", "error": "OpenRouter did not return any answer"})
-            return
-
-        emit(
-            {
-                "type": "final",
-                "answer": final_answer,
-                "video": primary.get("title", ""),
-                "timestamp": {
-                    "start": primary.get("start", 0),
-                    "end": primary.get("end", 0),
-                },
-                "summary": primary.get("text", ""),
-                "confidence": confidence,
-            }
+        answer_question(
+            db,
+            args.course,
+            args.question,
+            args.stream,
+            openrouter_api_key,
+            model,
+            index_cache=index_cache,
+            embedding_cache=embedding_cache,
+            top_videos=args.top_videos,
+            min_video_confidence=args.min_video_confidence,
+            keyword_cache=keyword_cache,
+            retrieval=args.retrieval,
+            embedding_timeout=args.embedding_timeout,
+            tracer=tracer,
+            # Nothing is left to fill the embedding cache for once the
+            # answer is printed, so the request gives up with the answer.
+            embedding_request_timeout=args.embedding_timeout,
         )
-        return
-
-    answer = infer_answer(prompt, openrouter_api_key, model)
-
-    print(
-        json.dumps(
-            {
-                "answer": answer,
-                "video": primary.get("title", ""),
-                "timestamp": {
-                    "start": primary.get("start", 0),
-                    "end": primary.get("end", 0),
-                },
-                "summary": primary.get("text", ""),
-                "confidence": confidence,
-            }
-        )
-    )
+    finally:
+        embedding_cache.close()
+        client.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
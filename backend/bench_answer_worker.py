@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "answer_question.py")
+
+
+def percentile_report(latencies):
+    values = np.array(latencies, dtype="float64") * 1000.0
+    return {
+        "requests": int(values.size),
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+        "mean_ms": round(float(values.mean()), 1),
+    }
+
+
+def bench_spawn(args):
+    latencies = []
+    for _ in range(args.requests):
+        command = [
+            sys.executable,
+            SCRIPT_PATH,
+            "--mongo-uri",
+            args.mongo_uri,
+            "--mongo-db",
+            args.mongo_db,
+            "--course",
+            args.course,
+            "--question",
+            args.question,
+        ]
+        if args.stream:
+            command.append("--stream")
+        started = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        latencies.append(time.perf_counter() - started)
+    return percentile_report(latencies)
+
+
+def bench_worker(args):
+    worker = subprocess.Popen(
+        [
+            sys.executable,
+            SCRIPT_PATH,
+            "--serve",
+            "--mongo-uri",
+            args.mongo_uri,
+            "--mongo-db",
+            args.mongo_db,
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+    )
+    try:
+        ready = json.loads(worker.stdout.readline())
+        if ready.get("type") != "ready":
+            raise RuntimeError(f"Unexpected worker greeting: {ready}")
+
+        latencies = []
+        for request_id in range(args.requests):
+            request = {
+                "id": request_id,
+                "course": args.course,
+                "question": args.question,
+                "stream": args.stream,
+            }
+            started = time.perf_counter()
+            worker.stdin.write(json.dumps(request) + "\n")
+            worker.stdin.flush()
+            while True:
+                line = worker.stdout.readline()
+                if not line:
+                    raise RuntimeError("Answer worker exited during benchmark")
+                event = json.loads(line)
+                if event.get("id") == request_id and event.get("type") == "done":
+                    break
+            latencies.append(time.perf_counter() - started)
+        return percentile_report(latencies)
+    finally:
+        worker.stdin.close()
+        worker.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare per-request process spawning with the long-lived answer_question worker."
+    )
+    parser.add_argument("--mongo-uri", required=True)
+    parser.add_argument("--mongo-db", default="rag_basic")
+    parser.add_argument("--course", required=True)
+    parser.add_argument("--question", default="How do I add an event listener to a button?")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    report = {
+        "spawn": bench_spawn(args),
+        "worker": bench_worker(args),
+    }
+    print(json.dumps(report, indent=2))
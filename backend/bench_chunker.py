@@ -0,0 +1,140 @@
+import argparse
+import json
+import random
+
+import numpy as np
+
+from chunker import (
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_MIN_TOKENS,
+    DEFAULT_OVERLAP_TOKENS,
+    DEFAULT_SILENCE_GAP,
+    count_tokens,
+    merge_segment_stream,
+    semantic_chunks,
+    with_segment_embeddings,
+)
+from embedding_cache import DEFAULT_CACHE_PATH, EmbeddingCache
+from embedding_scheduler import EmbeddingScheduler
+from preProcessJson import EMBEDDING_MODEL
+from search_engine import search_batch
+from transcript_io import iter_records, list_transcripts
+
+
+def load_lectures(json_dir):
+    return {stem: list(iter_records(path)) for stem, path in list_transcripts(json_dir).items()}
+
+
+def sample_queries(lectures, count, seed=0):
+    # A held-out segment is the query; a hit is a top-k chunk from the same
+    # lecture whose time span covers the segment's midpoint.
+    rng = random.Random(seed)
+    candidates = [
+        (source, segment)
+        for source, segments in lectures.items()
+        for segment in segments
+        if count_tokens(segment["text"]) >= 8
+    ]
+    return rng.sample(candidates, min(count, len(candidates)))
+
+
+def bench_scheme(name, chunk_fn, lectures, queries, query_vectors, embed, k):
+    chunks = []
+    for source, segments in lectures.items():
+        for chunk in chunk_fn(segments):
+            chunks.append({**chunk, "source": source})
+
+    token_counts = np.array([count_tokens(chunk["text"]) for chunk in chunks], dtype="float64")
+    matrix = np.vstack(embed([chunk["text"] for chunk in chunks])).astype("float32")
+    top_indices, _ = search_batch(matrix, query_vectors, k)
+
+    hits_at_1 = 0
+    hits_at_k = 0
+    for (source, segment), rows in zip(queries, top_indices):
+        midpoint = (segment["start"] + segment["end"]) / 2
+        matches = [
+            chunks[row]["source"] == source and chunks[row]["start"] <= midpoint <= chunks[row]["end"]
+            for row in rows
+        ]
+        hits_at_1 += bool(matches and matches[0])
+        hits_at_k += any(matches)
+
+    return {
+        "scheme": name,
+        "chunks": len(chunks),
+        "tokens_mean": round(float(token_counts.mean()), 1),
+        "tokens_p95": round(float(np.percentile(token_counts, 95)), 1),
+        "tokens_max": int(token_counts.max()),
+        "index_mb": round(matrix.nbytes / (1024 * 1024), 2),
+        "hit@1": round(hits_at_1 / len(queries), 4),
+        f"hit@{k}": round(hits_at_k / len(queries), 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare fixed merge_size grouping with the semantic chunker on transcript JSON files."
+    )
+    parser.add_argument("--json-dir", default="jsons", help="Directory with per-segment transcript JSON.")
+    parser.add_argument("--merge-size", type=int, default=5)
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_MAX_TOKENS)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_OVERLAP_TOKENS)
+    parser.add_argument("--chunk-min-tokens", type=int, default=DEFAULT_MIN_TOKENS)
+    parser.add_argument("--silence-gap", type=float, default=DEFAULT_SILENCE_GAP)
+    parser.add_argument(
+        "--split-similarity",
+        type=float,
+        default=None,
+        help="Also report the semantic chunker splitting on similarity drops below this.",
+    )
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("-k", type=int, default=6)
+    parser.add_argument("--embedding-cache", default=DEFAULT_CACHE_PATH)
+    args = parser.parse_args()
+
+    lectures = load_lectures(args.json_dir)
+    if not lectures:
+        raise SystemExit(f"No transcript JSON found in {args.json_dir}")
+
+    scheduler = EmbeddingScheduler(model=EMBEDDING_MODEL)
+    embedding_cache = EmbeddingCache(args.embedding_cache or "")
+    embed = lambda texts: embedding_cache.embed(texts, EMBEDDING_MODEL, scheduler.embed)
+
+    def semantic(similarity_threshold):
+        def chunk(segments):
+            if similarity_threshold is not None:
+                segments = with_segment_embeddings(segments, embed)
+            return semantic_chunks(
+                segments,
+                max_tokens=args.chunk_tokens,
+                overlap_tokens=args.chunk_overlap,
+                min_tokens=args.chunk_min_tokens,
+                silence_gap=args.silence_gap,
+                similarity_threshold=similarity_threshold,
+            )
+
+        return chunk
+
+    schemes = [
+        (f"fixed merge_size={args.merge_size}", lambda segments: merge_segment_stream(segments, args.merge_size)),
+        (f"semantic {args.chunk_tokens} tokens", semantic(None)),
+    ]
+    if args.split_similarity is not None:
+        schemes.append((f"semantic + similarity<{args.split_similarity}", semantic(args.split_similarity)))
+
+    try:
+        queries = sample_queries(lectures, args.queries)
+        query_vectors = np.vstack(embed([segment["text"] for _, segment in queries])).astype("float32")
+        report = {
+            "lectures": len(lectures),
+            "segments": sum(len(segments) for segments in lectures.values()),
+            "queries": len(queries),
+            "schemes": [
+                bench_scheme(name, chunk_fn, lectures, queries, query_vectors, embed, args.k)
+                for name, chunk_fn in schemes
+            ],
+        }
+    finally:
+        embedding_cache.close()
+        scheduler.close()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,150 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from pymongo import MongoClient
+
+from answer_question import search_embedding_matrix
+from course_cache import load_course_matrix
+from course_index import QUANTIZATIONS, RERANK_FACTORS, build_faiss_index_for, faiss
+from course_registry import COURSE_PREFIX, normalize_course_name
+from search_engine import search_batch, squared_norms
+
+
+def synthetic_embeddings(rows, dimension, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, rows // 200), dimension)).astype("float32")
+    assignments = rng.integers(0, centers.shape[0], size=rows)
+    noise = rng.normal(scale=0.35, size=(rows, dimension)).astype("float32")
+    return centers[assignments] + noise
+
+
+def sample_queries(embeddings, count, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(embeddings.shape[0], size=min(count, embeddings.shape[0]), replace=False)
+    noise = rng.normal(scale=0.1, size=(rows.size, embeddings.shape[1])).astype("float32")
+    return embeddings[rows] + noise
+
+
+def bench_exact(embeddings, queries, k):
+    results = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        top_indices, _ = search_embedding_matrix(embeddings, query, k)
+        latencies.append(time.perf_counter() - started)
+        results.append(set(top_indices))
+    return results, latencies
+
+
+def bench_exact_batched(embeddings, queries, k, batch_size):
+    # Questions searched batch_size at a time with one GEMM per batch; each
+    # question is charged its share of the batch.
+    norms = squared_norms(embeddings)
+    latencies = []
+    for begin in range(0, len(queries), batch_size):
+        batch = queries[begin:begin + batch_size]
+        started = time.perf_counter()
+        search_batch(embeddings, batch, k, norms)
+        latencies.extend([(time.perf_counter() - started) / len(batch)] * len(batch))
+    return latencies
+
+
+def bench_kind(kind, embeddings, queries, exact_results, k, quantization="none"):
+    started = time.perf_counter()
+    index = build_faiss_index_for(embeddings, kind, quantization)
+    build_seconds = time.perf_counter() - started
+    index_bytes = faiss.serialize_index(index).nbytes
+
+    candidate_count = k * RERANK_FACTORS[quantization]
+    latencies = []
+    hits = 0
+    reranked_hits = 0
+    for query, expected in zip(queries, exact_results):
+        started = time.perf_counter()
+        _, rows = index.search(query.reshape(1, -1), candidate_count)
+        candidates = rows[0][rows[0] >= 0]
+        if quantization != "none":
+            # Re-rank against the full-precision rows, as search_records
+            # does with the vectors stored in Mongo.
+            distances = np.linalg.norm(embeddings[candidates] - query, axis=1)
+            reranked = candidates[np.argsort(distances)[:k]]
+        else:
+            reranked = candidates[:k]
+        latencies.append(time.perf_counter() - started)
+        hits += len(expected.intersection(int(row) for row in candidates[:k]))
+        reranked_hits += len(expected.intersection(int(row) for row in reranked))
+
+    search_seconds = sum(latencies)
+    return {
+        "kind": kind,
+        "quantization": quantization,
+        "build_seconds": round(build_seconds, 2),
+        "mb_per_million_chunks": round(index_bytes / embeddings.shape[0] * 1_000_000 / (1024 * 1024), 1),
+        "qps": round(len(queries) / search_seconds, 1) if search_seconds else None,
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+        f"recall@{k}_reranked": round(reranked_hits / (len(queries) * k), 4),
+        **latency_report(latencies),
+    }
+
+
+def latency_report(latencies):
+    values = np.array(latencies, dtype="float64") * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report memory, QPS, recall@k and latency of FAISS course indexes against exact numpy search."
+    )
+    parser.add_argument("--mongo-uri", default="", help="Read embeddings from this MongoDB.")
+    parser.add_argument("--mongo-db", default="rag_basic")
+    parser.add_argument("--course", default="", help="Course to benchmark when --mongo-uri is set.")
+    parser.add_argument("--synthetic-rows", type=int, default=50_000, help="Rows to generate without Mongo.")
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=6)
+    parser.add_argument("--batch-size", type=int, default=32, help="Questions per GEMM in the batched exact search.")
+    parser.add_argument("--kinds", nargs="+", default=["flat", "ivf", "hnsw"])
+    parser.add_argument("--quantizations", nargs="+", choices=QUANTIZATIONS, default=["none", "sq8", "pq"])
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        client = MongoClient(args.mongo_uri)
+        course_collection = f"{COURSE_PREFIX}{normalize_course_name(args.course)}"
+        course_matrix = load_course_matrix(client[args.mongo_db], course_collection)
+        client.close()
+        if course_matrix is None:
+            raise SystemExit(f"No embeddings found in {course_collection}")
+        embeddings = course_matrix.matrix
+    else:
+        embeddings = synthetic_embeddings(args.synthetic_rows, args.dimension)
+
+    queries = sample_queries(embeddings, args.queries)
+    exact_results, exact_latencies = bench_exact(embeddings, queries, args.k)
+    batched_latencies = bench_exact_batched(embeddings, queries, args.k, args.batch_size)
+
+    report = {
+        "rows": int(embeddings.shape[0]),
+        "dimension": int(embeddings.shape[1]),
+        "exact": {
+            "mb_per_million_chunks": round(embeddings.shape[1] * 4 * 1_000_000 / (1024 * 1024), 1),
+            "qps": round(len(queries) / sum(exact_latencies), 1),
+            **latency_report(exact_latencies),
+        },
+        "exact_batched": {
+            "batch_size": args.batch_size,
+            "qps": round(len(queries) / sum(batched_latencies), 1),
+            **latency_report(batched_latencies),
+        },
+        "indexes": [
+            bench_kind(kind, embeddings, queries, exact_results, args.k, quantization)
+            for kind in args.kinds
+            for quantization in args.quantizations
+        ],
+    }
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,240 @@
+import argparse
+import json
+import sys
+import threading
+import time
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from keyword_index import tokenize
+
+
+DEFAULT_DIMENSION = 1024
+HASH_BUCKETS = 4096
+PROJECTION_SEED = 0
+SSE_CONTENT_TYPE = "text/event-stream"
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Callers drop keep-alive connections whenever their session closes.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+@lru_cache(maxsize=4)
+def projection(dimension: int) -> np.ndarray:
+    rng = np.random.default_rng(PROJECTION_SEED)
+    return rng.standard_normal((HASH_BUCKETS, dimension), dtype=np.float32)
+
+
+def token_buckets(text: str) -> List[int]:
+    # crc32 rather than hash() so buckets are the same in every process.
+    buckets = [zlib.crc32(token.encode("utf-8")) % HASH_BUCKETS for token in tokenize(text)]
+    return buckets or [zlib.crc32(text.encode("utf-8")) % HASH_BUCKETS]
+
+
+def fake_embeddings(texts: Sequence[str], dimension: int = DEFAULT_DIMENSION) -> np.ndarray:
+    # Deterministic stand-in for bge-m3: the normalized sum of a fixed random
+    # vector per token, so texts that share words land close together and
+    # keyword and vector retrieval agree roughly the way they do on real
+    # embeddings.
+    if not texts:
+        return np.zeros((0, dimension), dtype=np.float32)
+    buckets = [token_buckets(text) for text in texts]
+    offsets = np.cumsum([0, *(len(row) for row in buckets[:-1])])
+    flat = np.fromiter((bucket for row in buckets for bucket in row), dtype=np.int64)
+    vectors = np.add.reduceat(projection(dimension)[flat], offsets, axis=0)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+class FakeServices:
+    # Local stand-ins for Ollama's /api/embed and OpenRouter's streaming
+    # /api/v1/chat/completions on one threaded HTTP server. Latencies are in
+    # seconds; embed_parallel caps the batches embedded at once, like
+    # OLLAMA_NUM_PARALLEL does for a real model.
+    def __init__(
+        self,
+        dimension: int = DEFAULT_DIMENSION,
+        embed_latency: float = 0.0,
+        embed_latency_per_text: float = 0.0,
+        embed_parallel: int = 4,
+        chat_first_token: float = 0.0,
+        chat_token_delay: float = 0.0,
+        chat_tokens: int = 64,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.dimension = dimension
+        self.embed_latency = embed_latency
+        self.embed_latency_per_text = embed_latency_per_text
+        self.chat_first_token = chat_first_token
+        self.chat_token_delay = chat_token_delay
+        self.chat_tokens = max(1, chat_tokens)
+        self._embed_slots = threading.Semaphore(max(1, embed_parallel))
+        self._lock = threading.Lock()
+        self.embed_requests = 0
+        self.embedded_texts = 0
+        self.chat_requests = 0
+        self.server = FakeHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def embed_url(self) -> str:
+        return f"{self.base_url}/api/embed"
+
+    @property
+    def chat_url(self) -> str:
+        return f"{self.base_url}/api/v1/chat/completions"
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "embed_requests": self.embed_requests,
+                "embedded_texts": self.embedded_texts,
+                "chat_requests": self.chat_requests,
+            }
+
+    def start(self) -> "FakeServices":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="bench-fakes", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeServices":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def embed(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        texts = payload.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        with self._embed_slots:
+            time.sleep(self.embed_latency + self.embed_latency_per_text * len(texts))
+            vectors = fake_embeddings(texts, self.dimension)
+        with self._lock:
+            self.embed_requests += 1
+            self.embedded_texts += len(texts)
+        return {"model": payload.get("model", ""), "embeddings": vectors.tolist()}
+
+    def answer_tokens(self, payload: Dict[str, Any]) -> List[str]:
+        # The answer repeats words of the prompt so it varies per question
+        # but is the same for the same prompt.
+        messages = payload.get("messages") or [{}]
+        words = str(messages[-1].get("content", "")).split() or ["answer"]
+        return [f"{words[index % len(words)]} " for index in range(self.chat_tokens)]
+
+    def _handler(self):
+        services = self
+
+        class FakeHandler(BaseHTTPRequestHandler):
+            # HTTP/1.1 so the keep-alive sessions of the callers are reused
+            # the way they are against the real services.
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self.send_error(400)
+                    return
+                path = self.path.split("?", 1)[0]
+                if path == "/api/embed":
+                    self.send_json(services.embed(payload))
+                elif path == "/api/v1/chat/completions":
+                    self.send_chat(payload)
+                else:
+                    self.send_error(404)
+
+            def send_json(self, payload: Dict[str, Any]):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def send_chat(self, payload: Dict[str, Any]):
+                with services._lock:
+                    services.chat_requests += 1
+                tokens = services.answer_tokens(payload)
+                model = payload.get("model", "")
+                if not payload.get("stream"):
+                    self.send_json({"model": model, "choices": [{"message": {"role": "assistant", "content": "".join(tokens)}}]})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", SSE_CONTENT_TYPE)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(services.chat_first_token)
+                for index, token in enumerate(tokens):
+                    if index:
+                        time.sleep(services.chat_token_delay)
+                    event = {"model": model, "choices": [{"index": 0, "delta": {"content": token}}]}
+                    self.send_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.send_chunk(b"data: [DONE]\n\n")
+                self.send_chunk(b"")
+
+            def log_message(self, format, *args):
+                pass
+
+        return FakeHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Serve deterministic stand-ins for Ollama embeddings and OpenRouter chat completions. "
+            "Point OLLAMA_EMBED_URL and OPENROUTER_CHAT_URL at the printed URLs."
+        )
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Added to every embedding request.")
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.0, help="Added per text in an embedding request.")
+    parser.add_argument("--embed-parallel", type=int, default=4, help="Embedding requests served at once.")
+    parser.add_argument("--chat-first-token-ms", type=float, default=0.0)
+    parser.add_argument("--chat-token-ms", type=float, default=0.0, help="Delay between streamed tokens.")
+    parser.add_argument("--chat-tokens", type=int, default=64, help="Tokens per answer.")
+    args = parser.parse_args()
+
+    services = FakeServices(
+        dimension=args.dimension,
+        embed_latency=args.embed_latency_ms / 1000,
+        embed_latency_per_text=args.embed_per_text_ms / 1000,
+        embed_parallel=args.embed_parallel,
+        chat_first_token=args.chat_first_token_ms / 1000,
+        chat_token_delay=args.chat_token_ms / 1000,
+        chat_tokens=args.chat_tokens,
+        host=args.host,
+        port=args.port,
+    )
+    print(json.dumps({"embed_url": services.embed_url, "chat_url": services.chat_url}), flush=True)
+    try:
+        services.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        services.server.server_close()
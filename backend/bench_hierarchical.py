@@ -0,0 +1,165 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from answer_question import search_course_matrix
+from bench_course_index import latency_report
+from course_cache import CourseMatrix
+from course_index import CourseIndex, build_faiss_index_for, choose_index_kind, faiss
+from vector_codec import encode_vector
+from video_index import DEFAULT_MIN_CONFIDENCE, VideoIndex
+
+
+def synthetic_course(videos, chunks_per_video, dimension, topic_strength, seed=0):
+    # Each video gets a topic direction and each chunk a normalised mix of
+    # its video's topic and chunk-level noise, like bge-m3 output. Lower
+    # topic_strength makes videos overlap more and the first stage harder.
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(scale=topic_strength, size=(videos, dimension)).astype("float32")
+    counts = rng.integers(max(1, chunks_per_video // 2), chunks_per_video * 3 // 2 + 1, size=videos)
+    codes = np.repeat(np.arange(videos), counts)
+    vectors = topics[codes] + rng.normal(size=(codes.size, dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype("float32"), codes
+
+
+def sample_queries(embeddings, count, noise, seed=1):
+    # A question is a chunk pushed off by a random direction of length
+    # noise, so its nearest chunk is at a realistic distance rather than ~0.
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(embeddings.shape[0], size=min(count, embeddings.shape[0]), replace=False)
+    offsets = rng.normal(size=(rows.size, embeddings.shape[1])).astype("float32")
+    offsets *= noise / np.linalg.norm(offsets, axis=1, keepdims=True)
+    queries = embeddings[rows] + offsets
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def course_matrix_for(embeddings, codes):
+    documents = (
+        {
+            "title": f"video {code:04d}",
+            "Number": str(code),
+            "start": 0,
+            "end": 0,
+            "text": str(row),
+            "embedding": encode_vector(vector),
+        }
+        for row, (code, vector) in enumerate(zip(codes, embeddings))
+    )
+    return CourseMatrix.from_documents(documents)
+
+
+def bench_matrix(course_matrix, queries, k, top_videos, min_confidence):
+    results = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        records, _ = search_course_matrix(course_matrix, query, k, top_videos, min_confidence)
+        latencies.append(time.perf_counter() - started)
+        results.append({record["text"] for record in records})
+    return results, latencies
+
+
+def bench_index(course_index, queries, k, top_videos, min_confidence):
+    results = []
+    latencies = []
+    fallbacks = 0
+    for query in queries:
+        started = time.perf_counter()
+        hits = course_index.search_videos(query, k, top_videos, min_confidence) if top_videos else None
+        if hits is None:
+            fallbacks += bool(top_videos)
+            hits = course_index.search(query, k)
+        latencies.append(time.perf_counter() - started)
+        results.append({str(row) for row in hits[0]})
+    return results, latencies, fallbacks
+
+
+def recall(results, expected, k):
+    return round(sum(len(found & wanted) for found, wanted in zip(results, expected)) / (len(expected) * k), 4)
+
+
+def matrix_fallbacks(course_matrix, queries, k, top_videos, min_confidence):
+    # Same decision search_course_matrix makes, counted separately so the
+    # timed loop stays identical to the serving path.
+    count = 0
+    for query in queries:
+        rows = course_matrix.videos.candidate_rows(query, top_videos)
+        if rows is None:
+            count += 1
+            continue
+        distances = np.linalg.norm(course_matrix.matrix[rows] - query, axis=1)
+        if 1 / (1 + float(np.min(distances))) < min_confidence:
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare full-scan and two-stage (video centroid, then chunk) retrieval on synthetic courses."
+    )
+    parser.add_argument("--videos", type=int, nargs="+", default=[200, 500, 800])
+    parser.add_argument("--chunks-per-video", type=int, default=60)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=6)
+    parser.add_argument("--top-videos", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--topic-strength", type=float, default=0.5, help="Weight of the video topic in each chunk.")
+    parser.add_argument("--query-noise", type=float, default=0.8, help="Distance of each question from its source chunk.")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    reports = []
+    for video_count in args.videos:
+        embeddings, codes = synthetic_course(video_count, args.chunks_per_video, args.dimension, args.topic_strength)
+        queries = sample_queries(embeddings, args.queries, args.query_noise)
+        course_matrix = course_matrix_for(embeddings, codes)
+
+        exact, exact_latencies = bench_matrix(course_matrix, queries, args.k, 0, args.min_confidence)
+        report = {
+            "videos": video_count,
+            "rows": int(embeddings.shape[0]),
+            "matrix": [{"top_videos": 0, f"recall@{args.k}": 1.0, **latency_report(exact_latencies)}],
+        }
+        for top_videos in args.top_videos:
+            results, latencies = bench_matrix(course_matrix, queries, args.k, top_videos, args.min_confidence)
+            report["matrix"].append(
+                {
+                    "top_videos": top_videos,
+                    f"recall@{args.k}": recall(results, exact, args.k),
+                    "fallback_rate": round(
+                        matrix_fallbacks(course_matrix, queries, args.k, top_videos, args.min_confidence)
+                        / len(queries),
+                        4,
+                    ),
+                    **latency_report(latencies),
+                }
+            )
+
+        if faiss is not None:
+            kind = choose_index_kind(embeddings.shape[0])
+            titles = [f"video {code:04d}" for code in range(video_count)]
+            course_index = CourseIndex(
+                build_faiss_index_for(embeddings, kind),
+                np.zeros((embeddings.shape[0], 12), dtype="uint8"),
+                {"kind": kind},
+                VideoIndex.from_codes(titles, codes, embeddings),
+            )
+            exact_rows = [{str(int(row)) for row in np.argsort(np.linalg.norm(embeddings - query, axis=1))[: args.k]} for query in queries]
+            report["index_kind"] = kind
+            report["index"] = []
+            for top_videos in [0, *args.top_videos]:
+                results, latencies, fallbacks = bench_index(course_index, queries, args.k, top_videos, args.min_confidence)
+                report["index"].append(
+                    {
+                        "top_videos": top_videos,
+                        f"recall@{args.k}": recall(results, exact_rows, args.k),
+                        "fallback_rate": round(fallbacks / len(queries), 4),
+                        **latency_report(latencies),
+                    }
+                )
+        reports.append(report)
+
+    print(json.dumps(reports, indent=2))
@@ -0,0 +1,400 @@
+import argparse
+import contextlib
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import groupby
+
+import numpy as np
+from pymongo import MongoClient
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+import answer_question
+from bench_course_index import latency_report
+from bench_fakes import DEFAULT_DIMENSION, FakeServices, fake_embeddings
+from course_cache import CourseGenerations, CourseMatrixCache
+from course_index import QUANTIZATIONS, CourseIndexCache
+from course_registry import COURSE_PREFIX
+from embedding_cache import EmbeddingCache
+from embedding_scheduler import EmbeddingScheduler
+from embedding_store import BLOCK_ROWS, EmbeddingStoreWriter
+from keyword_index import KeywordIndexCache
+from preProcessJson import EMBEDDING_MODEL, create_embeddings_from_json
+from store_embeddings import store_embeddings
+from transcript_io import iter_records, list_transcripts, transcript_path, write_records
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SAMPLES_DIR = os.path.join(REPO_DIR, "jsons")
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results.jsonl")
+SECONDS_PER_WORD = 0.4
+FAKE_MODEL = "bench/fake-chat"
+
+
+def load_samples(samples_dir):
+    # (title, words) per sample transcript.
+    samples = []
+    for path in list_transcripts(samples_dir).values():
+        records = list(iter_records(path))
+        words = " ".join(str(record.get("text", "")) for record in records).split()
+        if words:
+            samples.append((str(records[0].get("title", "")) or "Lecture", words))
+    if not samples:
+        raise SystemExit(f"No sample transcripts found in {samples_dir}")
+    return samples
+
+
+def synthetic_course(samples, chunks, chunk_words=40, chunks_per_video=100, seed=0):
+    # Chunks scaled from the sample transcripts. Each synthetic video reads
+    # one sample from a random offset, chunk_words at a time, so vocabulary
+    # and the mix of topics stay those of the samples at any size.
+    rng = np.random.default_rng(seed)
+    spread = max(1, chunk_words // 4)
+    for chunk_id in range(chunks):
+        video, position = divmod(chunk_id, chunks_per_video)
+        if position == 0:
+            title, words = samples[int(rng.integers(len(samples)))]
+            offset = int(rng.integers(len(words)))
+            clock = 0.0
+        length = max(1, chunk_words + int(rng.integers(-spread, spread + 1)))
+        text = " ".join(words[(offset + index) % len(words)] for index in range(length))
+        offset += length
+        yield {
+            "source": f"video_{video + 1:06d}",
+            "chunk_id": chunk_id,
+            "title": f"{title} {video + 1}",
+            "Number": str(video + 1),
+            "start": round(clock, 2),
+            "end": round(clock + length * SECONDS_PER_WORD, 2),
+            "text": text,
+        }
+        clock += length * SECONDS_PER_WORD
+
+
+def synthetic_questions(samples, count, question_words=8, seed=1):
+    # Short windows of the sample text, so questions share terms with chunks
+    # of every synthetic course.
+    rng = np.random.default_rng(seed)
+    questions = []
+    for _ in range(count):
+        _, words = samples[int(rng.integers(len(samples)))]
+        offset = int(rng.integers(len(words)))
+        questions.append(" ".join(words[(offset + index) % len(words)] for index in range(question_words)) + "?")
+    return questions
+
+
+def write_transcripts(chunks, directory):
+    for source, records in groupby(chunks, key=lambda chunk: chunk["source"]):
+        write_records(
+            transcript_path(directory, source),
+            ({name: value for name, value in record.items() if name not in ("source", "chunk_id")} for record in records),
+        )
+
+
+def write_seed_store(chunks, path, rows, dimension):
+    # The full-size store is embedded locally with the same function the fake
+    # server uses; pushing a million chunks through HTTP would only measure
+    # the fake.
+    writer = EmbeddingStoreWriter(path, rows, dimension)
+    block = []
+    for chunk in chunks:
+        block.append(chunk)
+        if len(block) == BLOCK_ROWS:
+            writer.append(block, fake_embeddings([record["text"] for record in block], dimension))
+            block = []
+    if block:
+        writer.append(block, fake_embeddings([record["text"] for record in block], dimension))
+    return writer.commit()
+
+
+def bench_embed(args, services, samples, work_dir):
+    chunks = min(args.embed_chunks, max(args.sizes))
+    json_dir = os.path.join(work_dir, "transcripts")
+    write_transcripts(synthetic_course(samples, chunks, args.chunk_words, args.chunks_per_video), json_dir)
+
+    before = services.stats()
+    scheduler = EmbeddingScheduler(
+        url=services.embed_url,
+        model=EMBEDDING_MODEL,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+    )
+    try:
+        started = time.perf_counter()
+        create_embeddings_from_json(json_dir, os.path.join(work_dir, "embedded"), "", scheduler=scheduler)
+        seconds = time.perf_counter() - started
+    finally:
+        scheduler.close()
+    after = services.stats()
+    return {
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(chunks / seconds, 1),
+        "requests": after["embed_requests"] - before["embed_requests"],
+    }
+
+
+def bench_store(args, client, samples, work_dir, size, course_collection, index_dir):
+    store_path = os.path.join(work_dir, f"seed_{size}")
+    started = time.perf_counter()
+    write_seed_store(
+        synthetic_course(samples, size, args.chunk_words, args.chunks_per_video),
+        store_path,
+        size,
+        args.dimension,
+    )
+    seed_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store_embeddings(
+        store_path,
+        "",
+        args.mongo_db,
+        course_collection,
+        course_name=course_collection[len(COURSE_PREFIX):],
+        index_dir=index_dir,
+        batch_size=args.store_batch_size,
+        index_quantization=args.index_quantization,
+        client=client,
+    )
+    seconds = time.perf_counter() - started
+    return {
+        "rows": size,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(size / seconds, 1),
+        "seed_seconds": round(seed_seconds, 3),
+    }
+
+
+def bench_queries(args, db, samples, course_collection, index_dir):
+    # Questions go through answer_question with the caches a --serve worker
+    # keeps, from a thread pool the size of its --workers. The first
+    # question, which loads the course, is reported on its own.
+    generations = CourseGenerations()
+    matrix_cache = CourseMatrixCache(generations=generations)
+    index_cache = CourseIndexCache(index_dir=index_dir, generations=generations)
+    keyword_cache = KeywordIndexCache(index_dir=index_dir, generations=generations)
+    embedding_cache = EmbeddingCache("")
+    course = course_collection[len(COURSE_PREFIX):]
+
+    def ask(question):
+        events = []
+        started = time.perf_counter()
+        answer_question.answer_question(
+            db,
+            course,
+            question,
+            args.stream,
+            "bench",
+            FAKE_MODEL,
+            emit_event=events.append,
+            matrix_cache=matrix_cache,
+            index_cache=index_cache,
+            embedding_cache=embedding_cache,
+            top_videos=args.top_videos,
+            keyword_cache=keyword_cache,
+            retrieval=args.retrieval,
+        )
+        latency = time.perf_counter() - started
+        final = events[-1] if events else {}
+        if "error" in final:
+            raise RuntimeError(f"Benchmark question failed: {final['error']}")
+        return latency, final.get("timings", {})
+
+    questions = synthetic_questions(samples, args.queries + 1)
+    try:
+        cold_latency, _ = ask(questions[0])
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            started = time.perf_counter()
+            results = list(executor.map(ask, questions[1:]))
+            seconds = time.perf_counter() - started
+    finally:
+        embedding_cache.close()
+
+    latencies = [latency for latency, _ in results]
+    stages = sorted({stage for _, timings in results for stage in timings if stage != "total"})
+    return {
+        "queries": len(results),
+        "concurrency": args.concurrency,
+        "qps": round(len(results) / seconds, 1),
+        "cold_ms": round(cold_latency * 1000, 1),
+        **latency_report(latencies),
+        "stage_p50_ms": {
+            stage: round(float(np.median([timings[stage] for _, timings in results if stage in timings])), 2)
+            for stage in stages
+        },
+    }
+
+
+def patch_mongomock():
+    # Two differences from pymongo that the ingest and query paths run into:
+    # mongomock 4.3 predates the sort= that pymongo 4.9 passes when a
+    # ReplaceOne joins a bulk write (store_embeddings never sets it, so it
+    # is dropped), and it pops and restores _id in the projection it is
+    # given, which races on the module-level projections the query threads
+    # share.
+    builder = mongomock.collection.BulkOperationBuilder
+    collection = mongomock.collection.Collection
+    if getattr(collection, "_bench_patched", False):
+        return
+    add_replace = builder.add_replace
+    copy_only_fields = collection._copy_only_fields
+
+    def add_replace_without_sort(self, selector, doc, upsert, collation=None, hint=None, sort=None):
+        return add_replace(self, selector, doc, upsert, collation=collation, hint=hint)
+
+    def copy_only_fields_of_copy(self, doc, fields, container):
+        return copy_only_fields(self, doc, dict(fields) if isinstance(fields, dict) else fields, container)
+
+    if "sort" not in inspect.signature(add_replace).parameters:
+        builder.add_replace = add_replace_without_sort
+    collection._copy_only_fields = copy_only_fields_of_copy
+    collection._bench_patched = True
+
+
+def open_mongo(mongo_uri):
+    if mongo_uri:
+        return MongoClient(mongo_uri), "mongod"
+    if mongomock is None:
+        raise SystemExit("Install mongomock or pass --mongo-uri for a local mongod.")
+    patch_mongomock()
+    return mongomock.MongoClient(), "mongomock"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_suite(args):
+    samples = load_samples(args.samples)
+    client, mongo_backend = open_mongo(args.mongo_uri)
+    client.drop_database(args.mongo_db)
+    services = FakeServices(
+        dimension=args.dimension,
+        embed_latency=args.embed_latency_ms / 1000,
+        embed_latency_per_text=args.embed_per_text_ms / 1000,
+        embed_parallel=args.embed_parallel,
+        chat_first_token=args.chat_first_token_ms / 1000,
+        chat_token_delay=args.chat_token_ms / 1000,
+        chat_tokens=args.chat_tokens,
+    )
+    # request_embeddings and stream_answer read these on every call.
+    answer_question.OLLAMA_EMBED_URL = services.embed_url
+    answer_question.OPENROUTER_CHAT_URL = services.chat_url
+
+    report = {
+        "label": args.label,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "mongo": mongo_backend,
+        "config": {
+            name: getattr(args, name)
+            for name in (
+                "dimension",
+                "chunk_words",
+                "retrieval",
+                "stream",
+                "top_videos",
+                "index_quantization",
+                "embed_latency_ms",
+                "embed_per_text_ms",
+                "chat_first_token_ms",
+                "chat_token_ms",
+                "chat_tokens",
+            )
+        },
+        "embed": {},
+        "sizes": [],
+    }
+    with services, tempfile.TemporaryDirectory(prefix="bench_suite_") as work_dir:
+        index_dir = os.path.join(work_dir, "indexes")
+        try:
+            # The pipeline scripts report progress on stdout, which is kept
+            # for the report.
+            with contextlib.redirect_stdout(sys.stderr):
+                report["embed"] = bench_embed(args, services, samples, work_dir)
+                for size in args.sizes:
+                    course_collection = f"{COURSE_PREFIX}bench_{size}"
+                    report["sizes"].append(
+                        {
+                            "chunks": size,
+                            "store": bench_store(args, client, samples, work_dir, size, course_collection, index_dir),
+                            "query": bench_queries(args, client[args.mongo_db], samples, course_collection, index_dir),
+                        }
+                    )
+                    print(json.dumps(report["sizes"][-1]), flush=True)
+        finally:
+            client.drop_database(args.mongo_db)
+            client.close()
+    report["fake_services"] = services.stats()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Measure ingest throughput and query QPS/latency against local stand-ins for Ollama, "
+            "OpenRouter and MongoDB, on synthetic courses scaled from the sample transcripts."
+        )
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000], help="Chunks per synthetic course (up to 1000000).")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES_DIR, help="Sample transcripts the courses are built from.")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="Append one JSON line per run here (empty to skip).")
+    parser.add_argument("--label", default="", help="Name for this run in the results file.")
+    parser.add_argument(
+        "--mongo-uri",
+        default="",
+        help=(
+            "Use this MongoDB (e.g. a local mongod) instead of mongomock, which scans the collection on every "
+            "upsert and is only practical up to about 10k chunks. --mongo-db is dropped before and after."
+        ),
+    )
+    parser.add_argument("--mongo-db", default="rag_bench")
+    parser.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION, help="Embedding size; lower it for the largest courses.")
+    parser.add_argument("--chunk-words", type=int, default=40)
+    parser.add_argument("--chunks-per-video", type=int, default=100)
+    parser.add_argument("--embed-chunks", type=int, default=5_000, help="Chunks embedded through the fake /api/embed.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks per embedding request.")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Concurrent embedding requests.")
+    parser.add_argument("--store-batch-size", type=int, default=500, help="Documents per bulk upsert.")
+    parser.add_argument("--index-quantization", choices=QUANTIZATIONS, default="none")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions answered at once.")
+    parser.add_argument("--retrieval", choices=answer_question.RETRIEVAL_MODES, default="hybrid")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--top-videos", type=int, default=0)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.0)
+    parser.add_argument("--embed-parallel", type=int, default=4)
+    parser.add_argument("--chat-first-token-ms", type=float, default=0.0)
+    parser.add_argument("--chat-token-ms", type=float, default=0.0)
+    parser.add_argument("--chat-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    if args.results:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, "a", encoding="utf-8") as file:
+            file.write(json.dumps(report) + "\n")
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+import torch
+import whisper
+
+from mp3_to_json import load_audio, silence_cuts, transcribe_samples, transcribe_sharded
+from transcription_engine import get_whisper_model
+
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audio", "sample.mp3")
+
+
+def write_lecture(samples, repeat, path):
+    # The bundled sample is short; repeating it stands in for a long lecture
+    # so there is something to shard.
+    pcm = np.clip(np.tile(samples, repeat) * 32768.0, -32768, 32767).astype(np.int16)
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(whisper.audio.SAMPLE_RATE)
+        wav_file.writeframes(pcm.tobytes())
+    return pcm.size / whisper.audio.SAMPLE_RATE
+
+
+def best_of(rounds, run):
+    # The first round includes loading the model in every worker.
+    timings = []
+    result = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Real-time factor of sharded CPU transcription against worker count."
+    )
+    parser.add_argument("--audio", default=DEFAULT_AUDIO)
+    parser.add_argument("--repeat", type=int, default=1, help="Tile the audio this many times.")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads per worker (0 = cores / workers).")
+    parser.add_argument("--shard-seconds", type=float, default=30.0)
+    parser.add_argument("--translate", action="store_true")
+    parser.add_argument("--rounds", type=int, default=2, help="Runs per setting; the fastest is reported.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        lecture_path = os.path.join(temp_dir, "lecture.wav")
+        duration = write_lecture(load_audio(args.audio), args.repeat, lecture_path)
+        shards = len(silence_cuts(load_audio(lecture_path), args.shard_seconds)) + 1
+
+        reports = []
+        baseline = None
+        for workers in args.workers:
+            if workers <= 1:
+                # The unsharded path: one model.transcribe over the whole file.
+                model = get_whisper_model(args.model, "cpu")
+                torch.set_num_threads(os.cpu_count() or 1)
+                seconds, result = best_of(
+                    args.rounds,
+                    lambda: transcribe_samples(model, load_audio(lecture_path), args.translate, False, None, False),
+                )
+                threads = torch.get_num_threads()
+            else:
+                threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+                seconds, result = best_of(
+                    args.rounds,
+                    lambda: transcribe_sharded(
+                        lecture_path,
+                        args.model,
+                        args.translate,
+                        False,
+                        None,
+                        workers,
+                        threads,
+                        args.shard_seconds,
+                    ),
+                )
+            baseline = baseline or seconds
+            reports.append(
+                {
+                    "workers": workers,
+                    "threads_per_worker": threads,
+                    "shards": 1 if workers <= 1 else shards,
+                    "seconds": round(seconds, 2),
+                    "rtf": round(seconds / duration, 3),
+                    "speedup": round(baseline / seconds, 2),
+                    "segments": len(result[0]),
+                }
+            )
+
+    print(json.dumps({"audio": args.audio, "duration_seconds": round(duration, 1), "results": reports}, indent=2))
@@ -1,20 +1,18 @@
-import joblib
-import numpy as np
 import faiss
 
-# Load saved embeddings
-df = joblib.load("embeddings.joblib")
+from embedding_store import EmbeddingStore
 
-# Convert to float32 matrix
-embeddings = np.vstack(df["embedding"].values).astype("float32")
+# Open saved embeddings (memory-mapped)
+store = EmbeddingStore("embeddings")
 
-dimension = embeddings.shape[1]
+dimension = store.dimension
 
 # Create FAISS index
 index = faiss.IndexFlatL2(dimension)
 
-# Add embeddings
-index.add(embeddings)
+# Add embeddings block by block
+for _, embeddings in store.iter_vector_blocks():
+    index.add(embeddings)
 
 # Save index
 faiss.write_index(index, "faiss_index.bin")
@@ -1,10 +1,12 @@
 import joblib
-import numpy as np
 import faiss
 
+from embedding_store import EmbeddingStore
+from video_index import VideoIndex
+
 print("Loading existing embeddings...")
 
-df = joblib.load("embeddings.joblib")
+store = EmbeddingStore("embeddings")
 
 # =====================================
 # 1️⃣ Build Chunk FAISS Index
@@ -12,12 +14,11 @@ df = joblib.load("embeddings.joblib")
 
 print("Building chunk FAISS index...")
 
-chunk_embeddings = np.vstack(df["embedding"].values).astype("float32")
-
-dimension = chunk_embeddings.shape[1]
+dimension = store.dimension
 
 chunk_index = faiss.IndexFlatL2(dimension)
-chunk_index.add(chunk_embeddings)
+for _, vectors in store.iter_vector_blocks():
+    chunk_index.add(vectors)
 
 faiss.write_index(chunk_index, "chunk_index.bin")
 
@@ -31,23 +32,10 @@ print("Chunk index saved ✔")
 
 print("Building video-level index from existing embeddings...")
 
-video_titles = []
-video_embeddings = []
-
-video_groups = df.groupby("title")
-
-for title, group in video_groups:
-    video_titles.append(title)
-
-    # Average chunk embeddings
-    avg_embedding = np.mean(
-        np.vstack(group["embedding"].values),
-        axis=0
-    )
-
-    video_embeddings.append(avg_embedding)
-
-video_embeddings = np.array(video_embeddings).astype("float32")
+# Average chunk embeddings per title, accumulated block by block; the
+# per-course indexes keep the same centroids up to date on every store.
+videos = VideoIndex.from_blocks(store.categories["title"], store.codes["title"], store.iter_vector_blocks(), dimension)
+video_titles, video_embeddings = videos.centroids()
 
 video_index = faiss.IndexFlatL2(video_embeddings.shape[1])
 video_index.add(video_embeddings)
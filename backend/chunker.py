@@ -0,0 +1,160 @@
+import re
+
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+SENTENCE_ENDINGS = (".", "!", "?", "।", "。", "！", "？")
+
+DEFAULT_MAX_TOKENS = 256
+DEFAULT_OVERLAP_TOKENS = 32
+DEFAULT_MIN_TOKENS = 64
+DEFAULT_SILENCE_GAP = 1.5
+
+
+def count_tokens(text):
+    # Words and punctuation marks; close enough to a subword tokenizer's
+    # count for budgeting without loading one.
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def ends_sentence(text):
+    return text.rstrip().endswith(SENTENCE_ENDINGS)
+
+
+def cosine_similarity(left, right):
+    left = np.asarray(left, dtype="float32")
+    right = np.asarray(right, dtype="float32")
+    denominator = float(np.linalg.norm(left) * np.linalg.norm(right))
+    return float(left @ right) / denominator if denominator else 0.0
+
+
+def build_chunk(group):
+    return {
+        "title": group[0]["title"],
+        "Number": group[0]["Number"],
+        "start": group[0]["start"],
+        "end": group[-1]["end"],
+        "text": " ".join(segment["text"].strip() for segment in group),
+    }
+
+
+def merge_segment_stream(segments, merge_size):
+    # Groups consecutive segments as they arrive, so the same merged chunks
+    # come out whether the segments are read from a finished json file or
+    # followed from a transcript that is still being written.
+    group = []
+    for segment in segments:
+        group.append(segment)
+        if len(group) == merge_size:
+            yield build_chunk(group)
+            group = []
+    if group:
+        yield build_chunk(group)
+
+
+def with_segment_embeddings(segments, embed_fn, batch_size=64):
+    # Attaches an "embedding" to each segment, embedding them in batches as
+    # they arrive so a followed transcript can still be chunked lazily.
+    batch = []
+    for segment in segments:
+        batch.append(segment)
+        if len(batch) == batch_size:
+            yield from _embed_batch(batch, embed_fn)
+            batch = []
+    if batch:
+        yield from _embed_batch(batch, embed_fn)
+
+
+def _embed_batch(batch, embed_fn):
+    vectors = embed_fn([segment["text"] for segment in batch])
+    for segment, vector in zip(batch, vectors):
+        yield {**segment, "embedding": vector}
+
+
+def semantic_chunks(
+    segments,
+    max_tokens=DEFAULT_MAX_TOKENS,
+    overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+    min_tokens=DEFAULT_MIN_TOKENS,
+    silence_gap=DEFAULT_SILENCE_GAP,
+    similarity_threshold=None,
+):
+    # Packs consecutive segments into chunks of at most max_tokens. A chunk
+    # closes early at a pause of silence_gap seconds or, when segments carry
+    # embeddings, where adjacent segments are less similar than
+    # similarity_threshold, once it holds min_tokens. Budget splits fall on
+    # the last sentence end that keeps min_tokens and repeat up to
+    # overlap_tokens of trailing segments at the start of the next chunk.
+    current = []
+    carried = 0
+    previous = None
+
+    def total():
+        return sum(tokens for _, tokens in current)
+
+    for segment in segments:
+        tokens = count_tokens(segment["text"])
+        if not tokens:
+            continue
+
+        if current and total() >= min_tokens and is_topic_break(previous, segment, silence_gap, similarity_threshold):
+            if len(current) > carried:
+                yield build_chunk([item for item, _ in current])
+            current = []
+            carried = 0
+
+        while current and total() + tokens > max_tokens:
+            if len(current) == carried:
+                current = []
+                carried = 0
+                break
+            cut = split_point(current, carried, min_tokens)
+            emitted = current[:cut]
+            yield build_chunk([item for item, _ in emitted])
+            overlap = overlap_tail(emitted, overlap_tokens)
+            current = overlap + current[cut:]
+            carried = len(overlap)
+
+        current.append((segment, tokens))
+        previous = segment
+
+    if len(current) > carried:
+        yield build_chunk([item for item, _ in current])
+
+
+def is_topic_break(previous, segment, silence_gap, similarity_threshold):
+    if previous is None:
+        return False
+    if silence_gap and segment["start"] - previous["end"] >= silence_gap:
+        return True
+    if (
+        similarity_threshold is not None
+        and previous.get("embedding") is not None
+        and segment.get("embedding") is not None
+    ):
+        return cosine_similarity(previous["embedding"], segment["embedding"]) < similarity_threshold
+    return False
+
+
+def split_point(current, carried, min_tokens):
+    # Latest sentence boundary after the carried overlap that keeps at
+    # least min_tokens in the emitted chunk; otherwise everything so far.
+    running = 0
+    best = None
+    for index, (segment, tokens) in enumerate(current, start=1):
+        running += tokens
+        if index > carried and running >= min_tokens and ends_sentence(segment["text"]):
+            best = index
+    return best or len(current)
+
+
+def overlap_tail(emitted, overlap_tokens):
+    tail = []
+    running = 0
+    for segment, tokens in reversed(emitted[1:]):
+        if running + tokens > overlap_tokens:
+            break
+        tail.insert(0, (segment, tokens))
+        running += tokens
+    return tail
@@ -0,0 +1,263 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from search_engine import squared_norms
+from vector_codec import decode_vector
+from video_index import VideoIndex
+
+
+REGISTRY_COLLECTION = "course_registry"
+
+MATRIX_PROJECTION = {
+    "_id": 1,
+    "title": 1,
+    "Number": 1,
+    "start": 1,
+    "end": 1,
+    "text": 1,
+    "embedding": 1,
+}
+
+
+def get_course_generation(db, course_collection: str) -> int:
+    document = db[REGISTRY_COLLECTION].find_one({"_id": course_collection}, {"generation": 1})
+    if not document:
+        return 0
+    return int(document.get("generation", 0))
+
+
+def bump_course_generation(db, course_collection: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+    update: Dict[str, Any] = {"$inc": {"generation": 1}}
+    if metadata:
+        update["$set"] = metadata
+    document = db[REGISTRY_COLLECTION].find_one_and_update(
+        {"_id": course_collection},
+        update,
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(document["generation"])
+
+
+def categorical(values: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    # Distinct values in first-seen order and each row's code. Values are
+    # keyed with their type so 1, 1.0 and "1" stay what Mongo returned.
+    codes: Dict[Tuple[type, Any], int] = {}
+    row_codes = np.fromiter(
+        (codes.setdefault((type(value), value), len(codes)) for value in values),
+        dtype="int32",
+        count=len(values),
+    )
+    table = np.empty(len(codes), dtype=object)
+    for (_, value), code in codes.items():
+        table[code] = value
+    return table, row_codes
+
+
+def value_column(values: List[Any]) -> np.ndarray:
+    # float64 when every value is a float, which is what transcripts hold;
+    # anything else is kept as the original objects.
+    if all(type(value) is float for value in values):
+        return np.array(values, dtype="float64")
+    return np.array(values, dtype=object)
+
+
+def column_value(column: np.ndarray, row: int) -> Any:
+    value = column[row]
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class CourseMatrix:
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        title_values: np.ndarray,
+        title_codes: np.ndarray,
+        number_values: np.ndarray,
+        number_codes: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        text_blob: bytes,
+        text_offsets: np.ndarray,
+        generation: int,
+        ids: Optional[np.ndarray] = None,
+    ):
+        self.matrix = matrix
+        self.title_values = title_values
+        self.title_codes = title_codes
+        self.number_values = number_values
+        self.number_codes = number_codes
+        self.starts = starts
+        self.ends = ends
+        self.text_blob = text_blob
+        self.text_offsets = text_offsets
+        self.generation = generation
+        self.ids = ids if ids is not None else np.zeros((matrix.shape[0], 12), dtype="uint8")
+        self.norms = squared_norms(matrix)
+        self.videos = VideoIndex.from_codes([str(title) for title in title_values], title_codes, matrix)
+
+    def __len__(self):
+        return int(self.matrix.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.matrix.nbytes
+            + self.norms.nbytes
+            + self.title_values.nbytes
+            + self.title_codes.nbytes
+            + self.number_values.nbytes
+            + self.number_codes.nbytes
+            + self.starts.nbytes
+            + self.ends.nbytes
+            + len(self.text_blob)
+            + self.text_offsets.nbytes
+            + self.videos.nbytes
+            + self.ids.nbytes
+        )
+
+    def text(self, row: int) -> str:
+        begin = int(self.text_offsets[row])
+        end = int(self.text_offsets[row + 1])
+        return self.text_blob[begin:end].decode("utf-8")
+
+    def record(self, row: int) -> Dict[str, Any]:
+        # Field values come back as Mongo stored them.
+        return {
+            "_id": ObjectId(self.ids[row].tobytes()),
+            "title": self.title_values[self.title_codes[row]],
+            "Number": self.number_values[self.number_codes[row]],
+            "start": column_value(self.starts, row),
+            "end": column_value(self.ends, row),
+            "text": self.text(row),
+        }
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict[str, Any]], generation: int = 0) -> Optional["CourseMatrix"]:
+        vectors = []
+        ids = []
+        titles = []
+        numbers = []
+        starts = []
+        ends = []
+        text_parts = []
+        text_offsets = [0]
+
+        for document in documents:
+            embedding = decode_vector(document.get("embedding"))
+            if embedding is None:
+                continue
+            vectors.append(embedding)
+            ids.append(document["_id"].binary if "_id" in document else bytes(12))
+            titles.append(document.get("title", ""))
+            numbers.append(document.get("Number", ""))
+            starts.append(document.get("start", 0))
+            ends.append(document.get("end", 0))
+            encoded_text = str(document.get("text", "")).encode("utf-8")
+            text_parts.append(encoded_text)
+            text_offsets.append(text_offsets[-1] + len(encoded_text))
+
+        if not vectors:
+            return None
+
+        title_values, title_codes = categorical(titles)
+        number_values, number_codes = categorical(numbers)
+        return cls(
+            matrix=np.ascontiguousarray(np.vstack(vectors), dtype="float32"),
+            title_values=title_values,
+            title_codes=title_codes,
+            number_values=number_values,
+            number_codes=number_codes,
+            starts=value_column(starts),
+            ends=value_column(ends),
+            text_blob=b"".join(text_parts),
+            text_offsets=np.array(text_offsets, dtype="int64"),
+            generation=generation,
+            ids=np.frombuffer(b"".join(ids), dtype="uint8").reshape(-1, 12),
+        )
+
+
+def load_course_matrix(db, course_collection: str, generation: Optional[int] = None) -> Optional[CourseMatrix]:
+    if generation is None:
+        generation = get_course_generation(db, course_collection)
+    documents = db[course_collection].find({}, MATRIX_PROJECTION)
+    return CourseMatrix.from_documents(documents, generation)
+
+
+class CourseGenerations:
+    # Remembers the last generation read from REGISTRY_COLLECTION per course
+    # and only re-reads it once check_interval seconds have passed.
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+        self._values: Dict[str, int] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def current(self, db, course_collection: str) -> int:
+        now = time.monotonic()
+        with self._lock:
+            if (
+                course_collection in self._values
+                and now - self._checked_at[course_collection] < self.check_interval
+            ):
+                return self._values[course_collection]
+
+        generation = get_course_generation(db, course_collection)
+        with self._lock:
+            self._values[course_collection] = generation
+            self._checked_at[course_collection] = now
+        return generation
+
+    def forget(self, course_collection: str):
+        with self._lock:
+            self._values.pop(course_collection, None)
+            self._checked_at.pop(course_collection, None)
+
+
+class CourseMatrixCache:
+    # Entries are validated against the course generation, so a hot course is
+    # answered without any Mongo round trip between generation checks.
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, generations: Optional[CourseGenerations] = None):
+        self.max_bytes = max_bytes
+        self.generations = generations or CourseGenerations()
+        self._entries: "OrderedDict[str, CourseMatrix]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, db, course_collection: str) -> Optional[CourseMatrix]:
+        generation = self.generations.current(db, course_collection)
+        with self._lock:
+            entry = self._entries.get(course_collection)
+            if entry is not None and entry.generation == generation:
+                self._entries.move_to_end(course_collection)
+                return entry
+
+        entry = load_course_matrix(db, course_collection, generation)
+        with self._lock:
+            self._discard(course_collection)
+            if entry is not None:
+                self._entries[course_collection] = entry
+                self._total_bytes += entry.nbytes
+                self._evict()
+        return entry
+
+    def invalidate(self, course_collection: str):
+        self.generations.forget(course_collection)
+        with self._lock:
+            self._discard(course_collection)
+
+    def _discard(self, course_collection: str):
+        previous = self._entries.pop(course_collection, None)
+        if previous is not None:
+            self._total_bytes -= previous.nbytes
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.nbytes
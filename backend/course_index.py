@@ -0,0 +1,434 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+from course_cache import CourseGenerations
+from vector_codec import decode_vector
+from video_index import DEFAULT_MIN_CONFIDENCE, VIDEO_INDEX_FILE, VideoIndex, distance_confidence
+
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "indexes")
+FLAT_MAX_ROWS = 20_000
+IVF_MAX_ROWS = 500_000
+IVF_NPROBE = 16
+HNSW_NEIGHBORS = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+TRAIN_SAMPLE_ROWS = 65_536
+# Each write goes to a new directory inside the course directory; this file
+# names the committed one.
+INDEX_POINTER = "CURRENT"
+
+# Quantized indexes keep 1 byte per dimension (sq8) or one byte per
+# 16-dimension subvector (pq); searches over-fetch RERANK_FACTORS x k
+# candidates and re-rank them against the full-precision vectors in Mongo.
+QUANTIZATIONS = ("none", "sq8", "pq")
+PQ_SUBVECTOR_DIMS = 16
+PQ_MIN_ROWS = 10_000
+RERANK_FACTORS = {"none": 1, "sq8": 4, "pq": 16}
+
+ROW_PROJECTION = {
+    "_id": 1,
+    "title": 1,
+    "Number": 1,
+    "start": 1,
+    "end": 1,
+    "text": 1,
+}
+RERANK_PROJECTION = {**ROW_PROJECTION, "embedding": 1}
+
+
+def choose_index_kind(row_count: int) -> str:
+    if row_count <= FLAT_MAX_ROWS:
+        return "flat"
+    if row_count <= IVF_MAX_ROWS:
+        return "ivf"
+    return "hnsw"
+
+
+def resolve_quantization(quantization: Optional[str], row_count: int) -> str:
+    quantization = quantization or "none"
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    # PQ codebooks need thousands of training rows; small courses get sq8.
+    if quantization == "pq" and row_count < PQ_MIN_ROWS:
+        return "sq8"
+    return quantization
+
+
+def pq_subquantizers(dimension: int) -> int:
+    subquantizers = max(1, dimension // PQ_SUBVECTOR_DIMS)
+    while dimension % subquantizers:
+        subquantizers -= 1
+    return subquantizers
+
+
+def create_faiss_index(kind: str, dimension: int, row_count: int, quantization: str = "none"):
+    if faiss is None:
+        raise RuntimeError("faiss is required to build course indexes")
+
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    subquantizers = pq_subquantizers(dimension)
+    if kind == "flat":
+        if quantization == "sq8":
+            index = faiss.IndexScalarQuantizer(dimension, sq8)
+        elif quantization == "pq":
+            index = faiss.IndexPQ(dimension, subquantizers, 8)
+        else:
+            index = faiss.IndexFlatL2(dimension)
+    elif kind == "ivf":
+        nlist = max(1, min(int(4 * math.sqrt(row_count)), row_count // 39))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if quantization == "sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, sq8)
+        elif quantization == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, subquantizers, 8)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        index.nprobe = min(IVF_NPROBE, nlist)
+    elif kind == "hnsw":
+        if quantization == "sq8":
+            index = faiss.IndexHNSWSQ(dimension, sq8, HNSW_NEIGHBORS)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dimension, subquantizers, HNSW_NEIGHBORS)
+        else:
+            index = faiss.IndexHNSWFlat(dimension, HNSW_NEIGHBORS)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+    return index
+
+
+def training_sample(embeddings: np.ndarray, index) -> np.ndarray:
+    row_count = embeddings.shape[0]
+    sample_size = min(row_count, max(TRAIN_SAMPLE_ROWS, getattr(index, "nlist", 0) * 256))
+    if sample_size == row_count:
+        return np.ascontiguousarray(embeddings, dtype="float32")
+    sample_rows = np.sort(np.random.default_rng(0).choice(row_count, size=sample_size, replace=False))
+    return np.ascontiguousarray(embeddings[sample_rows], dtype="float32")
+
+
+def build_faiss_index_for(embeddings: np.ndarray, kind: str, quantization: str = "none"):
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    row_count, dimension = embeddings.shape
+    index = create_faiss_index(kind, dimension, row_count, quantization)
+    if not index.is_trained:
+        index.train(training_sample(embeddings, index))
+    index.add(embeddings)
+    return index
+
+
+def course_index_path(index_dir: str, course_collection: str) -> str:
+    return os.path.join(index_dir, course_collection)
+
+
+def current_index_dir(index_dir: str, course_collection: str) -> str:
+    # Directory holding the committed generation's files. Indexes written
+    # before generation directories keep their files in the course
+    # directory itself.
+    target_dir = course_index_path(index_dir, course_collection)
+    try:
+        with open(os.path.join(target_dir, INDEX_POINTER), "r", encoding="utf-8") as file:
+            return os.path.join(target_dir, file.read().strip())
+    except FileNotFoundError:
+        return target_dir
+
+
+def write_course_index(
+    index_dir: str,
+    course_collection: str,
+    index,
+    ids: np.ndarray,
+    meta: Dict[str, Any],
+    videos: VideoIndex,
+):
+    # All files of a generation are written to a fresh directory and
+    # committed by atomically replacing the pointer file, so a reader never
+    # pairs index.faiss with another generation's ids.npy. The previous
+    # directory is kept for readers still loading it; older ones are removed.
+    target_dir = course_index_path(index_dir, course_collection)
+    os.makedirs(target_dir, exist_ok=True)
+    previous_dir = current_index_dir(index_dir, course_collection)
+    generation_dir = tempfile.mkdtemp(prefix=f"{meta.get('generation', 0)}-", dir=target_dir)
+
+    faiss.write_index(index, os.path.join(generation_dir, "index.faiss"))
+    with open(os.path.join(generation_dir, "ids.npy"), "wb") as file:
+        np.save(file, ids)
+    videos.save(os.path.join(generation_dir, VIDEO_INDEX_FILE))
+    with open(os.path.join(generation_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+
+    pointer_file = os.path.join(target_dir, INDEX_POINTER)
+    with open(f"{pointer_file}.tmp", "w", encoding="utf-8") as file:
+        file.write(os.path.basename(generation_dir))
+    os.replace(f"{pointer_file}.tmp", pointer_file)
+
+    for name in os.listdir(target_dir):
+        path = os.path.join(target_dir, name)
+        if os.path.isdir(path) and path not in (generation_dir, previous_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def pack_object_ids(object_ids) -> np.ndarray:
+    return np.frombuffer(b"".join(object_id.binary for object_id in object_ids), dtype="uint8").reshape(-1, 12)
+
+
+def build_course_index(
+    db,
+    course_collection: str,
+    index_dir: str,
+    generation: int,
+    kind: Optional[str] = None,
+    quantization: Optional[str] = None,
+):
+    ids = []
+    vectors = []
+    titles = []
+    for document in db[course_collection].find({}, {"_id": 1, "title": 1, "embedding": 1}):
+        embedding = decode_vector(document.get("embedding"))
+        if embedding is None:
+            continue
+        ids.append(document["_id"])
+        vectors.append(embedding)
+        titles.append(str(document.get("title", "")))
+
+    if not vectors:
+        return None
+
+    embeddings = np.vstack(vectors)
+    kind = kind or choose_index_kind(len(ids))
+    quantization = resolve_quantization(quantization, len(ids))
+    index = build_faiss_index_for(embeddings, kind, quantization)
+    meta = {
+        "kind": kind,
+        "quantization": quantization,
+        "generation": generation,
+        "rows": len(ids),
+        "dimension": int(embeddings.shape[1]),
+    }
+    title_values, title_codes = np.unique(np.array(titles), return_inverse=True)
+    videos = VideoIndex.from_codes(title_values.tolist(), title_codes, embeddings)
+    write_course_index(index_dir, course_collection, index, pack_object_ids(ids), meta, videos)
+    return kind
+
+
+def append_course_index(
+    db,
+    course_collection: str,
+    index_dir: str,
+    generation: int,
+    inserted_ids,
+    inserted_vectors: np.ndarray,
+    quantization: Optional[str] = None,
+    inserted_titles: Optional[List[str]] = None,
+):
+    # Appends rows written since the previous generation. Anything else
+    # (missing or older index, a kind or quantization change at the new
+    # size, rows without titles for the video centroids) rebuilds.
+    target_dir = current_index_dir(index_dir, course_collection)
+    meta_file = os.path.join(target_dir, "meta.json")
+    meta = None
+    if os.path.exists(meta_file):
+        with open(meta_file, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+
+    row_count = (meta or {}).get("rows", 0) + len(inserted_ids)
+    videos = VideoIndex.load(os.path.join(target_dir, VIDEO_INDEX_FILE))
+    if (
+        meta is None
+        or videos is None
+        or (len(inserted_ids) and inserted_titles is None)
+        or int(meta.get("generation", -1)) != generation - 1
+        or meta.get("kind") != choose_index_kind(row_count)
+        or meta.get("quantization", "none") != resolve_quantization(quantization, row_count)
+    ):
+        return build_course_index(db, course_collection, index_dir, generation, quantization=quantization)
+
+    index = faiss.read_index(os.path.join(target_dir, "index.faiss"))
+    ids = np.load(os.path.join(target_dir, "ids.npy"))
+    if len(inserted_ids):
+        index.add(np.ascontiguousarray(inserted_vectors, dtype="float32"))
+        ids = np.concatenate([ids, pack_object_ids(inserted_ids)])
+        videos.add(inserted_titles, inserted_vectors)
+    meta.update({"generation": generation, "rows": int(ids.shape[0])})
+    write_course_index(index_dir, course_collection, index, ids, meta, videos)
+    return meta["kind"]
+
+
+class CourseIndex:
+    def __init__(self, index, ids: np.ndarray, meta: Dict[str, Any], videos: Optional[VideoIndex] = None):
+        self.index = index
+        self.ids = ids
+        self.meta = meta
+        self.videos = videos
+
+    @property
+    def generation(self) -> int:
+        return int(self.meta.get("generation", -1))
+
+    def search(self, question_embedding: List[float], k: int = 6, candidate_rows: Optional[np.ndarray] = None):
+        query = np.asarray(question_embedding, dtype="float32").reshape(1, -1)
+        if candidate_rows is None:
+            squared_distances, rows = self.index.search(query, k)
+        else:
+            squared_distances, rows = self.index.search(query, k, params=self._restricted_params(candidate_rows))
+        top_rows = []
+        top_distances = []
+        for row, squared_distance in zip(rows[0], squared_distances[0]):
+            if row < 0:
+                continue
+            top_rows.append(int(row))
+            top_distances.append(float(math.sqrt(max(float(squared_distance), 0.0))))
+        return top_rows, top_distances
+
+    def search_videos(
+        self,
+        question_embedding: List[float],
+        k: int,
+        top_videos: int,
+        min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+    ):
+        # First stage ranks video centroids, second searches only the rows
+        # of the top videos. Returns None when the full index should be
+        # searched instead: too few videos to prune, an index type without
+        # ID filtering, too few hits or a weak best hit.
+        if self.videos is None:
+            return None
+        candidate_rows = self.videos.candidate_rows(question_embedding, top_videos)
+        if candidate_rows is None:
+            return None
+        try:
+            rows, distances = self.search(question_embedding, k, candidate_rows)
+        except RuntimeError:
+            return None
+        if len(rows) < min(k, candidate_rows.size) or distance_confidence(distances[0]) < min_confidence:
+            return None
+        return rows, distances
+
+    def _restricted_params(self, rows: np.ndarray):
+        selector = faiss.IDSelectorBatch(np.asarray(rows, dtype="int64"))
+        kind = self.meta.get("kind")
+        if kind == "ivf":
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.index.nprobe)
+        if kind == "hnsw":
+            # Filtered graph walks drop most neighbours, so widen the beam.
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=HNSW_EF_SEARCH * 4)
+        return faiss.SearchParameters(sel=selector)
+
+    @property
+    def quantized(self) -> bool:
+        return self.meta.get("quantization", "none") != "none"
+
+    def search_records(
+        self,
+        collection,
+        question_embedding: List[float],
+        k: int = 6,
+        top_videos: int = 0,
+        min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+    ):
+        # Quantized distances are approximate, so those indexes over-fetch
+        # and the candidates are re-ranked by their stored full vectors.
+        candidate_count = k * RERANK_FACTORS[self.meta.get("quantization", "none")]
+        hits = None
+        if top_videos > 0:
+            hits = self.search_videos(question_embedding, candidate_count, top_videos, min_confidence)
+        rows, distances = hits or self.search(question_embedding, candidate_count)
+        object_ids = [ObjectId(self.ids[row].tobytes()) for row in rows]
+        projection = RERANK_PROJECTION if self.quantized else ROW_PROJECTION
+        documents = {
+            document["_id"]: document
+            for document in collection.find({"_id": {"$in": object_ids}}, projection)
+        }
+        top_records = []
+        top_distances = []
+        query = np.asarray(question_embedding, dtype="float32")
+        for object_id, distance in zip(object_ids, distances):
+            document = documents.get(object_id)
+            if document is None:
+                continue
+            if self.quantized:
+                vector = decode_vector(document.pop("embedding", None))
+                if vector is not None:
+                    distance = float(np.linalg.norm(vector - query))
+            top_records.append(document)
+            top_distances.append(distance)
+
+        if self.quantized:
+            order = sorted(range(len(top_records)), key=lambda position: top_distances[position])[:k]
+            top_records = [top_records[position] for position in order]
+            top_distances = [top_distances[position] for position in order]
+        return top_records, top_distances
+
+
+def load_course_index(index_dir: str, course_collection: str, generation: Optional[int] = None) -> Optional[CourseIndex]:
+    if faiss is None:
+        return None
+
+    # Every file is read from the one generation directory the pointer
+    # names. If a writer removes it meanwhile (two commits during one load),
+    # the load fails and callers fall back to the exact search.
+    target_dir = current_index_dir(index_dir, course_collection)
+    meta_file = os.path.join(target_dir, "meta.json")
+    try:
+        with open(meta_file, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+    except FileNotFoundError:
+        return None
+    if generation is not None and int(meta.get("generation", -1)) != generation:
+        return None
+
+    index_file = os.path.join(target_dir, "index.faiss")
+    try:
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            index = faiss.read_index(index_file)
+        ids = np.load(os.path.join(target_dir, "ids.npy"), mmap_mode="r")
+    except (OSError, RuntimeError):
+        return None
+    if meta.get("kind") == "hnsw":
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif meta.get("kind") == "ivf":
+        index.nprobe = min(IVF_NPROBE, index.nlist)
+
+    videos = VideoIndex.load(os.path.join(target_dir, VIDEO_INDEX_FILE))
+    return CourseIndex(index, ids, meta, videos)
+
+
+class CourseIndexCache:
+    # Loaded indexes are only served while their generation matches the
+    # course registry; otherwise callers fall back to the exact search.
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, generations: Optional[CourseGenerations] = None):
+        self.index_dir = index_dir
+        self.generations = generations or CourseGenerations()
+        self._entries: Dict[str, CourseIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db, course_collection: str) -> Optional[CourseIndex]:
+        generation = self.generations.current(db, course_collection)
+        with self._lock:
+            entry = self._entries.get(course_collection)
+        if entry is not None and entry.generation == generation:
+            return entry
+
+        entry = load_course_index(self.index_dir, course_collection, generation)
+        with self._lock:
+            if entry is None:
+                self._entries.pop(course_collection, None)
+                return None
+            self._entries[course_collection] = entry
+        return entry
@@ -0,0 +1,111 @@
+import argparse
+import json
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import MongoClient
+
+from course_cache import REGISTRY_COLLECTION
+
+
+COURSE_PREFIX = "course_embeddings_"
+ALL_COURSES = "*"
+
+REGISTRY_PROJECTION = {"_id": 1, "slug": 1, "name": 1, "rows": 1, "generation": 1, "updated_at": 1}
+
+
+def normalize_course_name(value: str) -> str:
+    cleaned = re.sub(r"[^a-z0-9_-]", "_", value.lower())
+    cleaned = re.sub(r"_+", "_", cleaned).strip("_")
+    return cleaned or "rag_basic"
+
+
+def to_display_name(slug: str) -> str:
+    words = [word for word in re.split(r"[_-]+", slug) if word]
+    if not words:
+        return "General"
+    return " ".join(word.capitalize() for word in words)
+
+
+def course_metadata(course_collection: str, rows: int, course_name: str = "") -> Optional[Dict[str, Any]]:
+    # Fields written next to the generation counter each time a course is
+    # stored; the registry is the source of truth for which courses exist.
+    # The display name is derived from the slug so it always normalizes back
+    # to the same collection; the name given at ingest is kept alongside.
+    # Collections outside the course namespace are not listed as courses.
+    if not course_collection.startswith(COURSE_PREFIX):
+        return None
+    slug = course_collection[len(COURSE_PREFIX):]
+    return {
+        "slug": slug,
+        "name": to_display_name(slug),
+        "course_name": course_name,
+        "rows": int(rows),
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def registered_courses(db) -> List[Dict[str, Any]]:
+    # Registry documents created before courses carried metadata only hold
+    # a generation and are skipped until backfilled.
+    courses = []
+    for document in db[REGISTRY_COLLECTION].find({"slug": {"$exists": True}}, REGISTRY_PROJECTION):
+        courses.append(
+            {
+                "id": document["slug"],
+                "name": document.get("name") or to_display_name(document["slug"]),
+                "collection": document["_id"],
+                "rows": int(document.get("rows", 0)),
+                "generation": int(document.get("generation", 0)),
+            }
+        )
+    courses.sort(key=lambda item: item["name"])
+    return courses
+
+
+def backfill_course_registry(db) -> int:
+    # One-off migration for databases written before the registry carried
+    # metadata: registers every course collection found by name prefix.
+    known = {document["_id"] for document in db[REGISTRY_COLLECTION].find({"slug": {"$exists": True}}, {"_id": 1})}
+    registered = 0
+    for collection_name in db.list_collection_names():
+        if not collection_name.startswith(COURSE_PREFIX) or collection_name in known:
+            continue
+        rows = db[collection_name].estimated_document_count()
+        db[REGISTRY_COLLECTION].update_one(
+            {"_id": collection_name},
+            {"$set": course_metadata(collection_name, rows)},
+            upsert=True,
+        )
+        registered += 1
+    return registered
+
+
+def resolve_course_collections(db, courses: Iterable[str]) -> List[str]:
+    # Maps course names or slugs, or ALL_COURSES for every registered
+    # course, to collection names without duplicates.
+    selected = []
+    for course in courses:
+        if course == ALL_COURSES:
+            selected.extend(entry["collection"] for entry in registered_courses(db))
+        else:
+            selected.append(f"{COURSE_PREFIX}{normalize_course_name(course)}")
+    return list(dict.fromkeys(selected))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or backfill the course registry.")
+    parser.add_argument("--mongo-uri", required=True)
+    parser.add_argument("--mongo-db", default="rag_basic")
+    parser.add_argument("--backfill", action="store_true", help="Register course collections found by name prefix.")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    try:
+        db = client[args.mongo_db]
+        if args.backfill:
+            backfill_course_registry(db)
+        print(json.dumps({"courses": registered_courses(db)}, default=str))
+    finally:
+        client.close()
@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+OLLAMA_EMBED_URL = os.getenv("OLLAMA_EMBED_URL", "http://localhost:11434/api/embed")
+
+
+class EmbeddingScheduler:
+    def __init__(
+        self,
+        url=OLLAMA_EMBED_URL,
+        model="bge-m3",
+        batch_size=32,
+        max_in_flight=4,
+        max_retries=3,
+        backoff_seconds=0.5,
+        timeout=120,
+    ):
+        self.url = url
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max(0, max_retries)
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+
+        self.chunks = 0
+        self.batches = 0
+        self.retries = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            chunks_per_second = self.chunks / self.busy_seconds if self.busy_seconds else 0.0
+            return {
+                "chunks": self.chunks,
+                "batches": self.batches,
+                "retries": self.retries,
+                "chunks_per_second": round(chunks_per_second, 1),
+            }
+
+    def embed(self, texts, on_batch=None):
+        texts = list(texts)
+        if not texts:
+            return []
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        started = time.perf_counter()
+        done = {"chunks": 0}
+
+        def run(batch):
+            vectors = self._post(batch)
+            with self._lock:
+                done["chunks"] += len(batch)
+                completed = done["chunks"]
+            if on_batch is not None:
+                elapsed = time.perf_counter() - started
+                on_batch(completed, len(texts), completed / elapsed if elapsed else 0.0)
+            return vectors
+
+        futures = [self.executor.submit(run, batch) for batch in batches]
+        results = []
+        try:
+            for future in futures:
+                results.extend(future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+
+        with self._lock:
+            self.chunks += len(texts)
+            self.batches += len(batches)
+            self.busy_seconds += time.perf_counter() - started
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def _post(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(
+                    self.url,
+                    json={"model": self.model, "input": batch},
+                    timeout=self.timeout,
+                )
+                response.raise_for_status()
+                embeddings = response.json().get("embeddings")
+                if embeddings is None or len(embeddings) != len(batch):
+                    raise RuntimeError("Embedding service returned an unexpected number of vectors")
+                return embeddings
+            except (requests.RequestException, RuntimeError, ValueError):
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.backoff_seconds * (2 ** attempt))
@@ -0,0 +1,193 @@
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+STORE_VERSION = 1
+STORE_DTYPES = ("float32", "float16")
+BLOCK_ROWS = 4096
+
+NUMERIC_COLUMNS = {"chunk_id": "int64", "start": "float64", "end": "float64"}
+CATEGORICAL_COLUMNS = ("source", "title", "Number")
+TEXT_COLUMNS = ("text", "original_text", "translated_text")
+OPTIONAL_TEXT_COLUMNS = ("original_text", "translated_text")
+
+
+def is_embedding_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, "meta.json"))
+
+
+class EmbeddingStoreWriter:
+    # Streams a fixed number of rows into a temporary directory: the vectors
+    # go straight into a memory-mapped .npy, numbers into per-column .npy
+    # files, titles/numbers/sources become int32 codes and texts are packed
+    # utf-8 with an offsets column. commit() swaps the directory into place.
+    def __init__(self, path: str, rows: int, dimension: int, dtype: str = "float32"):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {dtype}")
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.rows = rows
+        self.dimension = dimension
+        self.dtype = dtype
+        self.row = 0
+
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+        os.makedirs(self.temp_path)
+        self.embeddings = self._open_column("embeddings", dtype, (rows, dimension))
+        self.numeric = {name: self._open_column(name, column_dtype, (rows,)) for name, column_dtype in NUMERIC_COLUMNS.items()}
+        self.codes = {name: self._open_column(name, "int32", (rows,)) for name in CATEGORICAL_COLUMNS}
+        self.categories: Dict[str, Dict[str, int]] = {name: {} for name in CATEGORICAL_COLUMNS}
+        self.text_files = {name: open(os.path.join(self.temp_path, f"{name}.bin"), "wb") for name in TEXT_COLUMNS}
+        self.text_offsets = {name: self._open_column(f"{name}.offsets", "int64", (rows + 1,)) for name in TEXT_COLUMNS}
+        for offsets in self.text_offsets.values():
+            offsets[0] = 0
+
+    def append(self, records: Sequence[Dict[str, Any]], vectors) -> None:
+        count = len(records)
+        if self.row + count > self.rows:
+            raise ValueError("More rows written than the embedding store was sized for")
+        if count:
+            self.embeddings[self.row:self.row + count] = np.asarray(vectors, dtype="float32")
+
+        for offset, record in enumerate(records):
+            row = self.row + offset
+            for name in NUMERIC_COLUMNS:
+                self.numeric[name][row] = record.get(name) or 0
+            for name in CATEGORICAL_COLUMNS:
+                value = str(record.get(name, "") or "")
+                self.codes[name][row] = self.categories[name].setdefault(value, len(self.categories[name]))
+            for name in TEXT_COLUMNS:
+                encoded = str(record.get(name, "") or "").encode("utf-8")
+                self.text_files[name].write(encoded)
+                self.text_offsets[name][row + 1] = self.text_offsets[name][row] + len(encoded)
+        self.row += count
+
+    def commit(self) -> "EmbeddingStore":
+        if self.row != self.rows:
+            raise ValueError(f"Embedding store expected {self.rows} rows, got {self.row}")
+        for handle in self.text_files.values():
+            handle.close()
+        for column in [self.embeddings, *self.numeric.values(), *self.codes.values(), *self.text_offsets.values()]:
+            column.flush()
+        del self.embeddings, self.numeric, self.codes, self.text_offsets
+
+        meta = {
+            "version": STORE_VERSION,
+            "rows": self.rows,
+            "dimension": self.dimension,
+            "dtype": self.dtype,
+            "categories": {name: list(values) for name, values in self.categories.items()},
+        }
+        with open(os.path.join(self.temp_path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file, ensure_ascii=False)
+
+        replace_directory(self.temp_path, self.path)
+        return EmbeddingStore(self.path)
+
+    def abort(self) -> None:
+        for handle in self.text_files.values():
+            handle.close()
+        shutil.rmtree(self.temp_path, ignore_errors=True)
+
+    def _open_column(self, name: str, dtype: str, shape: Tuple[int, ...]) -> np.ndarray:
+        return np.lib.format.open_memmap(os.path.join(self.temp_path, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+
+def replace_directory(source: str, target: str) -> None:
+    # A directory cannot be renamed over a non-empty one, so the old store
+    # is moved aside first. Readers holding memory maps of the old files keep
+    # working until they close them.
+    previous = f"{target}.old"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.isdir(target):
+        os.rename(target, previous)
+    elif os.path.exists(target):
+        os.remove(target)
+    os.rename(source, target)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+class EmbeddingStore:
+    # Read side of the store. Every column is opened with np.load(mmap_mode)
+    # so nothing is read until it is touched, and vectors are handed out in
+    # float32 blocks of bounded size.
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.rows = int(meta["rows"])
+        self.dimension = int(meta["dimension"])
+        self.dtype = meta["dtype"]
+        self.categories: Dict[str, List[str]] = meta["categories"]
+
+        self.embeddings = self._load("embeddings")
+        self.numeric = {name: self._load(name) for name in NUMERIC_COLUMNS}
+        self.codes = {name: self._load(name) for name in CATEGORICAL_COLUMNS}
+        self.text_offsets = {name: self._load(f"{name}.offsets") for name in TEXT_COLUMNS}
+        self.text_blobs = {}
+        for name in TEXT_COLUMNS:
+            blob_path = os.path.join(path, f"{name}.bin")
+            if os.path.getsize(blob_path):
+                self.text_blobs[name] = np.memmap(blob_path, dtype="uint8", mode="r")
+            else:
+                self.text_blobs[name] = np.zeros(0, dtype="uint8")
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def text(self, row: int, column: str = "text") -> str:
+        offsets = self.text_offsets[column]
+        return self.text_blobs[column][int(offsets[row]):int(offsets[row + 1])].tobytes().decode("utf-8")
+
+    def category(self, column: str, row: int) -> str:
+        return self.categories[column][int(self.codes[column][row])]
+
+    def record(self, row: int) -> Dict[str, Any]:
+        record: Dict[str, Any] = {name: self.category(name, row) for name in CATEGORICAL_COLUMNS}
+        record["chunk_id"] = int(self.numeric["chunk_id"][row])
+        record["start"] = float(self.numeric["start"][row])
+        record["end"] = float(self.numeric["end"][row])
+        record["text"] = self.text(row)
+        for name in OPTIONAL_TEXT_COLUMNS:
+            value = self.text(row, name)
+            if value:
+                record[name] = value
+        return record
+
+    def iter_records(self, rows: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        for row in range(self.rows) if rows is None else rows:
+            yield self.record(int(row))
+
+    def source_mask(self, sources: Iterable[str]) -> np.ndarray:
+        wanted = set(sources)
+        codes = [code for code, value in enumerate(self.categories["source"]) if value in wanted]
+        return np.isin(self.codes["source"], codes)
+
+    def iter_vector_blocks(
+        self,
+        rows: Optional[np.ndarray] = None,
+        block_rows: int = BLOCK_ROWS,
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # Yields (row numbers, float32 vectors) so callers can add to an
+        # index or upload without materialising the whole matrix.
+        if rows is None:
+            for begin in range(0, self.rows, block_rows):
+                end = min(begin + block_rows, self.rows)
+                yield np.arange(begin, end), np.ascontiguousarray(self.embeddings[begin:end], dtype="float32")
+            return
+        rows = np.asarray(rows, dtype="int64")
+        for begin in range(0, rows.size, block_rows):
+            block = rows[begin:begin + block_rows]
+            yield block, np.ascontiguousarray(self.embeddings[block], dtype="float32")
+
+    def vectors(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if rows is None:
+            return np.asarray(self.embeddings, dtype="float32")
+        return np.ascontiguousarray(self.embeddings[np.asarray(rows, dtype="int64")], dtype="float32")
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
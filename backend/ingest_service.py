@@ -0,0 +1,431 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+
+DEFAULT_QUEUE_PATH = os.getenv(
+    "INGEST_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_jobs.sqlite3"),
+)
+JOB_STATES = ("queued", "running", "done", "failed")
+HEARTBEAT_SECONDS = 10.0
+# A running job whose worker has not checked in for this long is assumed to
+# belong to a worker that died (OOM, restart) and is queued again.
+STALE_SECONDS = 60.0
+DEFAULT_MAX_ATTEMPTS = 2
+POLL_SECONDS = 1.0
+
+JOB_COLUMNS = (
+    "id",
+    "status",
+    "label",
+    "argv",
+    "progress",
+    "error",
+    "worker",
+    "attempts",
+    "created_at",
+    "started_at",
+    "finished_at",
+    "heartbeat_at",
+)
+
+
+class JobQueue:
+    # Durable FIFO of process_videos runs in a SQLite file. Each job keeps the
+    # process_videos argument list it runs with and the latest progress
+    # payload the pipeline reported. Several processes may share one file;
+    # claim() hands every queued job to exactly one of them.
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit, with explicit transactions where a read and a write
+        # must not interleave with another process.
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                label TEXT NOT NULL DEFAULT '',
+                argv TEXT NOT NULL,
+                progress TEXT,
+                error TEXT,
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def submit(self, argv: Sequence[str], label: str = "") -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (id, status, label, argv, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, label, json.dumps(list(argv)), time.time()),
+            )
+        return self.get(job_id)
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        """
+                        UPDATE jobs
+                        SET status = 'running', worker = ?, attempts = attempts + 1,
+                            started_at = ?, heartbeat_at = ?, error = NULL
+                        WHERE id = ?
+                        """,
+                        (worker, now, now, row[0]),
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return None if row is None else self.get(row[0])
+
+    def heartbeat(self, job_id: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id),
+            )
+
+    def record_progress(self, job_id: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?",
+                (json.dumps(payload), time.time(), job_id),
+            )
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                ("failed" if error else "done", error, time.time(), job_id),
+            )
+
+    def requeue_stale(self, stale_seconds: float = STALE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        # Running jobs without a recent heartbeat go back to the queue, or
+        # fail once they have been started max_attempts times.
+        cutoff = time.time() - stale_seconds
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                failed = self._connection.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', error = 'Worker stopped while processing.', finished_at = ?
+                    WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?
+                    """,
+                    (time.time(), cutoff, max_attempts),
+                ).rowcount
+                requeued = self._connection.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat_at < ?",
+                    (cutoff,),
+                ).rowcount
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return failed + requeued
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = self._job(row)
+        if job["status"] == "queued":
+            job["position"] = self._position(job["created_at"])
+        return job
+
+    def jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+        params: List[Any] = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+        return [self._job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _position(self, created_at: float) -> int:
+        # Jobs queued ahead of this one.
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                (created_at,),
+            ).fetchone()[0]
+
+    @staticmethod
+    def _job(row: Sequence[Any]) -> Dict[str, Any]:
+        job = dict(zip(JOB_COLUMNS, row))
+        job["argv"] = json.loads(job["argv"])
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        return job
+
+
+def run_job(queue: JobQueue, job: Dict[str, Any], threads: int, trace_file: str = "") -> None:
+    # Imported here so the service process itself never loads torch; each
+    # worker process loads it, and its Whisper model, once.
+    from process_videos import build_parser, run_pipeline
+
+    # Bad argv fails the job instead of exiting the worker through argparse;
+    # otherwise the job would be requeued onto the next worker once its
+    # heartbeat went stale.
+    parser = build_parser()
+    usage = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(usage):
+            args = parser.parse_args(job["argv"])
+    except SystemExit:
+        lines = usage.getvalue().strip().splitlines()
+        error = lines[-1] if lines else "Invalid arguments."
+        queue.finish(job["id"], error.removeprefix(f"{parser.prog}: "))
+        return
+    if not args.ffmpeg_workers:
+        args.ffmpeg_workers = threads
+    if trace_file and not args.trace_file:
+        args.trace_file = trace_file
+
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            queue.heartbeat(job["id"])
+
+    heartbeat = threading.Thread(target=beat, name="ingest-heartbeat", daemon=True)
+    heartbeat.start()
+    try:
+        run_pipeline(args, on_progress=lambda payload: queue.record_progress(job["id"], payload))
+    except Exception as exc:
+        queue.finish(job["id"], str(exc) or exc.__class__.__name__)
+    else:
+        queue.finish(job["id"])
+    finally:
+        stop.set()
+        heartbeat.join()
+
+
+def worker_main(
+    queue_path: str,
+    worker: str,
+    threads: int,
+    trace_file: str = "",
+    poll_seconds: float = POLL_SECONDS,
+) -> None:
+    # Runs queued jobs one at a time. Whisper models stay loaded between jobs
+    # (transcription_engine.get_whisper_model), and torch is limited to this
+    # worker's share of the cores so workers do not oversubscribe the CPU.
+    # The service's stdout carries the request protocol, so everything the
+    # pipeline prints goes to stderr. IngestService.stop terminates workers;
+    # SIGTERM is turned into SystemExit so the worker still shuts down the
+    # shard pools a job started. A multiprocessing child never runs atexit
+    # handlers and waits for its pool processes before exiting, so this
+    # cannot be left to mp3_to_json's atexit hook.
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import torch
+
+    torch.set_num_threads(threads)
+    queue = JobQueue(queue_path)
+    try:
+        while True:
+            job = queue.claim(worker)
+            if job is None:
+                time.sleep(poll_seconds)
+                continue
+            print(f"[{worker}] Starting job {job['id']} {job['label']}".rstrip(), flush=True)
+            run_job(queue, job, threads, trace_file)
+    finally:
+        queue.close()
+        transcriber = sys.modules.get("mp3_to_json")
+        if transcriber is not None:
+            transcriber.shutdown_shard_pools()
+
+
+class IngestService:
+    # A fixed pool of worker processes pulling from one JobQueue. Workers
+    # that exit are restarted; their running job is re-queued once its
+    # heartbeat goes stale.
+    def __init__(self, queue_path: str, workers: int, threads_per_worker: int = 0, trace_file: str = ""):
+        self.queue_path = queue_path
+        self.trace_file = trace_file
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: Dict[str, multiprocessing.Process] = {}
+        self._stop = threading.Event()
+        self._supervisor = None
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self._start_worker(f"worker-{index}")
+        self._supervisor = threading.Thread(target=self._supervise, name="ingest-supervisor", daemon=True)
+        self._supervisor.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            process.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "alive": sum(process.is_alive() for process in self._processes.values()),
+            "threads_per_worker": self.threads_per_worker,
+        }
+
+    def _start_worker(self, name: str) -> None:
+        process = self._context.Process(
+            target=worker_main,
+            args=(self.queue_path, f"{name}:{os.getpid()}", self.threads_per_worker, self.trace_file),
+            name=name,
+        )
+        process.start()
+        self._processes[name] = process
+
+    def _supervise(self) -> None:
+        queue = JobQueue(self.queue_path)
+        try:
+            while not self._stop.wait(HEARTBEAT_SECONDS):
+                queue.requeue_stale()
+                for name, process in list(self._processes.items()):
+                    if not process.is_alive() and not self._stop.is_set():
+                        print(f"Restarting {name} (exit code {process.exitcode})", file=sys.stderr, flush=True)
+                        self._start_worker(name)
+        finally:
+            queue.close()
+
+
+def serve(queue: JobQueue, service: IngestService) -> None:
+    # Line-delimited JSON over stdin/stdout, like answer_question --serve.
+    # Requests are {"id": ..., "op": "submit", "argv": [...], "label": ...},
+    # {"id": ..., "op": "status", "job": ...}, {"id": ..., "op": "jobs",
+    # "status": ..., "limit": ...} and {"id": ..., "op": "stats"}. Each is
+    # answered with one event and closed with {"type": "done"}. The service
+    # stops when stdin closes; jobs it was running are resumed by the next
+    # one.
+    output_lock = threading.Lock()
+
+    def write_event(event: Dict[str, Any]):
+        with output_lock:
+            print(json.dumps(event, default=str), flush=True)
+
+    write_event({"type": "ready"})
+    for raw_line in sys.stdin:
+        raw_line = raw_line.strip()
+        if not raw_line:
+            continue
+        try:
+            request = json.loads(raw_line)
+        except json.JSONDecodeError as exc:
+            write_event({"type": "done", "ok": False, "error": f"Invalid request: {exc}"})
+            continue
+
+        request_id = request.get("id")
+        op = request.get("op")
+        try:
+            if op == "submit":
+                argv = request.get("argv")
+                if not isinstance(argv, list) or not argv:
+                    raise ValueError("submit needs the process_videos arguments as argv.")
+                event = {"type": "job", "job": queue.submit([str(item) for item in argv], str(request.get("label") or ""))}
+            elif op == "status":
+                job = queue.get(str(request.get("job") or ""))
+                if job is None:
+                    raise ValueError("Unknown job.")
+                event = {"type": "job", "job": job}
+            elif op == "jobs":
+                event = {"type": "jobs", "jobs": queue.jobs(request.get("status"), int(request.get("limit") or 50))}
+            elif op == "stats":
+                event = {"type": "stats", "jobs": queue.counts(), **service.stats()}
+            else:
+                raise ValueError(f"Unknown op: {op}")
+        except Exception as exc:
+            write_event({"id": request_id, "type": "done", "ok": False, "error": str(exc)})
+            continue
+        write_event({"id": request_id, **event})
+        write_event({"id": request_id, "type": "done", "ok": True})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue video ingestion jobs and run them on a fixed worker pool.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="SQLite file holding the job queue.")
+    parser.add_argument("--workers", type=int, default=1, help="Jobs processed at the same time.")
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=0,
+        help="CPU threads for torch and ffmpeg in each worker (0 = cores divided by workers).",
+    )
+    parser.add_argument("--trace-file", default="", help="Append each job's stage spans to this JSONL file.")
+    parser.add_argument("--status", default="", help="Print one job as JSON and exit.")
+    parser.add_argument("--list", action="store_true", help="Print recent jobs as JSON and exit.")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.queue)
+    try:
+        if args.status:
+            print(json.dumps(queue.get(args.status), default=str))
+            return
+        if args.list:
+            print(json.dumps(queue.jobs(), default=str))
+            return
+
+        service = IngestService(args.queue, args.workers, args.threads_per_worker, args.trace_file)
+        service.start()
+        try:
+            serve(queue, service)
+        finally:
+            service.stop()
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from course_cache import CourseGenerations
+
+
+KEYWORD_INDEX_FILE = "keywords.npz"
+KEYWORD_INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+MAX_TERM_FREQUENCY = 255
+
+# Identifiers keep their dotted form ("res.json") and are also split into
+# parts and camelCase pieces ("addEventListener" -> add, event, listener),
+# so both exact API names and the words inside them match.
+TOKEN_PATTERN = re.compile(r"[^\W\d][\w$]*(?:\.[^\W\d][\w$]*)*|\d+")
+CAMEL_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+STOPWORDS = frozenset(
+    """
+    a an and are as at be but by can do does for from how i if in into is it its of on or so that the
+    then there these this to vs was we what when where which who why will with you your
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text or ""):
+        token = match.group()
+        parts = token.split(".")
+        if len(parts) > 1:
+            tokens.append(token.lower())
+        for part in parts:
+            lower = part.lower()
+            if lower not in STOPWORDS:
+                tokens.append(lower)
+            pieces = CAMEL_PATTERN.findall(part)
+            if len(pieces) > 1:
+                tokens.extend(piece.lower() for piece in pieces if piece.lower() not in STOPWORDS)
+    return tokens
+
+
+def keyword_coverage(query: str, text: str) -> float:
+    terms = set(tokenize(query))
+    if not terms:
+        return 0.0
+    return len(terms.intersection(tokenize(text))) / len(terms)
+
+
+def smallest_unsigned(values: np.ndarray) -> np.ndarray:
+    maximum = int(values.max()) if values.size else 0
+    for dtype in ("uint8", "uint16", "uint32"):
+        if maximum <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype("uint64")
+
+
+class KeywordIndex:
+    # Inverted index over chunk text for one course. Postings are kept
+    # grouped by term (offsets[t]:offsets[t + 1]) as doc numbers and term
+    # frequencies; on disk doc numbers are delta-encoded per term and stored
+    # in the narrowest integer type that fits. Documents are identified by
+    # their Mongo ObjectId and grouped by source so one video can be
+    # replaced without re-tokenizing the rest of the course.
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        frequencies: np.ndarray,
+        doc_ids: np.ndarray,
+        doc_lengths: np.ndarray,
+        doc_sources: np.ndarray,
+        sources: List[str],
+        generation: int = -1,
+    ):
+        self.terms = terms
+        self.term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.frequencies = frequencies
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.doc_sources = doc_sources
+        self.sources = sources
+        self.generation = generation
+
+    @classmethod
+    def empty(cls) -> "KeywordIndex":
+        return cls(
+            [],
+            np.zeros(1, dtype="int64"),
+            np.zeros(0, dtype="int32"),
+            np.zeros(0, dtype="uint8"),
+            np.zeros((0, 12), dtype="uint8"),
+            np.zeros(0, dtype="uint32"),
+            np.zeros(0, dtype="int32"),
+            [],
+        )
+
+    def __len__(self) -> int:
+        return int(self.doc_lengths.size)
+
+    def add(self, object_ids: Sequence[ObjectId], sources: Sequence[str], texts: Sequence[str]) -> None:
+        existing_terms = self._posting_terms()
+        source_codes = {source: code for code, source in enumerate(self.sources)}
+        first_doc = len(self)
+        posting_terms = []
+        posting_docs = []
+        posting_frequencies = []
+        lengths = []
+        codes = []
+        for position, (source, text) in enumerate(zip(sources, texts)):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            code = source_codes.get(source)
+            if code is None:
+                code = source_codes[source] = len(self.sources)
+                self.sources.append(source)
+            codes.append(code)
+            for term, frequency in Counter(tokens).items():
+                term_id = self.term_ids.get(term)
+                if term_id is None:
+                    term_id = self.term_ids[term] = len(self.terms)
+                    self.terms.append(term)
+                posting_terms.append(term_id)
+                posting_docs.append(first_doc + position)
+                posting_frequencies.append(min(frequency, MAX_TERM_FREQUENCY))
+
+        if object_ids:
+            packed = np.frombuffer(b"".join(object_id.binary for object_id in object_ids), dtype="uint8")
+            self.doc_ids = np.concatenate([self.doc_ids, packed.reshape(-1, 12)])
+        self.doc_lengths = np.concatenate([self.doc_lengths, np.asarray(lengths, dtype="uint32")])
+        self.doc_sources = np.concatenate([self.doc_sources, np.asarray(codes, dtype="int32")])
+        self._rebuild_postings(
+            np.concatenate([existing_terms, np.asarray(posting_terms, dtype="int64")]),
+            np.concatenate([self.docs, np.asarray(posting_docs, dtype="int32")]),
+            np.concatenate([self.frequencies, np.asarray(posting_frequencies, dtype="uint8")]),
+        )
+
+    def remove_sources(self, sources: Iterable[str]) -> int:
+        wanted = set(sources)
+        codes = [code for code, source in enumerate(self.sources) if source in wanted]
+        removed = np.isin(self.doc_sources, codes)
+        if not removed.any():
+            return 0
+
+        keep = ~removed
+        renumbered = np.cumsum(keep, dtype="int64") - 1
+        posting_keep = keep[self.docs]
+        posting_terms = self._posting_terms()[posting_keep]
+        docs = renumbered[self.docs[posting_keep]].astype("int32")
+        frequencies = self.frequencies[posting_keep]
+
+        self.doc_ids = self.doc_ids[keep]
+        self.doc_lengths = self.doc_lengths[keep]
+        self.doc_sources = self.doc_sources[keep]
+        self._rebuild_postings(posting_terms, docs, frequencies)
+        return int(removed.sum())
+
+    def search(self, query: str, k: int = 20) -> Tuple[List[ObjectId], List[float]]:
+        if not len(self):
+            return [], []
+        term_ids = [self.term_ids[term] for term in dict.fromkeys(tokenize(query)) if term in self.term_ids]
+        if not term_ids:
+            return [], []
+
+        doc_count = len(self)
+        lengths = self.doc_lengths.astype("float32")
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(float(lengths.mean()), 1.0))
+        scores = np.zeros(doc_count, dtype="float32")
+        for term_id in term_ids:
+            begin, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs = self.docs[begin:end]
+            frequencies = self.frequencies[begin:end].astype("float32")
+            document_frequency = end - begin
+            idf = math.log(1 + (doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            scores[docs] += idf * frequencies * (BM25_K1 + 1) / (frequencies + length_norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if matched.size > k:
+            matched = matched[np.argpartition(scores[matched], -k)[-k:]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return (
+            [ObjectId(self.doc_ids[doc].tobytes()) for doc in matched],
+            [float(scores[doc]) for doc in matched],
+        )
+
+    def save(self, path: str) -> None:
+        terms_blob = "\n".join(self.terms).encode("utf-8")
+        first_docs = np.zeros(self.docs.size, dtype=bool)
+        first_docs[self.offsets[:-1][np.diff(self.offsets) > 0]] = True
+        gaps = np.diff(self.docs.astype("int64"), prepend=0)
+        gaps[first_docs] = self.docs[first_docs]
+        meta = {"version": KEYWORD_INDEX_VERSION, "generation": self.generation, "sources": self.sources}
+        with open(f"{path}.tmp", "wb") as file:
+            np.savez(
+                file,
+                meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype="uint8"),
+                terms=np.frombuffer(terms_blob, dtype="uint8"),
+                offsets=self.offsets,
+                doc_gaps=smallest_unsigned(gaps),
+                frequencies=self.frequencies,
+                doc_ids=self.doc_ids,
+                doc_lengths=smallest_unsigned(self.doc_lengths),
+                doc_sources=self.doc_sources,
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["KeywordIndex"]:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            if meta.get("version") != KEYWORD_INDEX_VERSION:
+                return None
+            terms_blob = data["terms"].tobytes().decode("utf-8")
+            offsets = data["offsets"]
+            gaps = data["doc_gaps"].astype("int64")
+            # Undo the per-term delta encoding: a running sum over all
+            # postings minus the running sum at the start of each term.
+            running = np.cumsum(gaps)
+            starts = np.concatenate([[0], running])[offsets[:-1]]
+            posting_terms = np.repeat(np.arange(offsets.size - 1), np.diff(offsets))
+            docs = (running - starts[posting_terms]).astype("int32")
+            return cls(
+                terms_blob.split("\n") if terms_blob else [],
+                offsets,
+                docs,
+                data["frequencies"],
+                data["doc_ids"],
+                data["doc_lengths"].astype("uint32"),
+                data["doc_sources"],
+                meta.get("sources", []),
+                int(meta.get("generation", -1)),
+            )
+
+    def _posting_terms(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.terms), dtype="int64"), np.diff(self.offsets))
+
+    def _rebuild_postings(self, posting_terms: np.ndarray, docs: np.ndarray, frequencies: np.ndarray) -> None:
+        # Drops terms left without postings and regroups postings by term,
+        # doc numbers ascending within each term.
+        counts = np.bincount(posting_terms, minlength=len(self.terms))
+        live = np.flatnonzero(counts)
+        if live.size != len(self.terms):
+            remap = np.full(len(self.terms), -1, dtype="int64")
+            remap[live] = np.arange(live.size)
+            posting_terms = remap[posting_terms]
+            self.terms = [self.terms[term_id] for term_id in live]
+            self.term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+            counts = counts[live]
+
+        order = np.lexsort((docs, posting_terms))
+        self.docs = docs[order].astype("int32")
+        self.frequencies = frequencies[order].astype("uint8")
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+
+
+def keyword_index_path(index_dir: str, course_collection: str) -> str:
+    return os.path.join(index_dir, course_collection, KEYWORD_INDEX_FILE)
+
+
+def build_keyword_index(db, course_collection: str, index_dir: str, generation: int) -> int:
+    index = KeywordIndex.empty()
+    object_ids, sources, texts = [], [], []
+    for document in db[course_collection].find({}, {"_id": 1, "source": 1, "text": 1}):
+        object_ids.append(document["_id"])
+        sources.append(str(document.get("source", "")))
+        texts.append(str(document.get("text", "")))
+    index.add(object_ids, sources, texts)
+    index.generation = generation
+    os.makedirs(os.path.join(index_dir, course_collection), exist_ok=True)
+    index.save(keyword_index_path(index_dir, course_collection))
+    return len(index)
+
+
+def update_keyword_index(
+    db,
+    course_collection: str,
+    index_dir: str,
+    generation: int,
+    sources: Optional[Iterable[str]],
+    object_ids: Sequence[ObjectId],
+    row_sources: Sequence[str],
+    texts: Sequence[str],
+) -> int:
+    # Replaces the postings of the given sources with the rows just written.
+    # A missing or out-of-date index, or a store without sources, rebuilds.
+    path = keyword_index_path(index_dir, course_collection)
+    index = KeywordIndex.load(path)
+    if sources is None or index is None or index.generation != generation - 1:
+        return build_keyword_index(db, course_collection, index_dir, generation)
+
+    index.remove_sources(sources)
+    index.add(object_ids, row_sources, texts)
+    index.generation = generation
+    index.save(path)
+    return len(index)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Any]], k: int = RRF_K) -> List[Tuple[Any, float]]:
+    # Each ranking is a best-first list of keys; a key scores
+    # sum(1 / (k + rank)) over the rankings it appears in.
+    scores: Dict[Any, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class KeywordIndexCache:
+    # Same contract as CourseIndexCache: an index is only served while its
+    # generation matches the course registry.
+    def __init__(self, index_dir: str, generations: Optional[CourseGenerations] = None):
+        self.index_dir = index_dir
+        self.generations = generations or CourseGenerations()
+        self._entries: Dict[str, KeywordIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db, course_collection: str) -> Optional[KeywordIndex]:
+        generation = self.generations.current(db, course_collection)
+        with self._lock:
+            entry = self._entries.get(course_collection)
+        if entry is not None and entry.generation == generation:
+            return entry
+
+        entry = KeywordIndex.load(keyword_index_path(self.index_dir, course_collection))
+        with self._lock:
+            if entry is None or entry.generation != generation:
+                self._entries.pop(course_collection, None)
+                return None
+            self._entries[course_collection] = entry
+        return entry
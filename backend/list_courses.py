@@ -1,43 +1,34 @@
 import argparse
 import json
-import re
 from pymongo import MongoClient
 
-COURSE_PREFIX = "course_embeddings_"
-
-
-def to_display_name(slug):
-    words = [word for word in re.split(r"[_-]+", slug) if word]
-    if not words:
-        return "General"
-    return " ".join(word.capitalize() for word in words)
+from course_registry import backfill_course_registry, registered_courses
 
 
 def list_courses(mongo_uri, mongo_db):
+    # Courses come from the registry written by store_embeddings; a database
+    # that predates it is backfilled from the collection names once.
     client = MongoClient(mongo_uri)
     try:
         db = client[mongo_db]
-        names = db.list_collection_names()
-        courses = []
-        for collection_name in names:
-            if not collection_name.startswith(COURSE_PREFIX):
-                continue
-            slug = collection_name[len(COURSE_PREFIX):]
-            courses.append(
-                {
-                    "id": slug,
-                    "name": to_display_name(slug),
-                    "collection": collection_name,
-                }
-            )
-        courses.sort(key=lambda item: item["name"])
-        return courses
+        courses = registered_courses(db)
+        if not courses and backfill_course_registry(db):
+            courses = registered_courses(db)
+        return [
+            {
+                "id": course["id"],
+                "name": course["name"],
+                "collection": course["collection"],
+                "rows": course["rows"],
+            }
+            for course in courses
+        ]
     finally:
         client.close()
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="List course collections from MongoDB")
+    parser = argparse.ArgumentParser(description="List registered courses from MongoDB")
     parser.add_argument("--mongo-uri", required=True)
     parser.add_argument("--mongo-db", default="rag_basic")
     args = parser.parse_args()
@@ -49,12 +49,50 @@
 #         json.dump(chunks_with_metaData, f, indent=4)
 
 import argparse
-import json
+import atexit
 import os
 import re
+import subprocess
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
 import torch
 import whisper
 
+from segment_log import SegmentLog, read_segments
+from transcript_io import SEGMENT_LOG_SUFFIX, transcript_path, write_debug_json, write_records
+from transcription_engine import align_segment_texts, get_whisper_model, transcribe_tasks
+
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".opus")
+# Sharded CPU transcription cuts long audio into pieces of about
+# DEFAULT_SHARD_SECONDS, each at the quietest SILENCE_FRAME_SECONDS frame
+# within SHARD_SEARCH_SECONDS of the nominal boundary.
+DEFAULT_SHARD_SECONDS = 300.0
+SHARD_SEARCH_SECONDS = 15.0
+SILENCE_FRAME_SECONDS = 0.05
+
+_shard_pools = {}
+_shard_pools_lock = threading.Lock()
+
+
+def load_audio(audio_path):
+    # 16 kHz mono PCM written by video_to_mp3 --format wav is already what
+    # Whisper wants, so read it directly instead of decoding through ffmpeg.
+    if audio_path.lower().endswith(".wav"):
+        with wave.open(audio_path, "rb") as wav_file:
+            if (
+                wav_file.getframerate() == whisper.audio.SAMPLE_RATE
+                and wav_file.getnchannels() == 1
+                and wav_file.getsampwidth() == 2
+            ):
+                frames = wav_file.readframes(wav_file.getnframes())
+                return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+    return whisper.load_audio(audio_path)
+
 
 def extract_metadata_from_filename(filename):
     stem, _ = os.path.splitext(filename)
@@ -70,6 +108,311 @@ def extract_metadata_from_filename(filename):
     return "", stem
 
 
+def list_audio_files(audio_dir, stems=None):
+    return [
+        audio
+        for audio in sorted(os.listdir(audio_dir))
+        if audio.lower().endswith(AUDIO_EXTENSIONS)
+        and (stems is None or os.path.splitext(audio)[0] in stems)
+    ]
+
+
+def segment_log_path(output_dir, stem):
+    return os.path.join(output_dir, f"{stem}{SEGMENT_LOG_SUFFIX}")
+
+
+def read_audio_window(audio_path, start_seconds, duration_seconds):
+    # Returns at most duration_seconds of 16 kHz mono audio starting at
+    # start_seconds without decoding the rest of the file.
+    sample_rate = whisper.audio.SAMPLE_RATE
+    if audio_path.lower().endswith(".wav"):
+        with wave.open(audio_path, "rb") as wav_file:
+            if (
+                wav_file.getframerate() == sample_rate
+                and wav_file.getnchannels() == 1
+                and wav_file.getsampwidth() == 2
+            ):
+                first = min(int(round(start_seconds * sample_rate)), wav_file.getnframes())
+                wav_file.setpos(first)
+                frames = wav_file.readframes(int(round(duration_seconds * sample_rate)))
+                return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+
+    command = [
+        "ffmpeg",
+        "-nostdin",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-ss",
+        f"{start_seconds:.3f}",
+        "-t",
+        f"{duration_seconds:.3f}",
+        "-i",
+        audio_path,
+        "-f",
+        "s16le",
+        "-ac",
+        "1",
+        "-ar",
+        str(sample_rate),
+        "-",
+    ]
+    output = subprocess.run(command, capture_output=True, check=True).stdout
+    return np.frombuffer(output, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def silence_cuts(samples, shard_seconds, search_seconds=SHARD_SEARCH_SECONDS):
+    # Sample offsets that split the audio into shards of about
+    # shard_seconds. Each cut is at the lowest-energy frame near the nominal
+    # boundary, so it lands in a pause rather than inside a word; a short
+    # tail is left on the last shard instead of becoming its own.
+    sample_rate = whisper.audio.SAMPLE_RATE
+    frame = int(SILENCE_FRAME_SECONDS * sample_rate)
+    frames = len(samples) // frame
+    shard_frames = int(shard_seconds / SILENCE_FRAME_SECONDS)
+    search_frames = int(search_seconds / SILENCE_FRAME_SECONDS)
+    if shard_frames <= 0 or frames <= shard_frames:
+        return []
+
+    framed = samples[: frames * frame].reshape(frames, frame)
+    energy = np.einsum("ij,ij->i", framed, framed)
+    cuts = []
+    last = 0
+    while last + shard_frames + shard_frames // 4 < frames:
+        target = last + shard_frames
+        low = max(last + 1, target - search_frames)
+        high = min(frames, target + search_frames + 1)
+        last = low + int(np.argmin(energy[low:high]))
+        cuts.append(last * frame)
+    return cuts
+
+
+def _start_shard_worker(model_name, threads):
+    torch.set_num_threads(threads)
+    get_whisper_model(model_name, "cpu")
+
+
+def _transcribe_shard(model_name, audio_path, start_seconds, duration_seconds, translate, capture_original, language):
+    model = get_whisper_model(model_name, "cpu")
+    audio_samples = read_audio_window(audio_path, start_seconds, duration_seconds)
+    return transcribe_samples(model, audio_samples, translate, capture_original, language, False)
+
+
+def get_shard_pool(model_name, workers, threads):
+    # Worker processes load their model once and are reused for every file
+    # transcribed with the same settings, until shutdown_shard_pools runs at
+    # exit.
+    key = (model_name, workers, threads)
+    with _shard_pools_lock:
+        pool = _shard_pools.get(key)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context("spawn"),
+                initializer=_start_shard_worker,
+                initargs=(model_name, threads),
+            )
+            _shard_pools[key] = pool
+        return pool
+
+
+@atexit.register
+def shutdown_shard_pools():
+    with _shard_pools_lock:
+        pools = list(_shard_pools.values())
+        _shard_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def transcribe_sharded(
+    audio_path,
+    model_name,
+    translate,
+    capture_original,
+    language,
+    workers,
+    threads=0,
+    shard_seconds=DEFAULT_SHARD_SECONDS,
+):
+    # CPU transcription of one long file across a process pool: the audio is
+    # cut at pauses, every shard is decoded by its own worker and the
+    # segments are shifted back to absolute times. Returns the same tuple as
+    # transcribe_samples.
+    sample_rate = whisper.audio.SAMPLE_RATE
+    audio_samples = load_audio(audio_path)
+    bounds = [0, *silence_cuts(audio_samples, shard_seconds), len(audio_samples)]
+    del audio_samples
+
+    # Shard workers split this process's torch thread budget, which an
+    # ingest worker has already limited to its share of the cores.
+    threads = threads or max(1, torch.get_num_threads() // workers)
+    pool = get_shard_pool(model_name, workers, threads)
+    shards = [(start / sample_rate, (end - start) / sample_rate) for start, end in zip(bounds, bounds[1:])]
+    futures = [
+        pool.submit(_transcribe_shard, model_name, audio_path, start, duration, translate, capture_original, language)
+        for start, duration in shards
+    ]
+
+    segments = []
+    original_texts = []
+    translated_texts = []
+    detected_language = language
+    for (start, duration), future in zip(shards, futures):
+        shard_segments, original_text, translated_text, shard_language = future.result()
+        detected_language = detected_language or shard_language
+        segments.extend(
+            {
+                **segment,
+                "start": round(start + segment["start"], 2),
+                "end": round(start + min(segment["end"], duration), 2),
+            }
+            for segment in shard_segments
+        )
+        original_texts.append(original_text)
+        translated_texts.append(translated_text)
+    return (
+        segments,
+        " ".join(text for text in original_texts if text),
+        " ".join(text for text in translated_texts if text),
+        detected_language,
+    )
+
+
+def stream_settings(model_name, translate, capture_original, language, window_seconds, overlap_seconds, audio_path):
+    # The audio file's size and mtime are part of the fingerprint, so a new
+    # upload under the same stem starts a fresh log instead of resuming the
+    # old transcript.
+    audio_stat = os.stat(audio_path)
+    return {
+        "model": model_name,
+        "translate": translate,
+        "capture_original": capture_original,
+        "language": language,
+        "window_seconds": window_seconds,
+        "overlap_seconds": overlap_seconds,
+        "audio_size": audio_stat.st_size,
+        "audio_mtime_ns": audio_stat.st_mtime_ns,
+    }
+
+
+def transcribe_samples(model, audio_samples, translate, capture_original, language, fp16):
+    translated_result = None
+    original_result = None
+    if translate and capture_original:
+        task_segments, language = transcribe_tasks(
+            model,
+            audio_samples,
+            tasks=("transcribe", "translate"),
+            language=language,
+            fp16=fp16,
+        )
+        original_result = {
+            "segments": task_segments["transcribe"],
+            "text": " ".join(segment["text"] for segment in task_segments["transcribe"]),
+        }
+        translated_result = {
+            "segments": task_segments["translate"],
+            "text": " ".join(segment["text"] for segment in task_segments["translate"]),
+        }
+    elif translate:
+        translated_result = model.transcribe(
+            audio_samples,
+            task="translate",
+            fp16=fp16,
+        )
+    else:
+        original_result = model.transcribe(
+            audio_samples,
+            task="transcribe",
+            language=language,
+            fp16=fp16,
+        )
+        language = original_result.get("language", language)
+
+    source_result = original_result or translated_result or {}
+    source_segments = source_result.get("segments", [])
+    if translated_result is None:
+        translated_texts = [""] * len(source_segments)
+    elif translated_result is source_result:
+        translated_texts = [segment.get("text", "") for segment in source_segments]
+    else:
+        translated_texts = align_segment_texts(source_segments, translated_result.get("segments", []))
+
+    segments = []
+    for segment, translated_text in zip(source_segments, translated_texts):
+        segment_text = segment.get("text", "").strip()
+        if not segment_text:
+            continue
+
+        translated_text = translated_text.strip()
+        segments.append(
+            {
+                "start": segment["start"],
+                "end": segment["end"],
+                "text": translated_text or segment_text,
+                "original_text": segment_text,
+                "translated_text": translated_text,
+            }
+        )
+
+    original_text = original_result.get("text", "").strip() if original_result else ""
+    translated_text = translated_result.get("text", "").strip() if translated_result else ""
+    return segments, original_text, translated_text, language
+
+
+def transcribe_audio_streaming(model, audio_path, log_path, number, title, settings, fp16=False):
+    # Decodes window + overlap seconds at a time and commits the segments
+    # that end inside the window; the overlap is decoded again as the start
+    # of the next block so words on the boundary keep their context. Only
+    # one block of audio is held in memory, and an interrupted run resumes
+    # from the last committed position.
+    translate = settings["translate"]
+    capture_original = settings["capture_original"]
+    language = settings["language"]
+    window_seconds = settings["window_seconds"]
+    overlap_seconds = settings["overlap_seconds"]
+    log = SegmentLog(log_path, settings=settings)
+    try:
+        if log.seek:
+            print(f"Resuming {os.path.basename(audio_path)} at {log.seek:.1f}s")
+        block_seconds = window_seconds + overlap_seconds
+        requested_samples = int(round(block_seconds * whisper.audio.SAMPLE_RATE))
+        while not log.done:
+            seek = log.seek
+            audio_samples = read_audio_window(audio_path, seek, block_seconds)
+            is_last = len(audio_samples) < requested_samples
+            segments, _, _, language = transcribe_samples(
+                model, audio_samples, translate, capture_original, language, fp16
+            )
+            segments = [
+                {
+                    "title": title,
+                    "Number": number,
+                    **segment,
+                    "start": round(seek + segment["start"], 2),
+                    "end": round(seek + segment["end"], 2),
+                }
+                for segment in segments
+            ]
+
+            if is_last:
+                log.commit(segments, seek + len(audio_samples) / whisper.audio.SAMPLE_RATE, done=True)
+                break
+
+            boundary = seek + window_seconds
+            committed = [segment for segment in segments if segment["end"] <= boundary]
+            if not committed and segments:
+                committed = segments[:1]
+            next_seek = committed[-1]["end"] if committed else boundary
+            if next_seek <= seek:
+                next_seek = boundary
+            log.commit(committed, next_seek)
+    finally:
+        log.close()
+    return log_path
+
+
 def transcribe_audio(
     audio_dir,
     output_dir,
@@ -80,18 +423,21 @@ def transcribe_audio(
     video_title=None,
     video_number=None,
     language=None,
+    stems=None,
+    stream_window=0.0,
+    stream_overlap=10.0,
+    debug_json_dir="",
+    shard_workers=0,
+    shard_threads=0,
+    shard_seconds=DEFAULT_SHARD_SECONDS,
 ):
     os.makedirs(output_dir, exist_ok=True)
+    # Sharding only helps on CPU; a GPU is already busy with one file.
+    sharded = shard_workers > 1 and device == "cpu" and not stream_window
 
-    print("Loading Whisper model:", model_name)
-    model = whisper.load_model(model_name).to(device)
-
-    audios = os.listdir(audio_dir)
-
-    for audio in audios:
-        if not audio.lower().endswith((".mp3", ".wav", ".m4a")):
-            continue
+    model = None if sharded else get_whisper_model(model_name, device)
 
+    for audio in list_audio_files(audio_dir, stems):
         inferred_number, inferred_title = extract_metadata_from_filename(audio)
         number = video_number or inferred_number
         title = video_title or inferred_title
@@ -99,82 +445,70 @@ def transcribe_audio(
         print("Processing:", number, title)
 
         audio_path = os.path.join(audio_dir, audio)
+        stem = os.path.splitext(audio)[0]
+        output_file = transcript_path(output_dir, stem)
 
-        
-        translated_result = None
-        original_result = None
-        if translate:
-            translated_result = model.transcribe(
+        if stream_window:
+            log_path = transcribe_audio_streaming(
+                model,
                 audio_path,
-                task="translate",
-                fp16=device == "cuda",
-            )
-            if capture_original:
-                original_result = model.transcribe(
+                segment_log_path(output_dir, stem),
+                number,
+                title,
+                stream_settings(
+                    model_name,
+                    translate,
+                    capture_original,
+                    language or None,
+                    stream_window,
+                    stream_overlap,
                     audio_path,
-                    task="transcribe",
-                    language=language if language else None,
-                    fp16=device == "cuda",
-                )
-        else:
-            original_result = model.transcribe(
-                audio_path,
-                task="transcribe",
-                language=language if language else None,
+                ),
                 fp16=device == "cuda",
             )
+            write_records(output_file, read_segments(log_path))
+            if debug_json_dir:
+                write_debug_json(os.path.join(debug_json_dir, f"{stem}.json"), read_segments(log_path))
+            print("Saved:", output_file)
+            continue
 
-
-        chunks = []
-
-        source_result = original_result or translated_result or {}
-        source_segments = source_result.get("segments", [])
-        translated_segments = translated_result.get("segments", []) if translated_result else []
-
-        for i, segment in enumerate(source_segments):
-            segment_text = segment.get("text", "").strip()
-            if not segment_text:
-                continue
-
-            translated_text = ""
-            if translated_result and i < len(translated_segments):
-                translated_text = translated_segments[i].get("text", "").strip()
-            final_text = translated_text or segment_text
-            chunks.append(
-                {
-                    "title": title,
-                    "Number": number,
-                    "start": segment["start"],
-                    "end": segment["end"],
-                    "text": final_text,
-                    "original_text": segment_text,
-                    "translated_text": translated_text,
-                }
+        if sharded:
+            segments, original_text, translated_text, _ = transcribe_sharded(
+                audio_path,
+                model_name,
+                translate,
+                capture_original,
+                language or None,
+                shard_workers,
+                shard_threads,
+                shard_seconds,
+            )
+        else:
+            audio_samples = load_audio(audio_path)
+            segments, original_text, translated_text, _ = transcribe_samples(
+                model,
+                audio_samples,
+                translate,
+                capture_original,
+                language or None,
+                device == "cuda",
+            )
+        chunks = [{"title": title, "Number": number, **segment} for segment in segments]
+        write_records(output_file, chunks)
+        if debug_json_dir:
+            write_debug_json(
+                os.path.join(debug_json_dir, f"{stem}.json"),
+                chunks,
+                original_text=original_text,
+                translated_text=translated_text,
             )
-
-        output_data = {
-            "original_text": original_result.get("text", "").strip()
-            if original_result
-            else "",
-            "translated_text": translated_result.get("text", "").strip()
-            if translated_result
-            else "",
-            "chunks": chunks,
-        }
-
-        output_file = os.path.join(
-            output_dir, f"{os.path.splitext(audio)[0]}.json"
-        )
-
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(output_data, f, indent=4, ensure_ascii=False)
 
         print("Saved:", output_file)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Transcribe audio files into JSON with translation + timestamps."
+        description="Transcribe audio files into JSONL segments with translation + timestamps."
     )
 
     parser.add_argument("--audio-dir", default="audio")
@@ -185,11 +519,27 @@ if __name__ == "__main__":
     parser.add_argument(
         "--capture-original",
         action="store_true",
-        help="When used with --translate, also run a second pass for original-language text.",
+        help="When used with --translate, also decode original-language text from the same encoder pass.",
     )
     parser.add_argument("--video-title", default="")
     parser.add_argument("--video-number", default="")
     parser.add_argument("--language", default="")
+    parser.add_argument(
+        "--stream-window",
+        type=float,
+        default=0.0,
+        help="Transcribe in windows of this many seconds, appending segments to <stem>.segments.jsonl (0 = whole file).",
+    )
+    parser.add_argument("--stream-overlap", type=float, default=10.0, help="Seconds of overlap between windows.")
+    parser.add_argument("--debug-json-dir", default="", help="Also write pretty-printed JSON transcripts here.")
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        default=0,
+        help="On CPU, split each file at pauses and transcribe the pieces in this many processes (0 or 1 = off).",
+    )
+    parser.add_argument("--shard-threads", type=int, default=0, help="Torch threads per shard worker (0 = torch threads / workers).")
+    parser.add_argument("--shard-seconds", type=float, default=DEFAULT_SHARD_SECONDS, help="Target shard length in seconds.")
 
     args = parser.parse_args()
 
@@ -201,9 +551,15 @@ if __name__ == "__main__":
         args.output_dir,
         args.model,
         resolved_device,
-        args.translate,
-        args.capture_original,
+        capture_original=args.capture_original,
+        translate=args.translate,
         video_title=args.video_title or None,
         video_number=args.video_number or None,
         language=args.language or None,
+        stream_window=args.stream_window,
+        stream_overlap=args.stream_overlap,
+        debug_json_dir=args.debug_json_dir,
+        shard_workers=args.shard_workers,
+        shard_threads=args.shard_threads,
+        shard_seconds=args.shard_seconds,
     )
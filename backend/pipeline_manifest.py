@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import time
+
+
+SOURCE_KINDS = ("video", "audio", "json")
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_fingerprint(content_hash, config):
+    payload = json.dumps({"content": content_hash, "config": config}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PipelineManifest:
+    # Per-video record of the source content hash plus, for each stage, the
+    # fingerprint (content hash + stage configuration, including model
+    # versions) and the files it produced.
+    def __init__(self, path):
+        self.path = path
+        self.data = {"version": 1, "items": {}}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.data = json.load(file)
+
+    @property
+    def items(self):
+        return self.data.setdefault("items", {})
+
+    def observe(self, key, source_kind, path):
+        # A source that was deleted after processing (cleanup of videos or
+        # audio) must not make its derived files look like new content, so
+        # a more upstream hash already on record wins over a downstream one.
+        item = self.items.setdefault(key, {"stages": {}})
+        recorded_kind = item.get("source_kind")
+        if (
+            recorded_kind in SOURCE_KINDS
+            and SOURCE_KINDS.index(recorded_kind) < SOURCE_KINDS.index(source_kind)
+        ):
+            return item["content_hash"]
+
+        stat = os.stat(path)
+        source = {"kind": source_kind, "path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+        if item.get("source") == source and item.get("content_hash"):
+            return item["content_hash"]
+
+        item["source_kind"] = source_kind
+        item["source"] = source
+        item["content_hash"] = file_sha256(path)
+        return item["content_hash"]
+
+    def fingerprint(self, key, config):
+        return config_fingerprint(self.items[key]["content_hash"], config)
+
+    def is_current(self, key, stage, config):
+        entry = self.items.get(key, {}).get("stages", {}).get(stage)
+        return bool(entry) and entry.get("fingerprint") == self.fingerprint(key, config)
+
+    def outputs_exist(self, key, stage):
+        entry = self.items.get(key, {}).get("stages", {}).get(stage)
+        return bool(entry) and all(os.path.exists(path) for path in entry.get("outputs", []))
+
+    def record(self, key, stage, config, outputs=()):
+        self.items[key].setdefault("stages", {})[stage] = {
+            "fingerprint": self.fingerprint(key, config),
+            "config": config,
+            "outputs": list(outputs),
+            "completed_at": time.time(),
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.data, file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
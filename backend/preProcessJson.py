@@ -34,50 +34,121 @@
 #     df = pd.DataFrame(my_dicts)
 #     joblib.dump(df, "embeddings.joblib")
 import argparse
-import requests
 import os
 import json
-import pandas as pd
-import joblib
-
-def create_embedding(text_list):
-    r = requests.post(
-        "http://localhost:11434/api/embed",
-        json={"model": "bge-m3", "input": text_list}
-    )
-    return r.json()["embeddings"]
-
-
-def create_embeddings_from_json(json_dir, output_path):
-    jsons = os.listdir(json_dir)
-    my_dicts = []
+import numpy as np
+
+from embedding_cache import DEFAULT_CACHE_PATH, EmbeddingCache
+from embedding_store import BLOCK_ROWS, STORE_DTYPES, EmbeddingStore, EmbeddingStoreWriter, is_embedding_store
+from embedding_scheduler import EmbeddingScheduler
+from transcript_io import iter_records, list_transcripts
+
+EMBEDDING_MODEL = "bge-m3"
+
+
+def create_embeddings_from_json(
+    json_dir,
+    output_path,
+    embedding_cache_path=DEFAULT_CACHE_PATH,
+    scheduler=None,
+    on_progress=None,
+    stems=None,
+    append=False,
+    dtype="float32",
+):
+    existing = None
+    kept_rows = np.zeros(0, dtype="int64")
     chunk_id = 0
+    if append and is_embedding_store(output_path):
+        existing = EmbeddingStore(output_path)
+        if stems is not None:
+            kept_rows = np.flatnonzero(~existing.source_mask(stems))
+        else:
+            kept_rows = np.arange(len(existing))
+        if kept_rows.size:
+            chunk_id = int(existing.numeric["chunk_id"][kept_rows].max()) + 1
+
+    embedding_cache = EmbeddingCache(embedding_cache_path or "")
+    owns_scheduler = scheduler is None
+    if owns_scheduler:
+        scheduler = EmbeddingScheduler(model=EMBEDDING_MODEL)
 
-    for json_file in jsons:
-        if not json_file.endswith(".json"):
-            continue
-        with open(os.path.join(json_dir, json_file)) as f:
-            content = json.load(f)
-
-        print(f"Creating Embeddings for {json_file}")
-        embeddings = create_embedding([c['text'] for c in content['chunks']])
+    my_dicts = []
 
-        for i, chunk in enumerate(content['chunks']):
+    for source, json_file in list_transcripts(json_dir, stems).items():
+        print(f"Queueing chunks for {os.path.basename(json_file)}")
+        for chunk in iter_records(json_file):
+            chunk['source'] = source
             chunk['chunk_id'] = chunk_id
-            chunk['embedding'] = embeddings[i]
             chunk_id += 1
             my_dicts.append(chunk)
-        
 
-    df = pd.DataFrame(my_dicts)
-    joblib.dump(df, output_path)
-    return df
+    # Chunks are embedded in blocks that are written straight into the
+    # memory-mapped store, so only one block of vectors is held at a time.
+    # Each block is still many scheduler batches, which keeps the embedding
+    # server busy across file boundaries.
+    writer = None
+    total = len(my_dicts)
+
+    def open_writer(dimension):
+        store_writer = EmbeddingStoreWriter(output_path, int(kept_rows.size) + total, dimension, dtype)
+        if existing is not None:
+            for rows, vectors in existing.iter_vector_blocks(kept_rows):
+                store_writer.append([existing.record(row) for row in rows], vectors)
+        return store_writer
+
+    def block_progress(offset):
+        if on_progress is None:
+            return None
+        return lambda done, _, rate: on_progress(offset + done, total, rate)
+
+    try:
+        for begin in range(0, total, BLOCK_ROWS):
+            block = my_dicts[begin:begin + BLOCK_ROWS]
+            embeddings = embedding_cache.embed(
+                [chunk['text'] for chunk in block],
+                EMBEDDING_MODEL,
+                lambda texts: scheduler.embed(texts, on_batch=block_progress(begin)),
+            )
+            if writer is None:
+                writer = open_writer(len(embeddings[0]))
+            writer.append(block, embeddings)
+        if writer is None:
+            writer = open_writer(existing.dimension if existing is not None else 0)
+        return writer.commit()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        print("Embedding cache:", json.dumps(embedding_cache.stats()))
+        embedding_cache.close()
+        if owns_scheduler:
+            scheduler.close()
 
 
 if __name__ == "__main__":   # 🔐 THIS IS THE KEY
     parser = argparse.ArgumentParser(description="Create embeddings from JSON chunks.")
-    parser.add_argument("--json-dir", default="new_jsons", help="Directory with JSON chunks.")
-    parser.add_argument("--output", default="embeddings.joblib", help="Output path for embeddings.")
+    parser.add_argument("--json-dir", default="new_jsons", help="Directory with JSONL (or legacy JSON) chunks.")
+    parser.add_argument("--output", default="embeddings", help="Output directory for the embedding store.")
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default="float32", help="On-disk vector precision.")
+    parser.add_argument(
+        "--embedding-cache",
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite file for cached chunk embeddings (empty for memory only).",
+    )
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks per embedding request.")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Concurrent embedding requests.")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per failed embedding request.")
     args = parser.parse_args()
 
-    create_embeddings_from_json(args.json_dir, args.output)
+    scheduler = EmbeddingScheduler(
+        model=EMBEDDING_MODEL,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        max_retries=args.retries,
+    )
+    try:
+        create_embeddings_from_json(args.json_dir, args.output, args.embedding_cache, scheduler=scheduler, dtype=args.dtype)
+    finally:
+        scheduler.close()
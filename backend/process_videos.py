@@ -2,63 +2,116 @@ import argparse
 import json
 import os
 import shutil
+import threading
 import time
 import sys
 import faiss
-import joblib
 import numpy as np
 import torch
 
-from mp3_to_json import transcribe_audio
-from preProcessJson import create_embeddings_from_json
-from video_to_mp3 import convert_videos_to_audio
+from mp3_to_json import (
+    AUDIO_EXTENSIONS,
+    DEFAULT_SHARD_SECONDS,
+    list_audio_files,
+    segment_log_path,
+    stream_settings,
+    transcribe_audio,
+)
+from preProcessJson import EMBEDDING_MODEL, create_embeddings_from_json
+from video_to_mp3 import AUDIO_FORMATS, VIDEO_EXTENSIONS, audio_stem_for, convert_videos_to_audio
 from store_embeddings import store_embeddings
+from course_index import DEFAULT_INDEX_DIR, QUANTIZATIONS, create_faiss_index, resolve_quantization, training_sample
+from embedding_cache import DEFAULT_CACHE_PATH, EmbeddingCache
+from embedding_scheduler import EmbeddingScheduler
+from embedding_store import STORE_DTYPES, EmbeddingStore
+from pipeline_manifest import SOURCE_KINDS, PipelineManifest
+from chunker import (
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_MIN_TOKENS,
+    DEFAULT_OVERLAP_TOKENS,
+    DEFAULT_SILENCE_GAP,
+    merge_segment_stream,
+    semantic_chunks,
+    with_segment_embeddings,
+)
+from segment_log import follow_segments
+from stage_pipeline import DEFAULT_QUEUE_SIZE, Stage, StagePipeline
+from tracing import Tracer
+from transcript_io import iter_records, list_transcripts, transcript_path, write_debug_json, write_records
 
 
-def merge_chunks(input_dir, output_dir, merge_size):
+def merge_chunks(input_dir, output_dir, merge_size, stems=None, chunker=None, debug_json_dir=""):
+    # Streams each transcript through the chunker into a JSONL file of
+    # chunks, one file at a time.
     os.makedirs(output_dir, exist_ok=True)
-    for filename in os.listdir(input_dir):
-        if not filename.endswith(".json"):
-            continue
+    for stem, file_path in list_transcripts(input_dir, stems).items():
+        segments = iter_records(file_path)
+        if chunker is None:
+            merged_chunks = merge_segment_stream(segments, merge_size)
+        else:
+            merged_chunks = chunker(segments)
 
-        file_path = os.path.join(input_dir, filename)
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        output_path = transcript_path(output_dir, stem)
+        write_records(output_path, merged_chunks)
+        if debug_json_dir:
+            write_debug_json(os.path.join(debug_json_dir, f"{stem}.json"), iter_records(output_path))
 
-        chunks = data.get("chunks", [])
-        merged_chunks = []
 
-        for i in range(0, len(chunks), merge_size):
-            group = chunks[i:i + merge_size]
-            if not group:
-                continue
+def merges_segments(args):
+    return args.chunker == "semantic" or args.merge_size > 1
 
-            merged_chunks.append({
-                "title": group[0]["title"],
-                "Number": group[0]["Number"],
-                "start": group[0]["start"],
-                "end": group[-1]["end"],
-                "text": " ".join(segment["text"] for segment in group)
-            })
-
-        data_improved = {
-            "chunks": merged_chunks,
-            "text": data.get("text", "")
-        }
 
-        with open(os.path.join(output_dir, filename), "w", encoding="utf-8") as f:
-            json.dump(data_improved, f, indent=4)
+def make_chunker(args, embed_fn=None):
+    if args.chunker == "fixed":
+        return lambda segments: merge_segment_stream(segments, args.merge_size)
+
+    def chunk(segments):
+        if args.split_similarity is not None and embed_fn is not None:
+            segments = with_segment_embeddings(segments, embed_fn)
+        return semantic_chunks(
+            segments,
+            max_tokens=args.chunk_tokens,
+            overlap_tokens=args.chunk_overlap,
+            min_tokens=args.chunk_min_tokens,
+            silence_gap=args.silence_gap,
+            similarity_threshold=args.split_similarity,
+        )
+
+    return chunk
 
 
-def build_faiss_index(embeddings_path, index_path):
-    df = joblib.load(embeddings_path)
-    embeddings = np.vstack(df["embedding"].values).astype("float32")
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
+def build_faiss_index(embeddings_path, index_path, appended_sources=None, quantization="none"):
+    store = EmbeddingStore(embeddings_path)
+    quantization = resolve_quantization(quantization, len(store))
+    expected = create_faiss_index("flat", store.dimension, len(store), quantization)
+    if appended_sources is not None and os.path.exists(index_path):
+        # create_embeddings_from_json(append=True) keeps untouched rows first
+        # and appends re-embedded sources at the end, so the existing index is
+        # still valid whenever it covers exactly the untouched prefix and
+        # encodes vectors the same way.
+        is_new = store.source_mask(appended_sources)
+        kept_rows = int((~is_new).sum())
+        index = faiss.read_index(index_path)
+        if (
+            index.ntotal == kept_rows
+            and not is_new[:kept_rows].any()
+            and getattr(index, "code_size", None) == getattr(expected, "code_size", None)
+        ):
+            if is_new.any():
+                for _, vectors in store.iter_vector_blocks(np.flatnonzero(is_new)):
+                    index.add(vectors)
+                faiss.write_index(index, index_path)
+            return
+
+    index = expected
+    if not index.is_trained:
+        index.train(training_sample(store.embeddings, index))
+    for _, vectors in store.iter_vector_blocks():
+        index.add(vectors)
     faiss.write_index(index, index_path)
 
 
-def emit_progress(step, step_index, total_steps, start_time):
+def progress_payload(step, step_index, total_steps, start_time, **metrics):
     elapsed = time.perf_counter() - start_time
     eta_seconds = None
     if step_index:
@@ -71,8 +124,14 @@ def emit_progress(step, step_index, total_steps, start_time):
         "elapsed_seconds": round(elapsed, 1),
         "eta_seconds": round(eta_seconds, 1) if eta_seconds is not None else None,
     }
+    payload.update(metrics)
+    return payload
+
+
+def print_event(payload):
     print(json.dumps(payload), flush=True)
 
+
 def emit_error(message):
     print(json.dumps({"type": "error", "message": message}), flush=True)
 
@@ -91,45 +150,450 @@ def cleanup_dir(target_dir):
     shutil.rmtree(target_dir, ignore_errors=True)
 
 
-def run_pipeline(args):
+STAGE_REQUIRED_SOURCE = {"video_to_audio": "video", "transcribe": "audio"}
+
+
+def incremental_stage_configs(args):
+    configs = {"video_to_audio": {"audio_format": args.audio_format}}
+    configs["transcribe"] = {
+        **configs["video_to_audio"],
+        "whisper_model": args.model,
+        "translate": args.translate,
+        "capture_original": args.capture_original,
+        "language": args.language,
+        "video_title": args.video_title,
+        "video_number": args.video_number,
+    }
+    if args.stream_window:
+        configs["transcribe"]["stream_window"] = args.stream_window
+        configs["transcribe"]["stream_overlap"] = args.stream_overlap
+    elif args.shard_workers > 1:
+        # Shard boundaries change the segments; the worker count does not.
+        configs["transcribe"]["shard_seconds"] = args.shard_seconds
+    if args.chunker == "fixed":
+        configs["merge_chunks"] = {**configs["transcribe"], "merge_size": args.merge_size}
+    else:
+        configs["merge_chunks"] = {
+            **configs["transcribe"],
+            "chunker": "semantic",
+            "chunk_tokens": args.chunk_tokens,
+            "chunk_overlap": args.chunk_overlap,
+            "chunk_min_tokens": args.chunk_min_tokens,
+            "silence_gap": args.silence_gap,
+        }
+        if args.split_similarity is not None:
+            configs["merge_chunks"]["split_similarity"] = args.split_similarity
+            configs["merge_chunks"]["embedding_model"] = EMBEDDING_MODEL
+    chunk_config = configs["merge_chunks"] if merges_segments(args) else configs["transcribe"]
+    configs["create_embeddings"] = {
+        **chunk_config,
+        "embedding_model": EMBEDDING_MODEL,
+        "embeddings_output": os.path.abspath(args.embeddings_output),
+        "embedding_dtype": args.embedding_dtype,
+    }
+    configs["build_faiss"] = {
+        **configs["create_embeddings"],
+        "faiss_output": os.path.abspath(args.faiss_output),
+        "index_quantization": args.index_quantization,
+    }
+    configs["store_embeddings"] = {
+        **configs["create_embeddings"],
+        "mongo_db": args.mongo_db,
+        "mongo_collection": args.mongo_collection,
+        "course_name": args.course_name,
+    }
+    return configs
+
+
+def discover_sources(args):
+    # {stem: (kind, path)} for every item, keeping its most upstream source.
+    sources = {}
+    locations = (
+        ("video", args.video_dir, VIDEO_EXTENSIONS),
+        ("audio", args.audio_dir, AUDIO_EXTENSIONS),
+    )
+    for kind, directory, extensions in locations:
+        if not directory or not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.lower().endswith(extensions):
+                continue
+            stem = audio_stem_for(filename) if kind == "video" else os.path.splitext(filename)[0]
+            if stem not in sources:
+                sources[stem] = (kind, os.path.join(directory, filename))
+    for stem, path in list_transcripts(args.json_dir).items():
+        if stem not in sources:
+            sources[stem] = ("json", path)
+    return sources
+
+
+def discover_pipeline_items(args, manifest):
+    sources = {}
+    for stem, (kind, path) in discover_sources(args).items():
+        sources[stem] = kind
+        manifest.observe(stem, kind, path)
+    return sources
+
+
+def plan_incremental_run(args, manifest, stage_inputs, configs):
+    stage_order = list(stage_inputs)
+    dependents = {stage: [other for other in stage_order if stage_inputs[other] == stage] for stage in stage_order}
+    plan = {stage: set() for stage in stage_order}
+
+    for stem, source_kind in discover_pipeline_items(args, manifest).items():
+        needed = {}
+        for stage in reversed(stage_order):
+            required_kind = STAGE_REQUIRED_SOURCE.get(stage, "json")
+            current = manifest.is_current(stem, stage, configs[stage])
+            if SOURCE_KINDS.index(required_kind) < SOURCE_KINDS.index(source_kind):
+                # The input for this stage is gone; downstream stages reuse
+                # whatever it produced last time.
+                if not current and stage in manifest.items[stem].get("stages", {}):
+                    print(f"Cannot refresh {stage} for {stem}: its {required_kind} source is missing", file=sys.stderr)
+                needed[stage] = False
+                continue
+            downstream_needed = any(needed[other] for other in dependents[stage])
+            needed[stage] = not current or (downstream_needed and not manifest.outputs_exist(stem, stage))
+
+        for stage, is_needed in needed.items():
+            if is_needed:
+                plan[stage].add(stem)
+    return plan
+
+
+def run_pipeline(args, on_progress=print_event):
+    # on_progress receives every progress payload; by default they are
+    # printed as JSON lines.
     resolved_device = args.device or ("cuda" if torch.cuda.is_available() else "cpu")
-    steps = [
-        ("video_to_audio", lambda: convert_videos_to_audio(args.video_dir, args.audio_dir, args.overwrite_audio)),
-        ("cleanup_video", lambda: cleanup_dir(args.video_dir)),
-        (
-            "transcribe",
-            lambda: transcribe_audio(
-                audio_dir=args.audio_dir,
-                output_dir=args.json_dir,
-                model_name=args.model,
-                device=resolved_device,
-                capture_original=args.capture_original,
-                translate=args.translate,
-                video_title=args.video_title or None,
-                video_number=args.video_number or None,
-                language=args.language or None,                
+    embeddings_dir = args.improved_json_dir if merges_segments(args) else args.json_dir
+
+    stage_inputs = {"video_to_audio": None, "transcribe": "video_to_audio"}
+    if merges_segments(args):
+        stage_inputs["merge_chunks"] = "transcribe"
+        stage_inputs["create_embeddings"] = "merge_chunks"
+    else:
+        stage_inputs["create_embeddings"] = "transcribe"
+    stage_inputs["build_faiss"] = "create_embeddings"
+    if args.mongo_uri:
+        stage_inputs["store_embeddings"] = "create_embeddings"
+
+    # One trace per run: a span per step and, with --pipeline, per video and
+    # stage. Its stage timings are in the final "done" progress payload.
+    tracer = Tracer(args.trace_file)
+    trace = tracer.start(
+        "ingest",
+        collection=args.mongo_collection,
+        video_title=args.video_title,
+        pipeline=args.pipeline,
+        device=resolved_device,
+    )
+
+    manifest = None
+    plan = None
+    configs = incremental_stage_configs(args)
+    if args.manifest:
+        manifest = PipelineManifest(args.manifest)
+        plan = plan_incremental_run(args, manifest, stage_inputs, configs)
+        manifest.save()
+
+    audio_extension = AUDIO_FORMATS[args.audio_format][0]
+    stage_outputs = {
+        "video_to_audio": lambda stem: [os.path.join(args.audio_dir, f"{stem}{audio_extension}")],
+        "transcribe": lambda stem: [transcript_path(args.json_dir, stem)],
+        "merge_chunks": lambda stem: [transcript_path(args.improved_json_dir, stem)],
+        "create_embeddings": lambda stem: [args.embeddings_output],
+        "build_faiss": lambda stem: [args.faiss_output],
+        "store_embeddings": lambda stem: [],
+    }
+
+    def tracked(stage, run):
+        # Runs a stage over the items the manifest planned for it (all items
+        # when no manifest is used) and records what it produced.
+        def step():
+            stems = None if plan is None else plan[stage]
+            if stems is not None and not stems:
+                return {"skipped": True}
+            metrics = run(stems) or {}
+            if stems is not None:
+                for stem in stems:
+                    outputs = stage_outputs[stage](stem)
+                    if all(os.path.exists(path) for path in outputs):
+                        manifest.record(stem, stage, configs[stage], outputs)
+                manifest.save()
+                metrics["items"] = len(stems)
+            return metrics
+
+        return stage, step
+
+    scheduler = EmbeddingScheduler(
+        model=EMBEDDING_MODEL,
+        batch_size=args.embed_batch_size,
+        max_in_flight=args.embed_concurrency,
+        max_retries=args.embed_retries,
+    )
+    progress_state = {"completed": 0}
+
+    def report(step, **metrics):
+        on_progress(progress_payload(step, progress_state["completed"], total_steps, start_time, **metrics))
+
+    def run_create_embeddings(stems):
+        create_embeddings_from_json(
+            embeddings_dir,
+            args.embeddings_output,
+            embedding_cache_path=args.embedding_cache,
+            scheduler=scheduler,
+            on_progress=lambda done, total, rate: report(
+                "create_embeddings",
+                chunks_done=done,
+                chunks_total=total,
+                chunks_per_second=round(rate, 1),
             ),
-        ),
-    ]
-    if args.merge_size > 1:
-        steps.append(
-            ("merge_chunks", lambda: merge_chunks(args.json_dir, args.improved_json_dir, args.merge_size))
+            stems=stems,
+            append=stems is not None,
+            dtype=args.embedding_dtype,
+        )
+        return {"chunks_per_second": scheduler.stats()["chunks_per_second"]}
+
+    transcribe_kwargs = {
+        "audio_dir": args.audio_dir,
+        "output_dir": args.json_dir,
+        "model_name": args.model,
+        "device": resolved_device,
+        "capture_original": args.capture_original,
+        "translate": args.translate,
+        "video_title": args.video_title or None,
+        "video_number": args.video_number or None,
+        "language": args.language or None,
+        "stream_window": args.stream_window,
+        "stream_overlap": args.stream_overlap,
+        "debug_json_dir": os.path.join(args.debug_json_dir, "transcripts") if args.debug_json_dir else "",
+        "shard_workers": args.shard_workers,
+        "shard_threads": args.shard_threads,
+        "shard_seconds": args.shard_seconds,
+    }
+
+    def run_transcribe(stems):
+        if not args.stream_window:
+            transcribe_audio(**transcribe_kwargs, stems=stems)
+            return None
+
+        # Transcription appends segments to a log per file in a background
+        # thread while this thread follows the logs, merges the segments and
+        # embeds the chunks. The vectors land in the embedding cache, so the
+        # create_embeddings step that follows only assembles the output.
+        errors = []
+
+        def produce():
+            try:
+                transcribe_audio(**transcribe_kwargs, stems=stems)
+            except Exception as exc:
+                errors.append(exc)
+
+        producer = threading.Thread(target=produce, name="transcribe", daemon=True)
+        producer.start()
+        embedding_cache = EmbeddingCache(args.embedding_cache or "")
+        embed_texts = lambda texts: embedding_cache.embed(texts, EMBEDDING_MODEL, scheduler.embed)
+        chunker = make_chunker(args, embed_texts) if merges_segments(args) else None
+        flush_size = scheduler.batch_size * scheduler.max_in_flight
+        embedded = 0
+        try:
+            for audio in list_audio_files(args.audio_dir, stems):
+                stem = os.path.splitext(audio)[0]
+                settings = stream_settings(
+                    args.model,
+                    args.translate,
+                    args.capture_original,
+                    args.language or None,
+                    args.stream_window,
+                    args.stream_overlap,
+                    os.path.join(args.audio_dir, audio),
+                )
+                chunks = follow_segments(
+                    segment_log_path(args.json_dir, stem),
+                    settings=settings,
+                    writer_alive=producer.is_alive,
+                )
+                if chunker is not None:
+                    chunks = chunker(chunks)
+
+                pending = []
+                for chunk in chunks:
+                    pending.append(chunk["text"])
+                    if len(pending) >= flush_size:
+                        embed_texts(pending)
+                        embedded += len(pending)
+                        pending = []
+                        report("transcribe", file=stem, chunks_embedded=embedded)
+                if pending:
+                    embed_texts(pending)
+                    embedded += len(pending)
+                report("transcribe", file=stem, chunks_embedded=embedded)
+        finally:
+            producer.join()
+            embedding_cache.close()
+        if errors:
+            raise errors[0]
+        return {"chunks_embedded": embedded}
+
+    def run_merge_chunks(stems):
+        embedding_cache = EmbeddingCache(args.embedding_cache or "")
+        try:
+            merge_chunks(
+                args.json_dir,
+                args.improved_json_dir,
+                args.merge_size,
+                stems=stems,
+                chunker=make_chunker(
+                    args,
+                    lambda texts: embedding_cache.embed(texts, EMBEDDING_MODEL, scheduler.embed),
+                ),
+                debug_json_dir=os.path.join(args.debug_json_dir, "chunks") if args.debug_json_dir else "",
+            )
+        finally:
+            embedding_cache.close()
+
+    manifest_lock = threading.Lock()
+
+    def record_item(stage, stem):
+        if manifest is None:
+            return
+        outputs = stage_outputs[stage](stem)
+        if all(os.path.exists(path) for path in outputs):
+            with manifest_lock:
+                manifest.record(stem, stage, configs[stage], outputs)
+                manifest.save()
+
+    def run_stage_pipeline():
+        # Each video goes through conversion, transcription, chunking and
+        # embedding on its own, so ffmpeg, Whisper and the embedding server
+        # work on different videos at the same time. Embedding here only
+        # fills the embedding cache; create_embeddings then assembles the
+        # store for all videos at once. Transcription has a single worker
+        # because the Whisper model is shared and not safe to decode on
+        # concurrently.
+        sources = discover_sources(args)
+        if plan is None:
+            wanted = {
+                "video_to_audio": {stem for stem, (kind, _) in sources.items() if kind == "video"},
+                "transcribe": {stem for stem, (kind, _) in sources.items() if kind != "json"},
+                "merge_chunks": set(sources),
+                "create_embeddings": set(sources),
+            }
+        else:
+            wanted = {
+                stage: plan.get(stage, set())
+                for stage in ("video_to_audio", "transcribe", "merge_chunks", "create_embeddings")
+            }
+        items = sorted(set().union(*wanted.values()))
+        if not items:
+            return {"skipped": True}
+
+        def item_stage(stage, run, name=None, record=True):
+            def run_item(stem):
+                if stem in wanted[stage]:
+                    with trace.span(name or stage, item=stem):
+                        run({stem})
+                    if record:
+                        record_item(stage, stem)
+
+            return run_item
+
+        embedding_cache = EmbeddingCache(args.embedding_cache or "")
+
+        def embed_chunks(stems):
+            for stem, path in list_transcripts(embeddings_dir, stems).items():
+                texts = [chunk["text"] for chunk in iter_records(path)]
+                embedding_cache.embed(texts, EMBEDDING_MODEL, scheduler.embed)
+
+        stages = [
+            Stage(
+                "video_to_audio",
+                item_stage(
+                    "video_to_audio",
+                    lambda stems: convert_videos_to_audio(
+                        args.video_dir,
+                        args.audio_dir,
+                        args.overwrite_audio,
+                        stems=stems,
+                        audio_format=args.audio_format,
+                    ),
+                ),
+                workers=args.ffmpeg_workers or max(1, (os.cpu_count() or 1) // 2),
+            ),
+            Stage("transcribe", item_stage("transcribe", run_transcribe)),
+        ]
+        if merges_segments(args):
+            stages.append(Stage("merge_chunks", item_stage("merge_chunks", run_merge_chunks), workers=args.chunk_workers))
+        # Only the create_embeddings step below records that stage; warming
+        # the cache leaves the store untouched.
+        stages.append(
+            Stage(
+                "embed_chunks",
+                item_stage("create_embeddings", embed_chunks, "embed_chunks", record=False),
+                workers=args.embed_workers,
+            )
         )
-        embeddings_dir = args.improved_json_dir
+
+        pipeline = StagePipeline(
+            stages,
+            queue_size=args.stage_queue_size,
+            on_progress=lambda stem, stage, stats: report("pipeline", file=stem, stage=stage, stages=stats),
+        )
+        try:
+            stats = pipeline.run(items)
+        finally:
+            embedding_cache.close()
+        return {"items": len(items), "stages": stats}
+
+    if args.pipeline:
+        steps = [
+            ("pipeline", run_stage_pipeline),
+            ("cleanup_video", lambda: cleanup_dir(args.video_dir)),
+        ]
     else:
-        embeddings_dir = args.json_dir
+        steps = [
+            tracked(
+                "video_to_audio",
+                lambda stems: convert_videos_to_audio(
+                    args.video_dir,
+                    args.audio_dir,
+                    args.overwrite_audio,
+                    stems=stems,
+                    audio_format=args.audio_format,
+                    workers=args.ffmpeg_workers,
+                    on_progress=lambda file, done, total: report(
+                        "video_to_audio",
+                        file=file,
+                        files_done=done,
+                        files_total=total,
+                    ),
+                ),
+            ),
+            ("cleanup_video", lambda: cleanup_dir(args.video_dir)),
+            tracked("transcribe", run_transcribe),
+        ]
+        if merges_segments(args):
+            steps.append(tracked("merge_chunks", run_merge_chunks))
 
     steps.extend(
         [
-            ("create_embeddings", lambda: create_embeddings_from_json(embeddings_dir, args.embeddings_output)),
-            ("build_faiss", lambda: build_faiss_index(args.embeddings_output, args.faiss_output)),
+            tracked("create_embeddings", run_create_embeddings),
+            tracked(
+                "build_faiss",
+                lambda stems: build_faiss_index(
+                    args.embeddings_output,
+                    args.faiss_output,
+                    appended_sources=stems,
+                    quantization=args.index_quantization,
+                ),
+            ),
         ]
     )
     if args.mongo_uri:
-         steps.append(
-            (
+        steps.append(
+            tracked(
                 "store_embeddings",
-                lambda: store_embeddings(
+                lambda stems: store_embeddings(
                     embeddings_path=args.embeddings_output,
                     mongo_uri=args.mongo_uri,
                     mongo_db=args.mongo_db,
@@ -139,45 +603,131 @@ def run_pipeline(args):
                     course_name=args.course_name,
                     merged_json_dir=embeddings_dir,
                     merged_json_collection=args.merged_json_collection,
+                    index_dir=args.index_dir,
+                    sources=stems,
+                    index_quantization=args.index_quantization,
                 ),
             )
-
-
-         )
+        )
     steps.append(("cleanup_audio", lambda: cleanup_dir(args.audio_dir)))
     if args.cleanup:
         steps.append(("cleanup", lambda: cleanup_dirs(args.json_dir, args.improved_json_dir)))
 
     total_steps = len(steps)
     start_time = time.perf_counter()
-    emit_progress("starting", 0, total_steps, start_time)
+    on_progress(progress_payload("starting", 0, total_steps, start_time))
 
-    for step_index, (step_name, step_fn) in enumerate(steps, start=1):
-        step_fn()
-        emit_progress(step_name, step_index, total_steps, start_time)
+    status = "error"
+    try:
+        for step_index, (step_name, step_fn) in enumerate(steps, start=1):
+            with trace.span(step_name):
+                metrics = step_fn() or {}
+            progress_state["completed"] = step_index
+            on_progress(progress_payload(step_name, step_index, total_steps, start_time, **metrics))
+        status = "ok"
+        on_progress(progress_payload("done", total_steps, total_steps, start_time, timings=trace.timings()))
+    finally:
+        scheduler.close()
+        tracer.finish(trace, status, embedding=scheduler.stats())
 
 
-if __name__ == "__main__":
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Process videos into embeddings with timestamps."
     )
     parser.add_argument("--video-dir", default="Videos", help="Input video directory.")
     parser.add_argument("--audio-dir", default="audio", help="Output audio directory.")
-    parser.add_argument("--json-dir", default="jsons", help="Output JSON directory.")
-    parser.add_argument("--improved-json-dir", default="new_jsons", help="Merged JSON directory.")
-    parser.add_argument("--merge-size", type=int, default=5, help="Merge N segments per chunk.")
+    parser.add_argument("--json-dir", default="jsons", help="Output transcript (JSONL) directory.")
+    parser.add_argument("--improved-json-dir", default="new_jsons", help="Merged chunk (JSONL) directory.")
+    parser.add_argument(
+        "--chunker",
+        choices=["semantic", "fixed"],
+        default="semantic",
+        help="semantic packs segments by token budget; fixed merges --merge-size segments per chunk.",
+    )
+    parser.add_argument("--merge-size", type=int, default=5, help="Merge N segments per chunk (fixed chunker).")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_MAX_TOKENS, help="Token budget per chunk.")
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_OVERLAP_TOKENS, help="Tokens repeated between chunks.")
+    parser.add_argument("--chunk-min-tokens", type=int, default=DEFAULT_MIN_TOKENS, help="Smallest chunk closed early.")
+    parser.add_argument(
+        "--silence-gap",
+        type=float,
+        default=DEFAULT_SILENCE_GAP,
+        help="Pause in seconds between segments that starts a new chunk (0 to disable).",
+    )
+    parser.add_argument(
+        "--split-similarity",
+        type=float,
+        default=None,
+        help="Also start a new chunk where adjacent segments' embedding similarity drops below this.",
+    )
     parser.add_argument("--model", default="small", help="Whisper model name.")
     parser.add_argument("--device", default=None, help="Force device: cpu or cuda.")
     parser.add_argument("--translate", action="store_true", help="Translate audio to English.")
     parser.add_argument(
         "--capture-original",
         action="store_true",
-        help="With --translate, keep original-language text by running an additional pass.",
+        help="With --translate, also keep original-language text (decoded from the same encoder pass).",
     )
     parser.add_argument("--language", default="", help="Force transcription language (e.g., en).")
-    parser.add_argument("--embeddings-output", default="embeddings.joblib", help="Embeddings output.")
+    parser.add_argument(
+        "--stream-window",
+        type=float,
+        default=0.0,
+        help="Transcribe in windows of this many seconds and embed chunks while transcription runs (0 = whole file).",
+    )
+    parser.add_argument("--stream-overlap", type=float, default=10.0, help="Seconds of overlap between windows.")
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        default=0,
+        help="On CPU, split each file at pauses and transcribe the pieces in this many processes (0 or 1 = off).",
+    )
+    parser.add_argument("--shard-threads", type=int, default=0, help="Torch threads per shard worker (0 = torch threads / workers).")
+    parser.add_argument("--shard-seconds", type=float, default=DEFAULT_SHARD_SECONDS, help="Target shard length in seconds.")
+    parser.add_argument("--embeddings-output", default="embeddings", help="Embedding store output directory.")
+    parser.add_argument(
+        "--embedding-dtype",
+        choices=STORE_DTYPES,
+        default="float32",
+        help="On-disk precision of stored vectors (float16 halves the store).",
+    )
     parser.add_argument("--faiss-output", default="faiss_index.bin", help="FAISS index output.")
+    parser.add_argument(
+        "--embedding-cache",
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite file for cached chunk embeddings (empty for memory only).",
+    )
+    parser.add_argument("--embed-batch-size", type=int, default=32, help="Chunks per embedding request.")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Concurrent embedding requests.")
+    parser.add_argument("--embed-retries", type=int, default=3, help="Retries per failed embedding request.")
     parser.add_argument("--overwrite-audio", action="store_true", help="Overwrite audio files.")
+    parser.add_argument(
+        "--audio-format",
+        choices=sorted(AUDIO_FORMATS),
+        default="wav",
+        help="Intermediate audio format; wav and opus are 16 kHz mono for Whisper.",
+    )
+    parser.add_argument(
+        "--ffmpeg-workers",
+        type=int,
+        default=0,
+        help="Parallel ffmpeg processes (0 = one per core, or half the cores with --pipeline).",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Move each video through conversion, transcription, chunking and embedding independently.",
+    )
+    parser.add_argument("--chunk-workers", type=int, default=2, help="Videos chunked at the same time with --pipeline.")
+    parser.add_argument("--embed-workers", type=int, default=1, help="Videos embedded at the same time with --pipeline.")
+    parser.add_argument(
+        "--stage-queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Videos that may wait between two pipeline stages.",
+    )
     parser.add_argument("--video-title", default="", help="Video title metadata override.")
     parser.add_argument("--video-number", default="", help="Video number metadata override.")
     parser.add_argument("--course-name", default="", help="Course name metadata.")
@@ -189,8 +739,34 @@ if __name__ == "__main__":
         default="course_jsons",
         help="Collection where merged json contents are stored.",
     )
+    parser.add_argument(
+        "--index-dir",
+        default=DEFAULT_INDEX_DIR,
+        help="Directory for per-course FAISS indexes (empty to skip).",
+    )
+    parser.add_argument(
+        "--index-quantization",
+        choices=QUANTIZATIONS,
+        default="none",
+        help="Compress index vectors (sq8: int8 scalar, pq: product quantization); course searches re-rank hits.",
+    )
+    parser.add_argument(
+        "--manifest",
+        default="",
+        help="Pipeline manifest path; when set, only new or changed videos are processed.",
+    )
+    parser.add_argument(
+        "--debug-json-dir",
+        default="",
+        help="Also write pretty-printed JSON copies of transcripts and chunks here.",
+    )
     parser.add_argument("--cleanup", action="store_true", help="Delete intermediate json folders after processing.")
-    args = parser.parse_args()
+    parser.add_argument("--trace-file", default="", help="Append a JSON line with the run's stage spans here.")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
     try:
         run_pipeline(args)
     except Exception as exc:
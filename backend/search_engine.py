@@ -0,0 +1,54 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def squared_norms(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype="float32")
+    return np.einsum("ij,ij->i", matrix, matrix)
+
+
+def search_batch(
+    matrix: np.ndarray,
+    queries: Sequence[Sequence[float]],
+    k: int = 6,
+    matrix_norms: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, so the whole batch costs one
+    # GEMM plus a Q x N score buffer instead of an N x D difference matrix.
+    query_matrix = np.atleast_2d(np.asarray(queries, dtype="float32"))
+    row_count = matrix.shape[0]
+    if row_count == 0 or k <= 0:
+        empty = np.empty((query_matrix.shape[0], 0))
+        return empty.astype("int64"), empty.astype("float32")
+
+    if matrix_norms is None:
+        matrix_norms = squared_norms(matrix)
+
+    scores = query_matrix @ matrix.T
+    scores *= -2.0
+    scores += matrix_norms[np.newaxis, :]
+    scores += squared_norms(query_matrix)[:, np.newaxis]
+    np.maximum(scores, 0.0, out=scores)
+
+    k = min(k, row_count)
+    if k < row_count:
+        candidates = np.argpartition(scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(row_count), scores.shape).copy()
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+
+    order = np.argsort(candidate_scores, axis=1)
+    top_indices = np.take_along_axis(candidates, order, axis=1)
+    top_distances = np.sqrt(np.take_along_axis(candidate_scores, order, axis=1))
+    return top_indices, top_distances
+
+
+def search(
+    matrix: np.ndarray,
+    query: Sequence[float],
+    k: int = 6,
+    matrix_norms: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    top_indices, top_distances = search_batch(matrix, [query], k, matrix_norms)
+    return top_indices[0], top_distances[0]
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+
+
+class SegmentLog:
+    # Append-only JSONL of transcript segments plus a checkpoint file that
+    # records how many bytes of the log are committed and the audio position
+    # they cover. Anything past the committed offset is a partial write from
+    # a crash and is truncated when the log is reopened. A log written with
+    # different settings is discarded rather than resumed.
+    def __init__(self, path, settings=None):
+        self.path = path
+        self.checkpoint_path = f"{path}.ckpt"
+        self.settings = settings or {}
+        self.seek = 0.0
+        self.offset = 0
+        self.done = False
+
+        checkpoint = read_checkpoint(path)
+        resumed = bool(checkpoint) and checkpoint.get("settings", {}) == self.settings
+        if resumed:
+            self.seek = float(checkpoint.get("seek", 0.0))
+            self.offset = int(checkpoint.get("offset", 0))
+            self.done = bool(checkpoint.get("done", False))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "ab")
+        self._file.truncate(self.offset)
+        self._file.seek(self.offset)
+        if not resumed:
+            self._write_checkpoint()
+
+    def commit(self, records, seek, done=False):
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.offset = self._file.tell()
+        self.seek = seek
+        self.done = done
+        self._write_checkpoint()
+
+    def close(self):
+        self._file.close()
+
+    def _write_checkpoint(self):
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"seek": self.seek, "offset": self.offset, "done": self.done, "settings": self.settings},
+                file,
+            )
+        os.replace(temp_path, self.checkpoint_path)
+
+
+def read_checkpoint(path):
+    checkpoint_path = f"{path}.ckpt"
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def read_segments(path):
+    checkpoint = read_checkpoint(path) or {}
+    limit = int(checkpoint.get("offset", 0))
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as file:
+        while file.tell() < limit:
+            line = file.readline()
+            if not line:
+                break
+            yield json.loads(line)
+
+
+def follow_segments(path, settings=None, writer_alive=lambda: True, poll_seconds=0.5):
+    # Yields committed segments while another thread is still transcribing,
+    # and stops once the log is marked done or the writer has gone away. A
+    # leftover log from other settings counts as not started yet.
+    position = 0
+    while True:
+        checkpoint = read_checkpoint(path) or {}
+        if settings is not None and checkpoint.get("settings", {}) != settings:
+            checkpoint = {}
+        limit = int(checkpoint.get("offset", 0))
+        if limit > position and os.path.exists(path):
+            with open(path, "rb") as file:
+                file.seek(position)
+                while file.tell() < limit:
+                    line = file.readline()
+                    if not line:
+                        break
+                    yield json.loads(line)
+                position = file.tell()
+            continue
+        if checkpoint.get("done") or not writer_alive():
+            return
+        time.sleep(poll_seconds)
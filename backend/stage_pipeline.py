@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+
+DEFAULT_QUEUE_SIZE = 2
+
+_END = object()
+
+
+class Stage:
+    def __init__(self, name: str, run: Callable[[Hashable], Any], workers: int = 1):
+        self.name = name
+        self.run = run
+        self.workers = max(1, workers)
+
+
+class StagePipeline:
+    # Moves every item through a chain of stages. Each stage has its own
+    # worker threads and reads from a bounded queue filled by the stage
+    # before it, so item N+1 can be in the first stage while item N is in
+    # the second; a full queue holds back the stages upstream of it. The
+    # first error stops new work and is raised from run() once every worker
+    # has exited.
+    def __init__(
+        self,
+        stages: Iterable[Stage],
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        on_progress: Optional[Callable[[Hashable, str, Dict[str, Dict[str, Any]]], None]] = None,
+    ):
+        self.stages = list(stages)
+        self.queue_size = max(1, queue_size)
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._queues: List[queue.Queue] = []
+        self._busy = {stage.name: 0.0 for stage in self.stages}
+        self._active = {stage.name: 0 for stage in self.stages}
+        self._done = {stage.name: 0 for stage in self.stages}
+        self._started = None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        # Utilization is the share of the stage's worker time spent running
+        # items since the pipeline started.
+        elapsed = time.perf_counter() - self._started if self._started is not None else 0.0
+        with self._lock:
+            return {
+                stage.name: {
+                    "done": self._done[stage.name],
+                    "active": self._active[stage.name],
+                    "queued": self._queues[index].qsize() if self._queues else 0,
+                    "busy_seconds": round(self._busy[stage.name], 1),
+                    "utilization": round(self._busy[stage.name] / (elapsed * stage.workers), 3) if elapsed else 0.0,
+                }
+                for index, stage in enumerate(self.stages)
+            }
+
+    def run(self, items: Iterable[Hashable]) -> Dict[str, Dict[str, Any]]:
+        self._started = time.perf_counter()
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        failures: List[BaseException] = []
+        stop = threading.Event()
+
+        def work(index: int):
+            stage = self.stages[index]
+            inbox = self._queues[index]
+            outbox = self._queues[index + 1] if index + 1 < len(self.stages) else None
+            while True:
+                item = inbox.get()
+                if item is _END:
+                    return
+                if stop.is_set():
+                    # Keep draining so upstream workers are never blocked
+                    # on a full queue.
+                    continue
+                with self._lock:
+                    self._active[stage.name] += 1
+                started = time.perf_counter()
+                try:
+                    stage.run(item)
+                except BaseException as exc:
+                    failures.append(exc)
+                    stop.set()
+                    continue
+                finally:
+                    with self._lock:
+                        self._active[stage.name] -= 1
+                        self._busy[stage.name] += time.perf_counter() - started
+                with self._lock:
+                    self._done[stage.name] += 1
+                if outbox is not None:
+                    outbox.put(item)
+                if self.on_progress is not None:
+                    self.on_progress(item, stage.name, self.stats())
+
+        threads = [
+            [
+                threading.Thread(target=work, args=(index,), name=f"{stage.name}-{number}", daemon=True)
+                for number in range(stage.workers)
+            ]
+            for index, stage in enumerate(self.stages)
+        ]
+        for stage_threads in threads:
+            for thread in stage_threads:
+                thread.start()
+
+        for item in items:
+            if stop.is_set():
+                break
+            self._queues[0].put(item)
+        # A stage is closed once every worker of the stage before it has
+        # exited, so nothing can be put behind its end markers.
+        for index, stage_threads in enumerate(threads):
+            for _ in stage_threads:
+                self._queues[index].put(_END)
+            for thread in stage_threads:
+                thread.join()
+
+        if failures:
+            raise failures[0]
+        return self.stats()
@@ -1,8 +1,18 @@
 import argparse
-import json
 import os
-import joblib
-from pymongo import MongoClient
+import numpy as np
+from pymongo import MongoClient, ReplaceOne
+
+from course_cache import bump_course_generation
+from course_index import DEFAULT_INDEX_DIR, QUANTIZATIONS, append_course_index, build_course_index
+from course_registry import course_metadata
+from embedding_store import STORE_DTYPES, EmbeddingStore
+from keyword_index import update_keyword_index
+from transcript_io import LEGACY_EXTENSION, TRANSCRIPT_EXTENSION, iter_records, list_transcripts, transcript_stem
+from vector_codec import encode_vector
+
+
+UPSERT_KEY = [("course", 1), ("Number", 1), ("chunk_id", 1)]
 
 
 def store_embeddings(
@@ -15,69 +25,180 @@ def store_embeddings(
     course_name="",
     merged_json_dir="",
     merged_json_collection="course_jsons",
+    index_dir=DEFAULT_INDEX_DIR,
+    sources=None,
+    vector_dtype=None,
+    batch_size=500,
+    index_quantization="none",
+    client=None,
 ):
-    df = joblib.load(embeddings_path)
+    store = EmbeddingStore(embeddings_path)
+    rows = np.flatnonzero(store.source_mask(sources)) if sources is not None else None
 
-    if video_title:
-        df["title"] = video_title
+    # An open client (or a mongomock one in the benchmarks) is used as is
+    # and left open.
+    owns_client = client is None
+    if owns_client:
+        client = MongoClient(mongo_uri)
+    db = client[mongo_db]
+    embedding_collection = db[mongo_collection]
+    # Rows of every stem and video Number being written are deleted first,
+    # so a video that now produces fewer chunks leaves no stale higher
+    # chunk_ids behind. Numbers matter as well as stems: a video uploaded
+    # again under a new title gets a new stem but the same Number, and its
+    # old rows would otherwise survive under the old stem. Without an
+    # explicit list the stems are every stem in the store.
+    written_sources = list(sources) if sources is not None else [source for source in store.categories["source"] if source]
     if video_number:
-        df["Number"] = video_number
-    if course_name:
-        df["course"] = course_name
+        written_numbers = [video_number]
+    else:
+        number_codes = store.codes["Number"] if rows is None else store.codes["Number"][rows]
+        written_numbers = [store.categories["Number"][code] for code in np.unique(number_codes)]
+    stale_filter = {
+        "$or": [
+            {"source": {"$in": written_sources}},
+            {"course": course_name, "Number": {"$in": written_numbers}},
+        ]
+    }
+    embedding_collection.create_index(UPSERT_KEY, name="course_number_chunk")
+    # The keyword postings of every stem losing rows are replaced as well.
+    removed_sources = [source for source in embedding_collection.distinct("source", stale_filter) if source]
+    replaced_sources = list(dict.fromkeys([*written_sources, *removed_sources]))
+    removed_rows = embedding_collection.delete_many(stale_filter).deleted_count
 
-    records = df.to_dict(orient="records")
-    for record in records:
-        embedding = record.get("embedding")
-        if embedding is not None and not isinstance(embedding, list):
-            record["embedding"] = embedding.tolist()
+    # Rows are read from the memory-mapped store and upserted one bounded
+    # batch at a time, keyed by (course, Number, chunk_id) so re-running a
+    # store replaces rows instead of duplicating them. Vectors are stored as
+    # packed binary rather than arrays of doubles.
+    vector_dtype = vector_dtype or store.dtype
+    upserted_ids = []
+    upserted_vectors = []
+    upserted_titles = []
+    upserted_sources = []
+    upserted_texts = []
+    replaced_rows = 0
+    for row_block, vectors in store.iter_vector_blocks(rows, block_rows=batch_size):
+        operations = []
+        written = []
+        for row, vector in zip(row_block, vectors):
+            record = store.record(row)
+            if video_title:
+                record["title"] = video_title
+            if video_number:
+                record["Number"] = video_number
+            record["course"] = course_name or record.get("course", "")
+            record["embedding"] = encode_vector(vector, vector_dtype)
+            key = {name: record[name] for name, _ in UPSERT_KEY}
+            operations.append(ReplaceOne(key, record, upsert=True))
+            written.append(record)
+        if not operations:
+            continue
+        result = embedding_collection.bulk_write(operations, ordered=False)
+        replaced_rows += result.matched_count
+        for position, object_id in sorted(result.upserted_ids.items()):
+            upserted_ids.append(object_id)
+            upserted_vectors.append(vectors[position])
+            upserted_titles.append(written[position].get("title", ""))
+            upserted_sources.append(written[position].get("source", ""))
+            upserted_texts.append(written[position].get("text", ""))
 
-    client = MongoClient(mongo_uri)
-    db = client[mongo_db]
-    embedding_collection = db[mongo_collection]
-    embedding_collection.insert_many(records)
+    metadata = course_metadata(mongo_collection, embedding_collection.estimated_document_count(), course_name)
+    generation = bump_course_generation(db, mongo_collection, metadata)
+    if index_dir:
+        if removed_rows or replaced_rows:
+            # Replaced documents keep their _id with a new vector, so the
+            # index cannot simply be appended to.
+            build_course_index(db, mongo_collection, index_dir, generation, quantization=index_quantization)
+        else:
+            if upserted_vectors:
+                inserted_vectors = np.vstack(upserted_vectors)
+            else:
+                inserted_vectors = np.zeros((0, store.dimension), dtype="float32")
+            append_course_index(
+                db,
+                mongo_collection,
+                index_dir,
+                generation,
+                upserted_ids,
+                inserted_vectors,
+                quantization=index_quantization,
+                inserted_titles=upserted_titles,
+            )
+        # Keyword postings are replaced per source; a replaced row anywhere
+        # rebuilds them from Mongo like the vector index.
+        update_keyword_index(
+            db,
+            mongo_collection,
+            index_dir,
+            generation,
+            None if replaced_rows else replaced_sources,
+            upserted_ids,
+            upserted_sources,
+            upserted_texts,
+        )
 
     if merged_json_dir and os.path.isdir(merged_json_dir):
         merged_docs = []
-        for filename in os.listdir(merged_json_dir):
-            if not filename.endswith(".json"):
-                continue
-
-            file_path = os.path.join(merged_json_dir, filename)
-            with open(file_path, "r", encoding="utf-8") as file:
-                json_content = json.load(file)
-
+        for file_path in list_transcripts(merged_json_dir, sources).values():
             merged_docs.append(
                 {
                     "course": course_name,
                     "title": video_title,
                     "Number": video_number,
-                    "filename": filename,
-                    "content": json_content,
+                    "filename": os.path.basename(file_path),
+                    "content": {"chunks": list(iter_records(file_path))},
                 }
             )
 
         if merged_docs:
             json_collection = db[merged_json_collection]
+            if sources:
+                # Older runs stored the same stem as a pretty-printed .json file.
+                filenames = [
+                    f"{transcript_stem(doc['filename'])}{extension}"
+                    for doc in merged_docs
+                    for extension in (TRANSCRIPT_EXTENSION, LEGACY_EXTENSION)
+                ]
+                json_collection.delete_many({"filename": {"$in": filenames}})
             json_collection.insert_many(merged_docs)
 
-    client.close()
+    if owns_client:
+        client.close()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Store embeddings into MongoDB.")
-    parser.add_argument("--embeddings-path", default="embeddings.joblib", help="Embeddings joblib file.")
+    parser.add_argument("--embeddings-path", default="embeddings", help="Embedding store directory.")
     parser.add_argument("--mongo-uri", required=True, help="MongoDB connection string.")
     parser.add_argument("--mongo-db", default="rag_basic", help="MongoDB database name.")
     parser.add_argument("--mongo-collection", default="video_embeddings", help="MongoDB collection.")
     parser.add_argument("--video-title", default="", help="Video title metadata override.")
     parser.add_argument("--video-number", default="", help="Video number metadata override.")
     parser.add_argument("--course-name", default="", help="Course name metadata.")
-    parser.add_argument("--merged-json-dir", default="", help="Directory that contains merged jsons.")
+    parser.add_argument("--merged-json-dir", default="", help="Directory that contains merged chunk files.")
     parser.add_argument(
         "--merged-json-collection",
         default="course_jsons",
         help="Collection where merged json contents are stored.",
     )
+    parser.add_argument(
+        "--index-dir",
+        default=DEFAULT_INDEX_DIR,
+        help="Directory for per-course FAISS indexes (empty to skip).",
+    )
+    parser.add_argument(
+        "--vector-dtype",
+        choices=STORE_DTYPES,
+        default=None,
+        help="Precision of the packed vectors in MongoDB (defaults to the store's).",
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per bulk upsert.")
+    parser.add_argument(
+        "--index-quantization",
+        choices=QUANTIZATIONS,
+        default="none",
+        help="Compress course index vectors (sq8: int8 scalar, pq: product quantization) and re-rank hits.",
+    )
     args = parser.parse_args()
 
     store_embeddings(
@@ -90,4 +211,8 @@ if __name__ == "__main__":
         course_name=args.course_name,
         merged_json_dir=args.merged_json_dir,
         merged_json_collection=args.merged_json_collection,
+        index_dir=args.index_dir,
+        vector_dtype=args.vector_dtype,
+        batch_size=args.batch_size,
+        index_quantization=args.index_quantization,
     )
\ No newline at end of file
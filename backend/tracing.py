@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Upper bounds in seconds; wide enough for a numpy search (milliseconds) and
+# a lecture transcription (tens of minutes).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [*labels, extra] if extra else list(labels)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        running = 0
+        cumulative = []
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative
+
+
+class Metrics:
+    # Process-wide counters and histograms, keyed by name and labels, and
+    # rendered in the Prometheus text format.
+    def __init__(self):
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        key = label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [
+                        {"labels": dict(key), "count": histogram.count, "sum": round(histogram.total, 6)}
+                        for key, histogram in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{format_labels(key, ('le', f'{bound:g}'))} {count}")
+                    lines.append(f"{name}_bucket{format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{format_labels(key)} {histogram.total:.6f}")
+                    lines.append(f"{name}_count{format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class Trace:
+    # Spans of one request or pipeline run. Spans may be added from several
+    # threads; a span that ends after finish() is dropped.
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes)
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, ended: Optional[float] = None, **attributes) -> None:
+        # started and ended are time.perf_counter() values.
+        ended = time.perf_counter() if ended is None else ended
+        span = {
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 2),
+            "duration_ms": round((ended - started) * 1000, 2),
+        }
+        if attributes:
+            span["attributes"] = attributes
+        with self._lock:
+            if not self.finished:
+                self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as exc:
+            attributes["error"] = exc.__class__.__name__
+            raise
+        finally:
+            self.add(name, started, **attributes)
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def timings(self) -> Dict[str, float]:
+        # Milliseconds per stage (summed when a stage ran more than once) and
+        # the time since the trace started.
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span in self.spans:
+                totals[span["name"]] = round(totals.get(span["name"], 0.0) + span["duration_ms"], 2)
+        totals["total"] = self.elapsed_ms()
+        return totals
+
+
+class Tracer:
+    # Starts traces and, when they finish, feeds their span durations into
+    # the stage_duration_seconds and trace_duration_seconds histograms and
+    # appends them as one JSON line to path, if one is set.
+    def __init__(self, path: str = "", metrics: Metrics = METRICS):
+        self.path = path
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def start(self, name: str, **attributes) -> Trace:
+        return Trace(name, attributes)
+
+    def finish(self, trace: Trace, status: str = "ok", **attributes) -> Dict[str, Any]:
+        duration_ms = trace.elapsed_ms()
+        with trace._lock:
+            trace.finished = True
+            spans = list(trace.spans)
+        trace.attributes.update(attributes)
+
+        self.metrics.increment("traces_total", trace=trace.name, status=status)
+        self.metrics.observe("trace_duration_seconds", duration_ms / 1000, trace=trace.name, status=status)
+        for span in spans:
+            self.metrics.observe("stage_duration_seconds", span["duration_ms"] / 1000, trace=trace.name, stage=span["name"])
+
+        record = {
+            "trace": trace.name,
+            "trace_id": trace.trace_id,
+            "started_at": round(trace.started_at, 3),
+            "duration_ms": duration_ms,
+            "status": status,
+            "attributes": trace.attributes,
+            "spans": spans,
+        }
+        if self.path:
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write(line + "\n")
+        return record
+
+
+def serve_metrics(port: int, metrics: Metrics = METRICS, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    # GET /metrics in the Prometheus text format from a daemon thread.
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
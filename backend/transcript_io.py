@@ -0,0 +1,77 @@
+import json
+import os
+
+
+TRANSCRIPT_EXTENSION = ".jsonl"
+LEGACY_EXTENSION = ".json"
+SEGMENT_LOG_SUFFIX = ".segments.jsonl"
+
+
+def transcript_path(directory, stem):
+    return os.path.join(directory, f"{stem}{TRANSCRIPT_EXTENSION}")
+
+
+def transcript_stem(filename):
+    # Returns the stem for a transcript file name, or None for anything else
+    # (including in-progress segment logs and checkpoints).
+    if filename.endswith(SEGMENT_LOG_SUFFIX):
+        return None
+    for extension in (TRANSCRIPT_EXTENSION, LEGACY_EXTENSION):
+        if filename.endswith(extension):
+            return filename[: -len(extension)]
+    return None
+
+
+def list_transcripts(directory, stems=None):
+    # Maps stem -> path, preferring JSONL when a legacy pretty-printed JSON
+    # file with the same stem is still around.
+    found = {}
+    if not directory or not os.path.isdir(directory):
+        return found
+    for filename in sorted(os.listdir(directory)):
+        stem = transcript_stem(filename)
+        if stem is None or (stems is not None and stem not in stems):
+            continue
+        if stem in found and not filename.endswith(TRANSCRIPT_EXTENSION):
+            continue
+        found[stem] = os.path.join(directory, filename)
+    return found
+
+
+def iter_records(path):
+    # One segment or chunk per line. Legacy {"chunks": [...]} files are
+    # still readable, but have to be parsed whole.
+    if path.endswith(LEGACY_EXTENSION):
+        with open(path, "r", encoding="utf-8") as file:
+            yield from json.load(file).get("chunks", [])
+        return
+
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_records(path, records):
+    # Writes to a temporary file and renames it, so a reader never sees a
+    # half-written transcript. Returns the number of records written.
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    count = 0
+    with open(temp_path, "w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            file.write("\n")
+            count += 1
+    os.replace(temp_path, path)
+    return count
+
+
+def write_debug_json(path, records, **fields):
+    # Pretty-printed {"chunks": [...]} export for reading transcripts by
+    # hand; nothing in the pipeline reads it back.
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({**fields, "chunks": list(records)}, file, indent=4, ensure_ascii=False)
@@ -0,0 +1,180 @@
+import bisect
+import threading
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE, log_mel_spectrogram, pad_or_trim
+from whisper.decoding import DecodingOptions, decode
+from whisper.tokenizer import get_tokenizer
+
+
+TIME_PRECISION = 0.02
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_whisper_model(model_name, device):
+    # Loading a Whisper checkpoint dominates short runs, so a long-running
+    # worker keeps one instance per (model, device).
+    key = (model_name, device)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            print("Loading Whisper model:", model_name)
+            model = whisper.load_model(model_name).to(device)
+            _models[key] = model
+        return model
+
+
+def decode_with_fallback(model, audio_features, task, language, fp16):
+    result = None
+    for temperature in TEMPERATURES:
+        options = DecodingOptions(
+            task=task,
+            language=language,
+            temperature=temperature,
+            fp16=fp16,
+            without_timestamps=False,
+        )
+        result = decode(model, audio_features, options)[0]
+        if result.compression_ratio > COMPRESSION_RATIO_THRESHOLD:
+            continue
+        if result.avg_logprob < LOGPROB_THRESHOLD:
+            continue
+        break
+    return result
+
+
+def split_timestamped_tokens(tokens, tokenizer, time_offset, window_seconds):
+    # Turns "<|t0|> text <|t1|><|t1|> text <|t2|> ..." into segments. Returns
+    # the segments and how many seconds of the window they fully cover, so
+    # the caller can re-decode an unfinished trailing segment next window.
+    segments = []
+    start_time = None
+    text_tokens = []
+    last_end = None
+
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            timestamp = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+            if start_time is not None and text_tokens:
+                segments.append((start_time, timestamp, text_tokens))
+                last_end = timestamp
+                text_tokens = []
+                start_time = None
+            else:
+                start_time = timestamp
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+
+    consumed = window_seconds
+    if text_tokens:
+        if last_end:
+            consumed = last_end
+        else:
+            segments.append((start_time or 0.0, window_seconds, text_tokens))
+
+    decoded = []
+    for start, end, text in segments:
+        text = tokenizer.decode(text).strip()
+        if not text:
+            continue
+        decoded.append(
+            {
+                "start": round(time_offset + start, 2),
+                "end": round(time_offset + min(end, window_seconds), 2),
+                "text": text,
+            }
+        )
+    return decoded, consumed
+
+
+def transcribe_tasks(model, audio, tasks=("transcribe", "translate"), language=None, fp16=False):
+    # Computes the log-mel spectrogram and the encoder output once per
+    # 30-second window and decodes every task from the same audio features.
+    # The first task drives seeking; later tasks drop segments that the next
+    # window will decode again.
+    if isinstance(audio, np.ndarray):
+        audio = torch.from_numpy(audio)
+    dtype = torch.float16 if fp16 else torch.float32
+    mel = log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+    content_frames = mel.shape[-1] - N_FRAMES
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages)
+
+    results = {task: [] for task in tasks}
+    seek = 0
+    while seek < content_frames:
+        window_frames = min(N_FRAMES, content_frames - seek)
+        time_offset = seek * HOP_LENGTH / SAMPLE_RATE
+        window_seconds = window_frames * HOP_LENGTH / SAMPLE_RATE
+
+        mel_window = pad_or_trim(mel[:, seek:seek + window_frames], N_FRAMES).to(model.device).to(dtype)
+        audio_features = model.embed_audio(mel_window.unsqueeze(0))
+
+        if language is None and model.is_multilingual:
+            _, probabilities = model.detect_language(audio_features)
+            language = max(probabilities[0], key=probabilities[0].get)
+
+        consumed_seconds = None
+        for task in tasks:
+            result = decode_with_fallback(model, audio_features, task, language, fp16)
+            if (
+                result.no_speech_prob > NO_SPEECH_THRESHOLD
+                and result.avg_logprob < LOGPROB_THRESHOLD
+            ):
+                segments, consumed = [], window_seconds
+            else:
+                segments, consumed = split_timestamped_tokens(result.tokens, tokenizer, time_offset, window_seconds)
+
+            if consumed_seconds is None:
+                consumed_seconds = consumed
+            else:
+                cutoff = time_offset + consumed_seconds
+                segments = [
+                    {**segment, "end": min(segment["end"], cutoff)}
+                    for segment in segments
+                    if segment["start"] < cutoff
+                ]
+            results[task].extend(segments)
+
+        seek += max(1, int(round(consumed_seconds * SAMPLE_RATE / HOP_LENGTH)))
+
+    return results, language
+
+
+def align_segment_texts(source_segments, other_segments):
+    # Assigns each segment of another pass to the source segment it overlaps
+    # most in time (nearest midpoint when none overlap) and joins the texts.
+    aligned = [[] for _ in source_segments]
+    if not source_segments:
+        return []
+
+    starts = [segment["start"] for segment in source_segments]
+    midpoints = [(segment["start"] + segment["end"]) / 2 for segment in source_segments]
+    for other in other_segments:
+        text = other.get("text", "").strip()
+        if not text:
+            continue
+        first = max(0, bisect.bisect_right(starts, other["start"]) - 1)
+        best_index = None
+        best_overlap = 0.0
+        for index in range(first, len(source_segments)):
+            source = source_segments[index]
+            if source["start"] >= other["end"]:
+                break
+            overlap = min(source["end"], other["end"]) - max(source["start"], other["start"])
+            if overlap > best_overlap:
+                best_index = index
+                best_overlap = overlap
+        if best_index is None:
+            other_midpoint = (other["start"] + other["end"]) / 2
+            best_index = min(range(len(source_segments)), key=lambda index: abs(midpoints[index] - other_midpoint))
+        aligned[best_index].append(text)
+
+    return [" ".join(texts) for texts in aligned]
@@ -0,0 +1,38 @@
+import struct
+from typing import Any, Optional
+
+import numpy as np
+from bson.binary import Binary
+
+
+# 8-byte header: format version, dtype code, two reserved bytes, then the
+# dimension as a little-endian uint32. The vector follows, little-endian.
+HEADER = struct.Struct("<BBxxI")
+VECTOR_FORMAT_VERSION = 1
+DTYPE_CODES = {"float32": 0, "float16": 1}
+CODE_DTYPES = {code: np.dtype(name).newbyteorder("<") for name, code in DTYPE_CODES.items()}
+
+
+def encode_vector(vector, dtype: str = "float32") -> Binary:
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported vector dtype: {dtype}")
+    values = np.asarray(vector, dtype=np.dtype(dtype).newbyteorder("<")).ravel()
+    header = HEADER.pack(VECTOR_FORMAT_VERSION, DTYPE_CODES[dtype], values.size)
+    return Binary(header + values.tobytes())
+
+
+def decode_vector(value: Any) -> Optional[np.ndarray]:
+    # Packed vectors decode without copying the payload when they are
+    # already float32; documents written before the binary format still
+    # hold a BSON array of doubles and are converted the slow way.
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        version, dtype_code, dimension = HEADER.unpack_from(value)
+        if version != VECTOR_FORMAT_VERSION or dtype_code not in CODE_DTYPES:
+            raise ValueError("Unknown packed vector format")
+        vector = np.frombuffer(value, dtype=CODE_DTYPES[dtype_code], count=dimension, offset=HEADER.size)
+        return vector if vector.dtype == np.float32 else vector.astype("float32")
+    if len(value) == 0:
+        return None
+    return np.asarray(value, dtype="float32")
@@ -0,0 +1,145 @@
+import os
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from search_engine import search, squared_norms
+
+
+# Hierarchical search ranks videos by the mean of their chunk embeddings,
+# then searches only the chunks of the top DEFAULT_TOP_VIDEOS videos. When the
+# best chunk found that way is less confident than DEFAULT_MIN_CONFIDENCE the
+# caller scans the whole course instead.
+DEFAULT_TOP_VIDEOS = 8
+DEFAULT_MIN_CONFIDENCE = 0.5
+VIDEO_INDEX_FILE = "videos.npz"
+
+
+def distance_confidence(distance: float) -> float:
+    return float(1 / (1 + distance))
+
+
+class VideoIndex:
+    # Per-video embedding sums and counts plus the video code of every row.
+    # Sums are kept in float64 so rows can be appended without re-reading the
+    # vectors already indexed; centroids are derived from them on demand.
+    def __init__(
+        self,
+        titles: Sequence[str],
+        row_videos: np.ndarray,
+        sums: np.ndarray,
+        counts: np.ndarray,
+    ):
+        self.titles = list(titles)
+        self.row_videos = np.asarray(row_videos, dtype="int32")
+        self.sums = np.asarray(sums, dtype="float64")
+        self.counts = np.asarray(counts, dtype="int64")
+        self._refresh()
+
+    @classmethod
+    def from_blocks(
+        cls,
+        titles: Sequence[str],
+        row_videos: np.ndarray,
+        blocks: Iterable[Tuple[np.ndarray, np.ndarray]],
+        dimension: int,
+    ) -> "VideoIndex":
+        # blocks yields (row numbers, vectors), as EmbeddingStore's
+        # iter_vector_blocks does, so the sums never need the whole matrix.
+        row_videos = np.asarray(row_videos, dtype="int32")
+        sums = np.zeros((len(titles), dimension), dtype="float64")
+        for rows, vectors in blocks:
+            np.add.at(sums, row_videos[rows], vectors)
+        counts = np.bincount(row_videos, minlength=len(titles))
+        return cls(titles, row_videos, sums, counts)
+
+    @classmethod
+    def from_codes(cls, titles: Sequence[str], row_videos: np.ndarray, vectors: np.ndarray) -> "VideoIndex":
+        blocks = [(np.arange(vectors.shape[0]), vectors)]
+        return cls.from_blocks(titles, row_videos, blocks, vectors.shape[1])
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.counts))
+
+    def add(self, titles: Iterable[str], vectors: np.ndarray) -> None:
+        codes_by_title = {title: code for code, title in enumerate(self.titles)}
+        codes = []
+        for title in titles:
+            code = codes_by_title.get(title)
+            if code is None:
+                code = codes_by_title[title] = len(self.titles)
+                self.titles.append(title)
+            codes.append(code)
+        codes = np.asarray(codes, dtype="int32")
+
+        grow = len(self.titles) - self.counts.size
+        if grow:
+            self.sums = np.vstack([self.sums, np.zeros((grow, self.sums.shape[1]))])
+            self.counts = np.concatenate([self.counts, np.zeros(grow, dtype="int64")])
+        if codes.size:
+            np.add.at(self.sums, codes, np.asarray(vectors, dtype="float64"))
+            self.counts += np.bincount(codes, minlength=self.counts.size)
+        self.row_videos = np.concatenate([self.row_videos, codes])
+        self._refresh()
+
+    def centroids(self) -> Tuple[List[str], np.ndarray]:
+        # (titles, centroids) of every video with at least one row, sorted by
+        # title; this is what build_index.py writes to video_index.bin.
+        order = [code for code in sorted(range(len(self.titles)), key=self.titles.__getitem__) if self.counts[code]]
+        return [self.titles[code] for code in order], self._centroids[order]
+
+    def top_videos(self, query: Sequence[float], count: int) -> np.ndarray:
+        codes, _ = search(self._centroids[self._present], query, count, self._centroid_norms[self._present])
+        return self._present[codes]
+
+    def rows_for(self, codes: np.ndarray) -> np.ndarray:
+        return np.concatenate(
+            [self._row_order[self._row_bounds[code]:self._row_bounds[code + 1]] for code in codes]
+            or [np.zeros(0, dtype="int64")]
+        )
+
+    def candidate_rows(self, query: Sequence[float], count: int) -> Optional[np.ndarray]:
+        # None when the course has too few videos for the first stage to
+        # prune anything.
+        if len(self) <= count:
+            return None
+        return np.sort(self.rows_for(self.top_videos(query, count)))
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                titles=np.array(self.titles, dtype="str"),
+                row_videos=self.row_videos,
+                sums=self.sums,
+                counts=self.counts,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> Optional["VideoIndex"]:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data["titles"].tolist(), data["row_videos"], data["sums"], data["counts"])
+
+    def _refresh(self) -> None:
+        counts = np.maximum(self.counts, 1)[:, np.newaxis]
+        self._centroids = np.ascontiguousarray(self.sums / counts, dtype="float32")
+        self._centroid_norms = squared_norms(self._centroids)
+        self._present = np.flatnonzero(self.counts)
+        # Rows grouped by video: rows of video v are
+        # _row_order[_row_bounds[v]:_row_bounds[v + 1]].
+        self._row_order = np.argsort(self.row_videos, kind="stable")
+        self._row_bounds = np.searchsorted(self.row_videos[self._row_order], np.arange(self.counts.size + 1))
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.row_videos.nbytes
+            + self.sums.nbytes
+            + self.counts.nbytes
+            + self._centroids.nbytes
+            + self._centroid_norms.nbytes
+            + self._row_order.nbytes
+            + self._row_bounds.nbytes
+        )
@@ -15,7 +15,13 @@ import os
 import re
 import subprocess
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".avi", ".webm")
+AUDIO_FORMATS = {
+    "mp3": (".mp3", []),
+    "wav": (".wav", ["-vn", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le"]),
+    "opus": (".opus", ["-vn", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "32k"]),
+}
 
 
 def extract_number_title(filename):
@@ -29,7 +35,33 @@ def extract_number_title(filename):
     return number.strip(), title
 
 
-def convert_videos_to_audio(video_dir, audio_dir, overwrite=False):
+def audio_stem_for(filename):
+    number, title = extract_number_title(filename)
+    return f"{number}_{title}"
+
+
+def convert_video(input_path, output_path, overwrite=False, audio_format="mp3", threads=None):
+    extension, codec_args = AUDIO_FORMATS[audio_format]
+    command = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error"]
+    if overwrite:
+        command.append("-y")
+    command.extend(["-i", input_path])
+    if threads:
+        command.extend(["-threads", str(threads)])
+    command.extend(codec_args)
+    command.append(output_path)
+    subprocess.run(command, check=True)
+
+
+def convert_videos_to_audio(
+    video_dir,
+    audio_dir,
+    overwrite=False,
+    stems=None,
+    audio_format="mp3",
+    workers=1,
+    on_progress=None,
+):
     if shutil.which("ffmpeg") is None:
         raise RuntimeError(
             "ffmpeg is required to convert videos. Install it and ensure it is on your PATH."
@@ -39,20 +71,29 @@ def convert_videos_to_audio(video_dir, audio_dir, overwrite=False):
     files = [
         file for file in os.listdir(video_dir)
         if file.lower().endswith(VIDEO_EXTENSIONS)
+        and (stems is None or audio_stem_for(file) in stems)
     ]
     print(f"Found {len(files)} videos in {video_dir}")
+    if not files:
+        return
 
-    for file in files:
-        number, title = extract_number_title(file)
-        output_path = os.path.join(audio_dir, f"{number}_{title}.mp3")
-
-        command = ["ffmpeg"]
-        if overwrite:
-            command.append("-y")
-        command.extend(["-i", os.path.join(video_dir, file), output_path])
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(workers or cpu_count, cpu_count, len(files)))
+    threads = max(1, cpu_count // workers) if workers > 1 else None
+    extension = AUDIO_FORMATS[audio_format][0]
 
+    def convert(file):
+        output_path = os.path.join(audio_dir, f"{audio_stem_for(file)}{extension}")
         print(f"Converting {file} -> {output_path}")
-        subprocess.run(command, check=True)
+        convert_video(os.path.join(video_dir, file), output_path, overwrite, audio_format, threads)
+        return file
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert, file) for file in files]
+        for done, future in enumerate(as_completed(futures), start=1):
+            file = future.result()
+            if on_progress is not None:
+                on_progress(file, done, len(files))
 
 
 if __name__ == "__main__":
@@ -60,6 +101,19 @@ if __name__ == "__main__":
     parser.add_argument("--video-dir", default="Videos", help="Directory with video files.")
     parser.add_argument("--audio-dir", default="audio", help="Output directory for MP3 files.")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite existing audio files.")
+    parser.add_argument(
+        "--format",
+        choices=sorted(AUDIO_FORMATS),
+        default="mp3",
+        help="mp3 keeps the source rate; wav and opus are 16 kHz mono, ready for Whisper.",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Parallel ffmpeg processes (0 = one per core).")
     args = parser.parse_args()
 
-    convert_videos_to_audio(args.video_dir, args.audio_dir, args.overwrite)
+    convert_videos_to_audio(
+        args.video_dir,
+        args.audio_dir,
+        args.overwrite,
+        audio_format=args.format,
+        workers=args.workers,
+    )
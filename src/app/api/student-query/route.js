@@ -1,7 +1,10 @@
 import path from "path";
 import { spawn, spawnSync } from "child_process";
+import { randomUUID } from "crypto";
 import { NextResponse } from "next/server";
 
+const DEFAULT_WORKER_CONCURRENCY = 4;
+
 const sanitizeDbName = (value) => {
   const cleaned = value
     .toLowerCase()
@@ -28,13 +31,132 @@ const resolvePythonBin = () => {
   return null;
 };
 
+// One long-lived answer_question.py --serve process per server instance.
+// Requests are multiplexed over its stdin/stdout by id.
+let answerWorker = null;
+
+const getAnswerWorker = (pythonBin, mongoUri, mongoDb) => {
+  if (answerWorker && !answerWorker.exited) {
+    return answerWorker;
+  }
+
+  const scriptPath = path.join(process.cwd(), "backend", "answer_question.py");
+  const concurrency = process.env.ANSWER_WORKER_CONCURRENCY || String(DEFAULT_WORKER_CONCURRENCY);
+  // ANSWER_TOP_VIDEOS > 0 enables two-stage search over the closest videos.
+  const topVideos = process.env.ANSWER_TOP_VIDEOS || "0";
+  // ANSWER_RETRIEVAL picks vector, hybrid (vector + BM25) or keyword search.
+  const retrieval = process.env.ANSWER_RETRIEVAL || "hybrid";
+  // ANSWER_TRACE_FILE appends per-question stage spans as JSON lines and
+  // ANSWER_METRICS_PORT serves Prometheus metrics from the worker.
+  const tracing = [];
+  if (process.env.ANSWER_TRACE_FILE) {
+    tracing.push("--trace-file", process.env.ANSWER_TRACE_FILE);
+  }
+  if (process.env.ANSWER_METRICS_PORT) {
+    tracing.push("--metrics-port", process.env.ANSWER_METRICS_PORT);
+  }
+  const child = spawn(
+    pythonBin,
+    [
+      scriptPath,
+      "--serve",
+      "--mongo-uri",
+      mongoUri,
+      "--mongo-db",
+      mongoDb,
+      "--workers",
+      concurrency,
+      "--top-videos",
+      topVideos,
+      "--retrieval",
+      retrieval,
+      ...tracing,
+    ],
+    {
+      cwd: process.cwd(),
+      env: process.env,
+    }
+  );
+
+  const worker = { child, handlers: new Map(), exited: false };
+  let buffer = "";
+
+  child.stdout.on("data", (chunk) => {
+    buffer += chunk.toString();
+    const lines = buffer.split(/\r?\n/);
+    buffer = lines.pop() || "";
+
+    for (const line of lines) {
+      const trimmed = line.trim();
+      if (!trimmed) continue;
+
+      let event;
+      try {
+        event = JSON.parse(trimmed);
+      } catch {
+        continue;
+      }
+
+      const handler = worker.handlers.get(event.id);
+      if (handler) {
+        handler(event);
+      }
+    }
+  });
+
+  child.stderr.on("data", (chunk) => {
+    console.error(`[answer_question] ${chunk.toString().trim()}`);
+  });
+
+  const fail = (message) => {
+    worker.exited = true;
+    for (const handler of worker.handlers.values()) {
+      handler({ type: "done", ok: false, error: message });
+    }
+    worker.handlers.clear();
+    if (answerWorker === worker) {
+      answerWorker = null;
+    }
+  };
+
+  child.on("close", () => fail("Answer worker exited unexpectedly."));
+  child.on("error", (error) => fail(error.message));
+
+  answerWorker = worker;
+  return worker;
+};
+
+const sendQuestion = (worker, payload, onEvent) => {
+  const id = randomUUID();
+  worker.handlers.set(id, (event) => {
+    if (event.type === "done") {
+      worker.handlers.delete(id);
+    }
+    const { id: _id, ...rest } = event;
+    onEvent(rest);
+  });
+  worker.child.stdin.write(`${JSON.stringify({ id, ...payload })}\n`);
+  // Detaching a request that is still running also cancels it in the
+  // worker, which closes its OpenRouter stream.
+  return () => {
+    if (!worker.handlers.delete(id) || worker.exited) {
+      return;
+    }
+    worker.child.stdin.write(`${JSON.stringify({ id, op: "cancel" })}\n`);
+  };
+};
+
 export async function POST(request) {
   const body = await request.json().catch(() => null);
   const question = body?.question?.trim();
   const course = body?.course?.trim();
+  // `courses` searches several courses in one query; "*" means all of them.
+  const courses = Array.isArray(body?.courses)
+    ? body.courses.map((item) => String(item || "").trim()).filter(Boolean)
+    : [];
   const stream = Boolean(body?.stream);
 
-  if (!question || !course) {
+  if (!question || (!course && !courses.length)) {
     return NextResponse.json({ error: "Question and course are required." }, { status: 400 });
   }
 
@@ -48,81 +170,62 @@ export async function POST(request) {
     return NextResponse.json({ error: "Python runtime unavailable." }, { status: 500 });
   }
 
-  const scriptPath = path.join(process.cwd(), "backend", "answer_question.py");
   const mongoDb = sanitizeDbName(process.env.MONGODB_DB || "rag_basic");
-  const scriptArgs = [scriptPath, "--mongo-uri", mongoUri, "--mongo-db", mongoDb, "--course", course, "--question", question];
+  const worker = getAnswerWorker(pythonBin, mongoUri, mongoDb);
 
   if (!stream) {
-    const result = spawnSync(pythonBin, scriptArgs, {
-      cwd: process.cwd(),
-      encoding: "utf-8",
-      env: process.env,
+    const outcome = await new Promise((resolve) => {
+      let payload = null;
+      sendQuestion(worker, { course, courses, question, stream: false }, (event) => {
+        if (event.type !== "done") {
+          payload = event;
+          return;
+        }
+        resolve({ payload, event });
+      });
     });
 
-    if (result.status !== 0) {
-      return NextResponse.json(
-        {
-          error: result.stderr?.trim() || "Failed to process question.",
-        },
-        { status: 500 }
-      );
+    if (!outcome.event.ok) {
+      return NextResponse.json({ error: outcome.event.error || "Failed to process question." }, { status: 500 });
     }
 
-    try {
-      const payload = JSON.parse(result.stdout || "{}");
-      if (payload.error) {
-        return NextResponse.json({ error: payload.error }, { status: 404 });
-      }
-
-      return NextResponse.json(payload);
-    } catch {
+    if (!outcome.payload) {
       return NextResponse.json({ error: "Invalid response while answering question." }, { status: 500 });
     }
-  }
 
-  scriptArgs.push("--stream");
+    if (outcome.payload.error) {
+      return NextResponse.json({ error: outcome.payload.error }, { status: 404 });
+    }
 
-  const child = spawn(pythonBin, scriptArgs, {
-    cwd: process.cwd(),
-    env: process.env,
-  });
+    return NextResponse.json(outcome.payload);
+  }
 
   const encoder = new TextEncoder();
+  let detach = null;
 
   const readable = new ReadableStream({
     start(controller) {
-      let buffer = "";
-
-      child.stdout.on("data", (chunk) => {
-        buffer += chunk.toString();
-        const lines = buffer.split(/\r?\n/);
-        buffer = lines.pop() || "";
-
-        for (const line of lines) {
-          const trimmed = line.trim();
-          if (!trimmed) continue;
-          controller.enqueue(encoder.encode(`${trimmed}\n`));
+      let sawError = false;
+
+      detach = sendQuestion(worker, { course, courses, question, stream: true }, (event) => {
+        if (event.type === "done") {
+          if (!event.ok && !sawError) {
+            controller.enqueue(encoder.encode(`${JSON.stringify({ type: "error", error: event.error })}\n`));
+          }
+          controller.close();
+          return;
         }
-      });
-
-      child.stderr.on("data", (chunk) => {
-        controller.enqueue(encoder.encode(`${JSON.stringify({ type: "error", error: chunk.toString().trim() })}\n`));
-      });
 
-      child.on("close", () => {
-        if (buffer.trim()) {
-          controller.enqueue(encoder.encode(`${buffer.trim()}\n`));
+        if (event.type === "error") {
+          sawError = true;
         }
-        controller.close();
-      });
-
-      child.on("error", (error) => {
-        controller.enqueue(encoder.encode(`${JSON.stringify({ type: "error", error: error.message })}\n`));
-        controller.close();
+        controller.enqueue(encoder.encode(`${JSON.stringify(event)}\n`));
       });
     },
     cancel() {
-      child.kill();
+      if (detach) {
+        detach();
+      }
     },
   });
 
@@ -133,4 +236,4 @@ export async function POST(request) {
       Connection: "keep-alive",
     },
   });
-}
\ No newline at end of file
+}
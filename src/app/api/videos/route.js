@@ -4,7 +4,7 @@ import path from "path";
 import { spawn, spawnSync } from "child_process";
 import { randomUUID } from "crypto";
 
-const DEFAULT_MERGE_SIZE = 5;
+const DEFAULT_INGEST_WORKERS = 1;
 const sanitizeDbName = (value) => {
   const cleaned = value
     .toLowerCase()
@@ -40,6 +40,91 @@ const resolvePythonBin = () => {
   return null;
 };
 
+// One long-lived ingest_service.py process per server instance. It owns a
+// durable job queue and a fixed pool of pipeline workers; uploads are queued
+// through its stdin and job status is read back the same way.
+let ingestService = null;
+
+const getIngestService = (pythonBin) => {
+  if (ingestService && !ingestService.exited) {
+    return ingestService;
+  }
+
+  const scriptPath = path.join(process.cwd(), "backend", "ingest_service.py");
+  const workers = process.env.INGEST_WORKERS || String(DEFAULT_INGEST_WORKERS);
+  const args = [scriptPath, "--workers", workers];
+  // INGEST_TRACE_FILE appends each job's stage spans as JSON lines.
+  if (process.env.INGEST_TRACE_FILE) {
+    args.push("--trace-file", process.env.INGEST_TRACE_FILE);
+  }
+  const child = spawn(pythonBin, args, {
+    cwd: process.cwd(),
+    env: process.env,
+  });
+
+  const service = { child, handlers: new Map(), exited: false };
+  let buffer = "";
+
+  child.stdout.on("data", (chunk) => {
+    buffer += chunk.toString();
+    const lines = buffer.split(/\r?\n/);
+    buffer = lines.pop() || "";
+
+    for (const line of lines) {
+      const trimmed = line.trim();
+      if (!trimmed) continue;
+
+      let event;
+      try {
+        event = JSON.parse(trimmed);
+      } catch {
+        continue;
+      }
+
+      const handler = service.handlers.get(event.id);
+      if (handler) {
+        handler(event);
+      }
+    }
+  });
+
+  child.stderr.on("data", (chunk) => {
+    console.error(`[ingest_service] ${chunk.toString().trim()}`);
+  });
+
+  const fail = (message) => {
+    service.exited = true;
+    for (const handler of service.handlers.values()) {
+      handler({ type: "done", ok: false, error: message });
+    }
+    service.handlers.clear();
+    if (ingestService === service) {
+      ingestService = null;
+    }
+  };
+
+  child.on("close", () => fail("Ingest service exited unexpectedly."));
+  child.on("error", (error) => fail(error.message));
+
+  ingestService = service;
+  return service;
+};
+
+const sendRequest = (service, payload) =>
+  new Promise((resolve) => {
+    const id = randomUUID();
+    let result = null;
+    service.handlers.set(id, (event) => {
+      if (event.type !== "done") {
+        result = event;
+        return;
+      }
+      service.handlers.delete(id);
+      resolve({ result, ok: event.ok, error: event.error });
+    });
+    service.child.stdin.write(`${JSON.stringify({ id, ...payload })}\n`);
+  });
+
 const sanitizeTitle = (title) =>
   title
     .replace(/[^\w\s-]/g, "")
@@ -54,7 +139,7 @@ const createRunPaths = (uploadId) => {
     audioDir: path.join(baseDir, "audio"),
     jsonDir: path.join(baseDir, "jsons"),
     improvedJsonDir: path.join(baseDir, "new_jsons"),
-    embeddingsPath: path.join(baseDir, "embeddings.joblib"),
+    embeddingsPath: path.join(baseDir, "embeddings"),
     faissPath: path.join(baseDir, "faiss_index.bin"),
   };
 };
@@ -111,7 +196,6 @@ export async function POST(request) {
       );
     }
 
-    const processScript = path.join(process.cwd(), "backend", "process_videos.py");
     const resolvedDbName = sanitizeDbName(process.env.MONGODB_DB || "rag_basic");
     const normalizedCourse = sanitizeCollectionName(course || "General", "general");
     const embeddingsCollection = `course_embeddings_${normalizedCourse}`;
@@ -119,7 +203,6 @@ export async function POST(request) {
 
 
     const args = [
-      processScript,
       "--video-dir",
       videoDir,
       "--audio-dir",
@@ -128,8 +211,6 @@ export async function POST(request) {
       jsonDir,
       "--improved-json-dir",
       improvedJsonDir,
-      "--merge-size",
-      String(DEFAULT_MERGE_SIZE),
       "--embeddings-output",
       embeddingsPath,
       "--faiss-output",
@@ -153,16 +234,26 @@ export async function POST(request) {
       course || "",
     ];
 
-    const child = spawn(pythonBin, args, {
-      cwd: process.cwd(),
-      stdio: "ignore",
-      detached: true,
+    const service = getIngestService(pythonBin);
+    const outcome = await sendRequest(service, {
+      op: "submit",
+      argv: args,
+      label: `Video ${number} [${safeTitle}]`,
     });
-    child.unref();
+    if (!outcome.ok || !outcome.result?.job) {
+      return NextResponse.json(
+        { error: outcome.error || "Unable to queue the video for processing." },
+        { status: 500 }
+      );
+    }
 
+    const { job } = outcome.result;
     return NextResponse.json({
       message:
-        "Video uploaded successfully. Processing has started in the background and embeddings will be available shortly.",
+        job.position > 0
+          ? `Video uploaded successfully. It is queued behind ${job.position} other upload(s) and embeddings will be available once it is processed.`
+          : "Video uploaded successfully. Processing has started in the background and embeddings will be available shortly.",
+      jobId: job.id,
     });
   } catch (error) {
     return NextResponse.json(
@@ -171,3 +262,26 @@ export async function POST(request) {
     );
   }
 }
+
+// GET /api/videos?job=<id> reports a queued upload: its status (queued,
+// running, done or failed), queue position and the latest pipeline progress
+// payload.
+export async function GET(request) {
+  const jobId = new URL(request.url).searchParams.get("job")?.trim();
+  if (!jobId) {
+    return NextResponse.json({ error: "Job id is required." }, { status: 400 });
+  }
+
+  const pythonBin = resolvePythonBin();
+  if (!pythonBin) {
+    return NextResponse.json({ error: "Python runtime unavailable." }, { status: 500 });
+  }
+
+  const outcome = await sendRequest(getIngestService(pythonBin), { op: "status", job: jobId });
+  if (!outcome.ok || !outcome.result?.job) {
+    return NextResponse.json({ error: outcome.error || "Unknown job." }, { status: 404 });
+  }
+
+  const { argv: _argv, ...job } = outcome.result.job;
+  return NextResponse.json(job);
+}
@@ -166,6 +166,7 @@ export default function StudentPortal() {
                       {courseItem.name}
                     </option>
                   ))}
+                  {courses.length > 1 && <option value="*">All courses</option>}
                 </select>
               </div>
               <div>
@@ -218,7 +219,7 @@ export default function StudentPortal() {
           <div className="bg-gray-800/60 rounded-2xl p-8 border border-gray-700 shadow-2xl">
             <div className="flex items-center justify-between mb-6">
               <div>
-                <p className="text-sm text-gray-400">Course: {course}</p>
+                <p className="text-sm text-gray-400">Course: {course === "*" ? "All courses" : course}</p>
                 <h2 className="text-2xl font-semibold text-gray-200">Answer</h2>
               </div>
               <span className="px-3 py-1 rounded-lg bg-green-500/20 text-green-300 text-xs font-medium border border-green-500/30">
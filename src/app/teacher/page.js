@@ -9,6 +9,8 @@ const initialFormState = {
   course: "",
 };
 
+const JOB_POLL_INTERVAL_MS = 3000;
+
 export default function TeacherPortal() {
   const router = useRouter();
   const [formState, setFormState] = useState(initialFormState);
@@ -21,6 +23,35 @@ export default function TeacherPortal() {
     setFormState((prev) => ({ ...prev, [name]: value }));
   };
 
+  // Follows a queued upload until the ingest service finishes it.
+  const pollJob = async (jobId) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      let job;
+      try {
+        const response = await fetch(`/api/videos?job=${encodeURIComponent(jobId)}`);
+        if (!response.ok) return;
+        job = await response.json();
+      } catch {
+        return;
+      }
+
+      if (job.status === "done") {
+        setStatus({ type: "success", message: "Video processed. Its embeddings are ready to search." });
+        return;
+      }
+      if (job.status === "failed") {
+        setStatus({ type: "error", message: `Processing failed: ${job.error || "unknown error"}` });
+        return;
+      }
+      const message =
+        job.status === "queued"
+          ? `Waiting in the processing queue (${job.position} ahead).`
+          : `Processing: ${job.progress?.step || "starting"} (${Math.round((job.progress?.progress || 0) * 100)}%)`;
+      setStatus({ type: "success", message });
+    }
+  };
+
   const handleSubmit = async (event) => {
     event.preventDefault();
 
@@ -63,6 +94,9 @@ export default function TeacherPortal() {
           result.message ||
           "Video uploaded successfully. Embeddings are being prepared in the background.",
       });
+      if (result.jobId) {
+        pollJob(result.jobId);
+      }
 
       setFormState(initialFormState);
       setVideoFile(null);